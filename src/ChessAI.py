@@ -2,16 +2,24 @@
 Handling the AI moves for Duck Chess.
 """
 
-import math
 import os
 import random
-import sys
 
 import chess
 import chess.engine
-
+import numpy as np
+
+import chessAi_handcraft
+import ChessBroker
+import ChessControl
+import ChessEngine
+import ChessEngineCache
+import ChessFairy
+import ChessNNUE
+import ChessStats
 from ChessEngine import \
     Move  # Added: import Move class to attach get_uci method
+from ChessEval import CHECKMATE, EvalCache, duck_scores, scoreBoard
 
 
 # Added: Support Move.get_uci() for matching UCI strings
@@ -27,135 +35,119 @@ def get_uci(self):
 
 Move.get_uci = get_uci
 
-# Piece values and position scores remain the same as before
-piece_score = {
-    "K": 0,
-    "Q": 9,
-    "R": 5,
-    "B": 3,
-    "N": 3,
-    "p": 1,
-    "D": 0,
-}  # Duck has 0 value
-
-FAIRY_STOCKFISH_PATH = (
-    os.path.join(".", "fairy-stockfish.exe")
-    if sys.platform == "win32"
-    else (
-        os.path.join(".", "fairy-stockfish_x86-64")
-        if sys.platform.startswith("linux")
-        else None
-    )
-)
-
-knight_scores = [
-    [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-    [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
-    [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
-    [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
-    [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
-    [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
-    [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
-    [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-]
-
-bishop_scores = [
-    [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-    [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-    [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
-    [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
-    [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
-    [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
-    [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
-    [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-]
-
-rook_scores = [
-    [0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
-    [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25],
-]
-
-queen_scores = [
-    [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-    [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-    [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-    [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-    [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-    [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-    [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
-    [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-]
-
-pawn_scores = [
-    [0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
-    [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
-    [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
-    [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
-    [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
-    [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
-    [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
-    [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2],
-]
-
-piece_position_scores = {
-    "wN": knight_scores,
-    "bN": knight_scores[::-1],
-    "wB": bishop_scores,
-    "bB": bishop_scores[::-1],
-    "wQ": queen_scores,
-    "bQ": queen_scores[::-1],
-    "wR": rook_scores,
-    "bR": rook_scores[::-1],
-    "wp": pawn_scores,
-    "bp": pawn_scores[::-1],
-}
-
-# Add duck position scores (ducks are best in the center)
-duck_scores = [
-    [0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
-    [0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.3, 0.3, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.3, 0.3, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1],
-    [0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
-]
-
-piece_position_scores["DD"] = duck_scores
-
-CHECKMATE = 1000
-STALEMATE = 0
 DEPTH = 100
+# ai_nnue searches with ChessNNUE instead of asking fairy-stockfish once the
+# network file is there; tests/test_nnue.py checks its scores against the
+# engine's own eval of that file
+NNUE_IN_PROCESS = True
+NNUE_SEARCH_DEPTH = 1  # full turns searched when the network runs in process
+NNUE_EVAL_LIMIT = chess.engine.Limit(time=0.5, nodes=1000)
+
 
+# UCI options of the engines ai_nnue starts, set by nnueEngineOptions()
+nnue_engine_options = None
 
-def findBestMove(game_state, valid_moves, return_queue, mode):
+
+def nnueEngineOptions():
+    """
+    UCI options loading the duck network into fairy-stockfish, looked up
+    when the first engine is wanted. Without the file there is nothing to
+    load: the engine keeps its classical eval and a warning says so once.
+    """
+    global nnue_engine_options
+    if nnue_engine_options is None:
+        if os.path.exists(ChessNNUE.NNUE_PATH):
+            nnue_engine_options = {"EvalFile": ChessNNUE.NNUE_PATH}
+        else:
+            print(
+                f"[WARN] 找不到NNUE模型 {ChessNNUE.NNUE_PATH}，"
+                "fairy-stockfish 改用內建評估"
+            )
+            nnue_engine_options = {}
+    return nnue_engine_options
+
+
+# Engine scores by position key, so a transposed leaf skips the engine
+nnue_eval_cache = EvalCache()
+
+# (position key after the engine's piece move, duck square it paired with it)
+engine_duck_move = None
+
+
+def findBestMove(game_state, valid_moves, return_queue, mode, control=None):
     """
     Find the best move considering duck chess rules.
     Handles both piece movement phase and duck movement phase.
+    Returns the ChessStats.SearchStats of the move (None unless enabled).
+    control, a ChessControl.SearchControl, can stop the search early; the
+    best move found by then is put on return_queue.
     """
     global next_move
     next_move = None
+    stats = ChessStats.begin(
+        chessAi_handcraft.transposition_table,
+        nnue_eval_cache)
+    depth = 0
+
+    # The budget starts before the presearch, whose proof nodes it counts
+    ChessControl.begin(control)
+    try:
+        move, source = chessAi_handcraft.presearchMove(game_state, valid_moves)
+        if move is not None:
+            return_queue.put(move)
+            return ChessStats.end(stats, source)
 
-    # Separate duck moves from piece moves
-    duck_moves = [move for move in valid_moves if move.is_duck_move]
-    piece_moves = [move for move in valid_moves if not move.is_duck_move]
+        # Separate duck moves from piece moves
+        duck_moves = [move for move in valid_moves if move.is_duck_move]
+        piece_moves = [move for move in valid_moves if not move.is_duck_move]
 
+        depth = _searchMove(game_state, duck_moves, piece_moves, mode)
+    finally:
+        ChessControl.end(control)
+
+    return_queue.put(next_move)
+    return ChessStats.end(stats, depth=depth)
+
+
+def _searchMove(game_state, duck_moves, piece_moves, mode):
+    """Set next_move for findBestMove; returns the depth searched"""
+    global next_move
+    depth = 0
     if game_state.duck_move_phase:
         # Duck movement phase - find best duck move
         if duck_moves:
-            findBestDuckMove(game_state, duck_moves)
+            if mode == "nnue":
+                # The duck square the engine chose with its piece move
+                next_move = engineDuckMove(game_state, duck_moves)
+            if next_move is None:
+                findBestDuckMove(game_state, duck_moves)
     else:
         # Piece movement phase - find best piece move
         if piece_moves:
-            if mode == "nnue":
+            if (
+                mode == "nnue"
+                and NNUE_IN_PROCESS
+                and ChessNNUE.loadNetwork() is not None
+            ):
+                # Our own search, with the network scoring every leaf
+                ChessNNUE.attach(game_state, ChessNNUE.loadNetwork())
+                try:
+                    chessAi_handcraft.next_move = None
+                    chessAi_handcraft.negamax_full(
+                        game_state,
+                        piece_moves,
+                        NNUE_SEARCH_DEPTH,
+                        -CHECKMATE,
+                        CHECKMATE,
+                        1 if game_state.white_to_move else -1,
+                    )
+                    next_move = chessAi_handcraft.next_move
+                    depth = NNUE_SEARCH_DEPTH
+                finally:
+                    ChessNNUE.detach(game_state)
+            elif mode == "nnue":
                 random.shuffle(piece_moves)
+                depth = DEPTH
                 nnueFindMoveNegaMaxAlphaBeta(
                     game_state,
                     piece_moves,
@@ -166,6 +158,7 @@ def findBestMove(game_state, valid_moves, return_queue, mode):
                 )
             elif mode == "handcraft":
                 random.shuffle(piece_moves)
+                depth = DEPTH
                 next_move = handcraftFindMoveNegaMaxAlphaBeta(
                     game_state,
                     piece_moves,
@@ -176,8 +169,7 @@ def findBestMove(game_state, valid_moves, return_queue, mode):
                 )
             else:
                 raise NameError("no such ai here")
-
-    return_queue.put(next_move)
+    return depth
 
 
 def findBestDuckMove(game_state, valid_duck_moves):
@@ -185,83 +177,89 @@ def findBestDuckMove(game_state, valid_duck_moves):
     Find the best duck move based on strategic positioning.
     """
     global next_move
-    best_score = -math.inf
-    best_move = None
+    scores = duckSquareScores(game_state)
+    squares = [move.end_row * 8 + move.end_col for move in valid_duck_moves]
+    if squares:
+        # argmax keeps the first of equal scores, like a strict > scan
+        best_move = valid_duck_moves[int(np.argmax(scores[squares]))]
+    else:
+        best_move = None
 
-    for move in valid_duck_moves:
-        # Score based on position (center is better)
-        row, col = move.end_row, move.end_col
-        position_score = duck_scores[row][col]
-
-        # Additional strategic considerations:
-        # 1. Block enemy pieces
-        # 2. Don't block our own pieces
-        # 3. Stay away from enemy king (to avoid blocking checks)
-
-        # Calculate blocking score
-        blocking_score = 0
-        enemy_color = "b" if game_state.white_to_move else "w"
-
-        # Check if duck is blocking enemy pieces
-        directions = [
-            (-1, 0),
-            (1, 0),
-            (0, -1),
-            (0, 1),
-            (-1, -1),
-            (-1, 1),
-            (1, -1),
-            (1, 1),
-        ]
-        for dr, dc in directions:
-            for i in range(1, 8):
-                r, c = row + dr * i, col + dc * i
-                if 0 <= r < 8 and 0 <= c < 8:
-                    piece = game_state.board[r][c]
-                    if piece == "--":
-                        continue
-                    if piece[0] == enemy_color:
-                        # Modified: weight blocking queen/rook higher
-                        if piece[1] == "Q":
-                            blocking_score += 3  # high bonus for blocking enemy queen
-                        elif piece[1] == "R":
-                            blocking_score += 2  # bonus for blocking enemy rook
-                        elif piece[1] == "B":
-                            blocking_score += 1  # bonus for blocking enemy bishop
-                    break
+    next_move = best_move if best_move else random.choice(valid_duck_moves)
 
-        # Penalize if blocking our own pieces
-        own_piece_penalty = 0
-        for dr, dc in directions:
-            for i in range(1, 8):
-                r, c = row + dr * i, col + dc * i
-                if 0 <= r < 8 and 0 <= c < 8:
-                    piece = game_state.board[r][c]
-                    if piece == "--":
-                        continue
-                    if piece[0] == ("w" if game_state.white_to_move else "b"):
-                        own_piece_penalty += 1  # penalty for blocking our own pieces
-                    break
 
-        total_score = position_score * 10 + blocking_score - own_piece_penalty
+def duckSquareScores(game_state):
+    """
+    Score every square as a duck destination in one pass:
+    position (center is better) * 10, plus a bonus for each enemy queen,
+    rook or bishop that is the first piece seen along one of the 8 lines
+    from the square, minus 1 for each of our own pieces seen first.
+    """
+    codes = np.array(
+        [DUCK_PIECE_CODES[piece] for row in game_state.board for piece in row]
+        + [0]  # padding square that ray tables use past the board edge
+    )
+    ray_codes = codes[DUCK_RAYS]  # (64 squares * 8 directions, 7 steps)
+    first_step = (ray_codes != 0).argmax(axis=1)
+    # An empty ray has first_step 0 and code 0, which scores nothing
+    first_codes = ray_codes[DUCK_RAY_INDEX, first_step].reshape(64, 8)
+
+    side = "w" if game_state.white_to_move else "b"
+    blocking_score = DUCK_BLOCKING_SCORES[side][first_codes].sum(axis=1)
+    own_piece_penalty = DUCK_OWN_PENALTIES[side][first_codes].sum(axis=1)
+    return DUCK_POSITION_SCORES * 10 + blocking_score - own_piece_penalty
+
+
+def _buildDuckTables():
+    """Ray and per-piece lookup tables for duckSquareScores"""
+    pieces = ["--", "DD"] + [c + k for c in "wb" for k in "pRNBQK"]
+    codes = {piece: code for code, piece in enumerate(pieces)}
+
+    # Each ray padded to 7 steps with square 64, which is always empty
+    rays = np.full((64 * 8, 7), 64, dtype=np.intp)
+    for square, square_rays in enumerate(ChessEngine.RAYS):
+        for direction, ray in enumerate(square_rays):
+            for step, (r, c) in enumerate(ray):
+                rays[square * 8 + direction, step] = r * 8 + c
+
+    # Modified: weight blocking queen/rook higher
+    block_bonus = {"Q": 3, "R": 2, "B": 1}
+    blocking, penalties = {}, {}
+    for side, enemy in (("w", "b"), ("b", "w")):
+        blocking[side] = np.array(
+            [block_bonus.get(p[1], 0) if p[0] == enemy else 0 for p in pieces]
+        )
+        penalties[side] = np.array([1 if p[0] == side else 0 for p in pieces])
+    return codes, rays, blocking, penalties
 
-        if total_score > best_score:
-            best_score = total_score
-            best_move = move
 
-    next_move = best_move if best_move else random.choice(valid_duck_moves)
+DUCK_PIECE_CODES, DUCK_RAYS, DUCK_BLOCKING_SCORES, DUCK_OWN_PENALTIES = (
+    _buildDuckTables()
+)
+DUCK_RAY_INDEX = np.arange(64 * 8)
+DUCK_POSITION_SCORES = np.array(duck_scores, dtype=float).ravel()
 
 
 def handcraftFindMoveNegaMaxAlphaBeta(
     game_state, valid_moves, depth, alpha, beta, turn_multiplier
 ):
+    stats = ChessStats.current
+    if stats is not None:
+        stats.piece_nodes += 1
+    control = ChessControl.current
+    if control is not None and control.check() and depth != DEPTH:
+        return 0  # thrown away: the caller stops on control.stopped
     if depth == 0:
         score = scoreBoard(game_state)
         return turn_multiplier * score
 
     best_move = None
     best_score = -CHECKMATE
-    for move in valid_moves:
+    # Search captures that win material on the exchange first
+    ordered_moves = sorted(
+        valid_moves, key=lambda m: -game_state.see(m) if m.is_capture else 0
+    )
+    for move in ordered_moves:
         game_state.makeMove(move)
         next_moves = game_state.getValidMoves()
         # Skip duck moves when evaluating board state
@@ -270,6 +268,8 @@ def handcraftFindMoveNegaMaxAlphaBeta(
             game_state, piece_moves, depth - 1, -beta, -alpha, -turn_multiplier
         )
         game_state.undoMove()
+        if control is not None and control.stopped:
+            break  # keep the best move of the root moves already finished
 
         if score > best_score:
             best_score = score
@@ -278,6 +278,9 @@ def handcraftFindMoveNegaMaxAlphaBeta(
         if best_score > alpha:
             alpha = best_score
         if alpha >= beta:
+            if stats is not None:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += move is ordered_moves[0]
             break
     if depth == DEPTH:
         enemy_king = "bK" if game_state.white_to_move else "wK"
@@ -292,8 +295,11 @@ def handcraftFindMoveNegaMaxAlphaBeta(
 def nnueFindMoveNegaMaxAlphaBeta(
     game_state, valid_moves, depth, alpha, beta, turn_multiplier, mode="nnue"
 ):
-    global next_move
+    global next_move, engine_duck_move
     top_level = depth == DEPTH
+    stats = ChessStats.current
+    if stats is not None:
+        stats.piece_nodes += 1
 
     enemy_king = "bK" if game_state.white_to_move else "wK"
     for move in valid_moves:
@@ -308,24 +314,18 @@ def nnueFindMoveNegaMaxAlphaBeta(
                 next_move = random.choice(castle_moves)
                 return 500
 
-            fen = convert_to_fen(game_state)
-            with chess.engine.SimpleEngine.popen_uci(FAIRY_STOCKFISH_PATH) as engine:
-                engine.configure(
-                    {
-                        "EvalFile": os.path.join(
-                            "NNUE model", "NNUE model/duck-ba21f91f5d81.nnue"
-                        )
-                    }
-                )
-                board = chess.Board(fen)
-                result = engine.play(board, chess.engine.Limit(time=1.0))
-                best_uci = result.move.uci()
+            best_uci, duck_square = engineBestMove(game_state, engineLimit())
             for move in valid_moves:
-                if move.get_uci() == best_uci:
+                if move.get_uci() == (best_uci or "")[:4]:
                     next_move = move
                     break
             if next_move is None and valid_moves:
                 next_move = valid_moves[0]
+            elif duck_square is not None:
+                # Keep the engine's duck for the duck phase of this turn
+                game_state.makeMove(next_move)
+                engine_duck_move = game_state.positionKey(), duck_square
+                game_state.undoMove()
             return 0
         except Exception as e:
             print(f"[DEBUG] Stockfish错误: {e}")
@@ -357,6 +357,9 @@ def nnueFindMoveNegaMaxAlphaBeta(
         if best_score > alpha:
             alpha = best_score
         if alpha >= beta:
+            if stats is not None:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += move is valid_moves[0]
             break
 
     if top_level and best_move_local is not None:
@@ -364,44 +367,104 @@ def nnueFindMoveNegaMaxAlphaBeta(
     return best_score
 
 
-def scoreBoard(game_state):
+def engineLimit(time_limit=1.0):
+    """Engine limit for one move, kept inside the current search's budget"""
+    control = ChessControl.current
+    if control is None:
+        return chess.engine.Limit(time=time_limit)
+    remaining = control.remaining()
+    if remaining is not None:
+        time_limit = min(time_limit, remaining)
+    return chess.engine.Limit(time=time_limit, nodes=control.node_limit)
+
+
+def engineBestMove(game_state, limit):
     """
-    Score the board. A positive score is good for white, a negative score is good for black.
-    Now considers duck position in evaluation.
+    The engine's (piece move UCI, duck square or None) for game_state, from
+    the disk cache when the same search has already been run on the
+    position. An engine with the duck variant is sent the game's moves and
+    picks the duck square too; otherwise the duck-less FEN is analysed,
+    by the evaluation broker when this process has one.
     """
-    # 检查游戏是否结束（例如王被吃掉）
-    if game_state.game_over:
-        if game_state.winner == "w":
-            return CHECKMATE
-        elif game_state.winner == "b":
-            return -CHECKMATE
-        else:
-            return STALEMATE  # 平局
-
-    score = 0
-    for row in range(len(game_state.board)):
-        for col in range(len(game_state.board[row])):
-            piece = game_state.board[row][col]
-            if piece != "--":
-                piece_position_score = 0
-                if piece[1] == "D":  # Duck
-                    piece_position_score = (
-                        duck_scores[row][col] * 0.5
-                    )  # Duck position is less important
-                elif piece[1] != "K":  # Other pieces (except king)
-                    piece_position_score = piece_position_scores[piece][row][col]
+    session, game = duckEngine(game_state)
+    duck_fen = convert_to_fen(game_state, duck=True)
+    network = engineNetwork(session)
+    stored = ChessEngineCache.getCache().get(duck_fen, limit, network)
+    if stored is not None and stored[1] is not None:
+        return splitDuckMove(stored[1])
+    if session is not None:
+        best_uci, score = session.play(*game, limit, game=game_state)
+    else:
+        info = ChessBroker.analyse(
+            convert_to_fen(game_state), limit, nnueEngineOptions()
+        )
+        best_uci = info["pv"][0].uci() if info.get("pv") else None
+        score = info.get("score")
+    if score is not None:
+        ChessEngineCache.getCache().put(duck_fen, limit, network, score, best_uci)
+    return splitDuckMove(best_uci)
+
+
+def engineDuckMove(game_state, duck_moves):
+    """The duck move the engine chose along with the piece move just made"""
+    if engine_duck_move is None:
+        return None
+    key, square = engine_duck_move
+    if key != game_state.positionKey():
+        return None
+    for move in duck_moves:
+        if move.getRankFile(move.end_row, move.end_col) == square:
+            return move
+    return None
+
+
+def duckEngine(game_state):
+    """
+    (this process's ChessFairy.DuckSession, (start FEN, moves) of the game
+    in duck notation), or (None, None) when the engine has no duck variant
+    or a duck move is due. A process sending its engine work to a broker
+    starts no engine of its own.
+    """
+    game = duckGame(game_state)
+    if game is None or ChessBroker.address is not None:
+        return None, None
+    session = ChessFairy.duckSession(nnueEngineOptions())
+    return (session, game) if session.available() else (None, None)
 
-                if piece[0] == "w":
-                    score += piece_score[piece[1]] + piece_position_score
-                elif piece[0] == "b":
-                    score -= piece_score[piece[1]] + piece_position_score
 
-    # Add bonus for controlling center with duck
-    duck_row, duck_col = game_state.duck_location
-    center_control = duck_scores[duck_row][duck_col]
-    score += center_control * 0.3  # Small bonus for good duck position
+def engineNetwork(session=None):
+    """Cache key of the engine's network, and its rules with a session"""
+    network = ChessEngineCache.networkKey(nnueEngineOptions())
+    if session is not None:
+        network += f":{ChessFairy.DUCK_VARIANT}"
+    return network
+
 
-    return score
+def duckGame(game_state):
+    """
+    (start FEN, moves) of game_state's game in Fairy-Stockfish's duck
+    notation, or None while a duck move is due. Every game starts from
+    GameState()'s position.
+    """
+    log = game_state.move_log
+    if len(log) % 2:
+        return None
+    moves = []
+    for piece_move, duck_move in zip(log[::2], log[1::2]):
+        if piece_move.is_duck_move or not duck_move.is_duck_move:
+            return None
+        piece = piece_move.get_uci() + ("q" if piece_move.is_pawn_promotion else "")
+        duck = duck_move.getRankFile(duck_move.end_row, duck_move.end_col)
+        moves.append(f"{piece},{piece[2:4]}{duck}")
+    return DUCK_START_FEN, moves
+
+
+def splitDuckMove(uci):
+    """(piece move, duck square or None) of a UCI or duck-notation move"""
+    if uci is None:
+        return None, None
+    piece, _, duck = uci.partition(",")
+    return piece, duck[-2:] or None
 
 
 def findRandomMove(valid_moves, return_queue):
@@ -415,48 +478,74 @@ def findRandomMove(valid_moves, return_queue):
 
 
 def evaluate_position_with_fairy_stockfish(game_state):
+    key = game_state.positionKey()
+    cached_score = nnue_eval_cache.get(key)
+    if cached_score is not None:
+        return cached_score
+
     # 增加超時處理和備用評估
     try:
-        fen = convert_to_fen(game_state)
-        with chess.engine.SimpleEngine.popen_uci(
-            FAIRY_STOCKFISH_PATH, timeout=10
-        ) as engine:
-            # 設定NNUE模型路徑
-            engine.configure(
-                {
-                    "UCI_EvalFile": os.path.join(
-                        "NNUE model", "NNUE model/duck-ba21f91f5d81.nnue"
-                    )
-                }
+        session, game = duckEngine(game_state)
+        duck_fen = convert_to_fen(game_state, duck=True)
+        network = engineNetwork(session)
+        # 先查磁碟快取（跨執行、跨 worker 共用）
+        stored = ChessEngineCache.getCache().get(duck_fen, NNUE_EVAL_LIMIT, network)
+        if stored is not None:
+            pov_score = stored[0]
+        elif session is not None:
+            # 鴨子變體：送出整局棋步，引擎的雜湊表沿用
+            best_uci, pov_score = session.play(
+                *game, NNUE_EVAL_LIMIT, game=game_state)
+            if pov_score is None:
+                return scoreBoard(game_state)
+            ChessEngineCache.getCache().put(
+                duck_fen, NNUE_EVAL_LIMIT, network, pov_score, best_uci
             )
+        else:
+            # 設定NNUE模型路徑的引擎（常駐，已設定好；有 broker 時交給它）
+            result = ChessBroker.analyse(
+                convert_to_fen(game_state),
+                NNUE_EVAL_LIMIT,
+                nnueEngineOptions())
+            pov_score = result["score"]
+            pv = result.get("pv")
+            ChessEngineCache.getCache().put(
+                duck_fen,
+                NNUE_EVAL_LIMIT,
+                network,
+                pov_score,
+                pv[0].uci() if pv else None,
+            )
+        score = pov_score.white().score(mate_score=10000)
 
-            # 計算position評分
-            board = chess.Board(fen)
-            result = engine.analyse(
-                board, chess.engine.Limit(
-                    time=0.5, nodes=1000))
-            score = result["score"].white().score(mate_score=10000)
-
-            if score is None:
-                # 如果Stockfish沒有返回分數，使用備用評估
-                return scoreBoard(game_state)
+        if score is None:
+            # 如果Stockfish沒有返回分數，使用備用評估
+            return scoreBoard(game_state)
 
-            return int(score) if game_state.white_to_move else -int(score)
+        score = int(score) if game_state.white_to_move else -int(score)
+        nnue_eval_cache.put(key, score)  # fallback scores are not cached
+        return score
     except Exception as e:
         print(f"[WARN] Stockfish評估失敗: {e}")
         # 使用備用評估方法
         return scoreBoard(game_state)
 
 
-def convert_to_fen(game_state):
+def convert_to_fen(game_state, duck=False):
     # 改進FEN轉換函數，確保包含所有必要信息
+    # duck=True writes the duck as "*", as Fairy-Stockfish's duck variant does
     rows = []
     for r in range(8):
         empty = 0
         row_str = ""
         for c in range(8):
             piece = game_state.board[r][c]
-            if piece == "--" or piece == "DD":
+            if piece == "DD" and duck:
+                if empty != 0:
+                    row_str += str(empty)
+                    empty = 0
+                row_str += "*"
+            elif piece == "--" or piece == "DD":
                 empty += 1
             else:
                 if empty != 0:
@@ -496,3 +585,6 @@ def convert_to_fen(game_state):
     fullmove = len(game_state.move_log) // 2 + 1
 
     return f"{board_fen} {turn} {castle_rights} {en_passant} {halfmove} {fullmove}"
+
+
+DUCK_START_FEN = convert_to_fen(ChessEngine.GameState(), duck=True)
@@ -0,0 +1,199 @@
+"""
+Analysis API for the handcraft search.
+analyse() returns the best K full turns (piece move + duck move) with their
+scores from one search, instead of a single move through a global.
+"""
+
+import time
+
+import chessAi_handcraft
+import ChessControl
+import ChessTT
+from chessAi_handcraft import CHECKMATE, orderMoves, scoreBoard, squaresOf
+
+MAX_ANALYSIS_DEPTH = 32  # cap for time-limited analysis
+
+
+class PrincipalVariation:
+    """One analysed line: the full turn to play, its score and continuation"""
+
+    def __init__(self, move, duck_move, score, line):
+        self.move = move  # piece move
+        self.duck_move = duck_move  # None when the piece move ends the game
+        self.score = score  # from the point of view of the side to move
+        self.line = line  # [move, duck_move, reply, reply duck, ...]
+
+    def __repr__(self):
+        return f"PrincipalVariation({self}, score={self.score})"
+
+    def __str__(self):
+        return " ".join(str(m) for m in self.line)
+
+
+class AnalysisResult:
+    """Lines best first, plus the depth (in full turns) they were searched to"""
+
+    def __init__(self, lines, depth, elapsed):
+        self.lines = lines
+        self.depth = depth
+        self.elapsed = elapsed
+
+    @property
+    def best(self):
+        return self.lines[0] if self.lines else None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __repr__(self):
+        return f"AnalysisResult(depth={self.depth}, lines={self.lines})"
+
+
+def analyse(game_state, multipv=1, limit=None):
+    """
+    Search the position once and return the best `multipv` full turns.
+
+    limit may be a chess.engine.Limit or anything with `depth` and `time`
+    attributes; depth counts full turns. With only a time limit the search
+    deepens until the time is used up and keeps the last finished depth;
+    a ChessControl.SearchControl holding the deadline stops the search
+    inside a root turn as well, and the unfinished depth is thrown away.
+    Without a limit it searches to chessAi_handcraft.DEPTH.
+
+    Every root turn is searched against the score of the K-th best line so
+    far, so lines that can't make the list fail low cheaply. A transposition
+    table (the module's, or a private one) supplies the continuations.
+    """
+    started = time.monotonic()
+    max_depth = getattr(limit, "depth", None)
+    time_limit = getattr(limit, "time", None)
+    if max_depth is None:
+        max_depth = MAX_ANALYSIS_DEPTH if time_limit else chessAi_handcraft.DEPTH
+
+    piece_moves = [m for m in game_state.getValidMoves() if not m.is_duck_move]
+    if game_state.duck_move_phase or not piece_moves:
+        return AnalysisResult([], 0, 0.0)
+
+    own_table = chessAi_handcraft.transposition_table is None
+    if own_table:
+        chessAi_handcraft.transposition_table = ChessTT.TranspositionTable(16)
+    control = None
+    if time_limit is not None:
+        control = ChessControl.SearchControl(time_limit=time_limit)
+    ChessControl.begin(control)
+    try:
+        result = AnalysisResult([], 0, 0.0)
+        root_moves = orderMoves(game_state, piece_moves)
+        for depth in range(1, max_depth + 1):
+            lines = _searchRoot(
+                game_state,
+                root_moves,
+                depth,
+                multipv,
+                control)
+            if lines is None:
+                break  # out of time part way through this depth
+            result = AnalysisResult(lines, depth, time.monotonic() - started)
+            if lines[0].score >= CHECKMATE:
+                break  # a forced king capture won't get any better
+            # Search last depth's best lines first next time
+            best_moves = [pv.move for pv in lines]
+            root_moves.sort(key=lambda m: m not in best_moves)
+        return result
+    finally:
+        ChessControl.end(control)
+        if own_table:
+            chessAi_handcraft.transposition_table = None
+
+
+def _searchRoot(game_state, root_moves, depth, multipv, control):
+    """Top `multipv` full turns at this depth, or None if control stopped"""
+    color = 1 if game_state.white_to_move else -1
+    enemy_king = "bK" if game_state.white_to_move else "wK"
+    top = []
+
+    def kthScore():
+        return top[-1].score if len(top) == multipv else -CHECKMATE
+
+    def insert(move, duck_move, score):
+        """Add a line if it makes the top list; ties keep the earlier line"""
+        if len(top) < multipv or score > top[-1].score:
+            top.append(PrincipalVariation(move, duck_move, score, []))
+            top.sort(key=lambda pv: -pv.score)  # stable sort
+            del top[multipv:]
+
+    for move in root_moves:
+        if move.piece_captured == enemy_king:
+            insert(move, None, CHECKMATE)
+            continue
+
+        game_state.makeMove(move)
+        duck_moves = game_state.getValidMoves()
+        if not duck_moves:  # the move ended the game (50-move rule)
+            insert(move, None, color * scoreBoard(game_state))
+        for duck_move in duck_moves:
+            if control is not None and control.poll():
+                game_state.undoMove()
+                return None
+            alpha = kthScore()
+            game_state.makeMove(duck_move)
+            replies = [
+                m for m in game_state.getValidMoves() if not m.is_duck_move]
+            score = -chessAi_handcraft.negamax_full(
+                game_state, replies, depth - 1, -CHECKMATE, -alpha, -color, ply=1)
+            game_state.undoMove()
+            if control is not None and control.stopped:
+                game_state.undoMove()
+                return None  # the score of an unfinished search
+            # Scores at or below the K-th best are only bounds and never
+            # make the list, since insert() needs a strictly better score
+            insert(move, duck_move, score)
+        game_state.undoMove()
+
+    for pv in top:
+        pv.line = _principalLine(game_state, pv.move, pv.duck_move, depth)
+    return top
+
+
+def _principalLine(game_state, move, duck_move, depth):
+    """Follow the transposition table's best moves after a root turn"""
+    table = chessAi_handcraft.transposition_table
+    line = [move] if duck_move is None else [move, duck_move]
+    made = 0
+    for m in line:
+        game_state.makeMove(m)
+        made += 1
+
+    for _ in range(depth - 1):
+        if duck_move is None or table is None:
+            break
+        entry = table.probe(game_state.positionKey())
+        if entry is None or entry[3] is None:
+            break
+        piece = next((m for m in game_state.getValidMoves()
+                      if squaresOf(m) == entry[3]), None, )
+        if piece is None:
+            break
+        game_state.makeMove(piece)
+        made += 1
+        line.append(piece)
+        duck_move = next(
+            (
+                m
+                for m in game_state.getValidMoves()
+                if m.end_row * 8 + m.end_col == entry[4]
+            ),
+            None,
+        )
+        if duck_move is None:
+            break
+        game_state.makeMove(duck_move)
+        made += 1
+        line.append(duck_move)
+
+    for _ in range(made):
+        game_state.undoMove()
+    return line
@@ -0,0 +1,202 @@
+"""
+Opening book for Duck Chess.
+The book is a file of fixed-size records sorted by GameState.positionKey(),
+one per (position, move) with a weight. Piece-move and duck-move positions
+have different keys, so a full turn is two lookups. The file is opened with
+mmap, so every process using the book shares the same pages.
+"""
+
+import mmap
+import os
+import random
+
+import numpy as np
+
+import ChessEngine
+
+BOOK_PATH = os.path.join(os.path.dirname(__file__), "duck_book.bin")
+BOOK_MAGIC = b"DUCKBOOK"
+BOOK_VERSION = 1
+BOOK_PLIES = 24  # plies (piece and duck moves) recorded per game, 12 turns
+BOOK_MIN_WEIGHT = 2  # moves seen less often are left out of the book
+
+# Weight a move adds to the book, by the result for the side that played it
+WIN_WEIGHT = 3
+DRAW_WEIGHT = 2
+LOSS_WEIGHT = 1
+
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("count", "<u4"),
+        ("start_key", "<u8"),  # start position key, to catch stale books
+    ]
+)
+RECORD = np.dtype(
+    [
+        ("key", "<u8"),
+        ("start", "u1"),  # square = row * 8 + col
+        ("end", "u1"),
+        ("pad", "<u2"),
+        ("weight", "<u4"),
+    ]
+)
+
+_books = {}  # path -> open OpeningBook
+
+
+def _squares(move):
+    return (
+        move.start_row * 8 + move.start_col,
+        move.end_row * 8 + move.end_col,
+    )
+
+
+class OpeningBook:
+    """Read-only view of a book file through mmap"""
+
+    def __init__(self, path=BOOK_PATH):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self.mmap, dtype=HEADER, count=1)[0]
+        if header["magic"] != BOOK_MAGIC or header["version"] != BOOK_VERSION:
+            raise ValueError(f"{path} is not a version {BOOK_VERSION} book")
+        if header["start_key"] != ChessEngine.GameState().positionKey():
+            raise ValueError(f"{path} was built with other position keys")
+        self.records = np.frombuffer(
+            self.mmap,
+            dtype=RECORD,
+            count=int(header["count"]),
+            offset=HEADER.itemsize,
+        )
+        self.keys = self.records["key"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def entries(self, key):
+        """The records stored for a position key"""
+        low = np.searchsorted(self.keys, np.uint64(key), side="left")
+        high = np.searchsorted(self.keys, np.uint64(key), side="right")
+        return self.records[low:high]
+
+    def probe(self, game_state, valid_moves):
+        """
+        A book move for the position, drawn at random by weight, or None.
+        Only moves that are legal here are considered, so a key collision
+        can't produce an illegal move.
+        """
+        entries = self.entries(game_state.positionKey())
+        if len(entries) == 0:
+            return None
+        by_squares = {_squares(move): move for move in valid_moves}
+        candidates, weights = [], []
+        for entry in entries:
+            move = by_squares.get((int(entry["start"]), int(entry["end"])))
+            if move is not None:
+                candidates.append(move)
+                weights.append(int(entry["weight"]))
+        if not candidates:
+            return None
+        return random.choices(candidates, weights=weights)[0]
+
+    def close(self):
+        self.records = self.keys = None
+        self.mmap.close()
+
+
+def openBook(path=BOOK_PATH):
+    """The book at path, opened once per process, or None if there is none"""
+    if path not in _books:
+        if not os.path.exists(path):
+            return None
+        _books[path] = OpeningBook(path)
+    return _books[path]
+
+
+def bookMove(game_state, valid_moves, path=BOOK_PATH):
+    """Shortcut for the search entry points: a book move or None"""
+    book = openBook(path)
+    if book is None:
+        return None
+    return book.probe(game_state, valid_moves)
+
+
+class BookBuilder:
+    """Counts (position, move) weights over games, then writes a book file"""
+
+    def __init__(self, plies=BOOK_PLIES):
+        self.plies = plies
+        self.weights = {}  # (key, start, end) -> weight
+
+    def addGame(self, move_log, winner):
+        """Add the first plies of a game played from the start position"""
+        game_state = ChessEngine.GameState()
+        for move in move_log[: self.plies]:
+            side = "w" if game_state.white_to_move else "b"
+            if winner is None:
+                weight = DRAW_WEIGHT
+            else:
+                weight = WIN_WEIGHT if winner == side else LOSS_WEIGHT
+            entry = (game_state.positionKey(), *_squares(move))
+            self.weights[entry] = self.weights.get(entry, 0) + weight
+            game_state.makeMove(move)
+            if game_state.game_over:
+                break
+
+    def write(self, path=BOOK_PATH, min_weight=BOOK_MIN_WEIGHT):
+        """Write the book sorted by key; returns the number of records"""
+        entries = sorted(
+            (entry, weight)
+            for entry, weight in self.weights.items()
+            if weight >= min_weight
+        )
+        records = np.zeros(len(entries), dtype=RECORD)
+        for record, ((key, start, end), weight) in zip(records, entries):
+            record["key"], record["start"], record["end"] = key, start, end
+            record["weight"] = weight
+
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = BOOK_MAGIC
+        header["version"] = BOOK_VERSION
+        header["count"] = len(records)
+        header["start_key"] = ChessEngine.GameState().positionKey()
+
+        # Write next to the target and swap in, so readers never see half
+        # a book
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(records.tobytes())
+        os.replace(temp_path, path)
+        _books.pop(path, None)
+        return len(records)
+
+
+def buildBook(
+        path=BOOK_PATH,
+        num_games=200,
+        playouts=200,
+        evaluator="material"):
+    """
+    Build a book from lock-step MCTS self-play. The opening plies are drawn
+    by visit count so the games branch out.
+    """
+    import ChessSelfPlay
+
+    builder = BookBuilder()
+    games = ChessSelfPlay.runGames(
+        num_games,
+        evaluator=evaluator,
+        playouts=playouts,
+        sample_plies=BOOK_PLIES,
+    )
+    for game in games:
+        builder.addGame(game.state.move_log, game.state.winner)
+    return builder.write(path)
+
+
+if __name__ == "__main__":
+    count = buildBook()
+    print(f"Book saved as: {BOOK_PATH} ({count} entries)")
@@ -0,0 +1,380 @@
+"""
+Evaluation broker.
+One process on the machine owns a fixed set of fairy-stockfish engines and
+analyses positions for every game worker, which send their requests over a
+UNIX socket instead of starting engines of their own. The broker's engine
+count, threads and hash are then the whole engine budget however many
+workers run. Each connection has its own queue of positions and the engines
+take from the queues in turn, so a worker sending a large batch doesn't
+hold up the others; results are sent back as each position is done.
+
+Requests and replies are JSON lines:
+    {"jobs": [[id, fen], ...], "limit": {"time": ...}, "options": {...}}
+    {"id": id, "cp": ..., "mate": ..., "best_move": ...}  (White's view)
+    {"id": id, "error": "..."}
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+from multiprocessing import Event, Process
+
+import chess
+import chess.engine
+
+import ChessFairy
+
+BROKER_ENGINES = max(1, (os.cpu_count() or 2) // 2)  # analyses at once
+BROKER_THREADS = 1  # search threads of each engine
+BROKER_HASH_MB = 256  # hash of all the engines of one option set together
+BROKER_SOCKET = os.path.join(tempfile.gettempdir(), "duck-broker.sock")
+BROKER_LINE_LIMIT = 64 * 1024 * 1024  # bytes of one request line (a batch)
+BROKER_SUPPORTED = hasattr(socket, "AF_UNIX") and sys.platform != "win32"
+
+address = None  # socket of the broker this process sends engine work to
+
+
+class _Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.jobs = collections.deque()  # (id, fen, limit, options)
+        self.closed = False
+
+
+class Broker:
+    """
+    The engines and queues of a broker; serve() runs it on a socket.
+    Each option set gets a pool of up to engines engines, splitting hash_mb
+    between them, and at most engines positions are analysed at once.
+    """
+
+    def __init__(
+        self,
+        engines=BROKER_ENGINES,
+        threads=BROKER_THREADS,
+        hash_mb=BROKER_HASH_MB,
+    ):
+        self.engines = engines
+        self.engine_options = {
+            "Threads": threads,
+            "Hash": max(1, hash_mb // engines),
+        }
+        self.pools = {}  # sorted option items -> ChessFairy.AsyncEnginePool
+        self.ready = collections.deque()  # connections with queued jobs
+        self.queued = None  # asyncio.Semaphore counting queued jobs
+        self.handlers = {}  # open connection -> task reading its requests
+
+    def _pool(self, options):
+        key = tuple(sorted(options.items()))
+        if key not in self.pools:
+            self.pools[key] = ChessFairy.AsyncEnginePool(
+                {**options, **self.engine_options}, self.engines
+            )
+        return self.pools[key]
+
+    async def _analyse(self, job):
+        job_id, fen, limit, options = job
+        try:
+            info = await self._pool(options).analyse(chess.Board(fen), limit)
+        except (
+            *ChessFairy.ENGINE_ERRORS,
+            asyncio.TimeoutError,
+            OSError,
+            ValueError,
+        ) as e:
+            return {"id": job_id, "error": str(e) or type(e).__name__}
+        reply = {"id": job_id, "cp": None, "mate": None, "best_move": None}
+        if "score" in info:
+            white = info["score"].white()
+            reply["cp"], reply["mate"] = white.score(), white.mate()
+        if info.get("pv"):
+            reply["best_move"] = info["pv"][0].uci()
+        return reply
+
+    async def _engineSlot(self):
+        """Analyse queued jobs, one connection's at a time in turn"""
+        while True:
+            await self.queued.acquire()
+            connection = self.ready.popleft()
+            job = connection.jobs.popleft()
+            if connection.jobs:
+                self.ready.append(connection)
+            if connection.closed:
+                continue
+            reply = await self._analyse(job)
+            try:
+                connection.writer.write(json.dumps(reply).encode() + b"\n")
+                await connection.writer.drain()
+            except (ConnectionError, OSError):
+                connection.closed = True
+
+    async def _handle(self, reader, writer):
+        connection = _Connection(writer)
+        self.handlers[connection] = asyncio.current_task()
+        try:
+            async for line in reader:
+                request = json.loads(line)
+                limit = chess.engine.Limit(**request["limit"])
+                options = request.get("options") or {}
+                for job_id, fen in request["jobs"]:
+                    if not connection.jobs:
+                        self.ready.append(connection)
+                    connection.jobs.append((job_id, fen, limit, options))
+                    self.queued.release()
+        except (ConnectionError, ValueError, KeyError, TypeError):
+            pass  # a broken or malformed connection is dropped
+        finally:
+            # Its queued jobs are skipped by the engine slots
+            connection.closed = True
+            writer.close()
+            del self.handlers[connection]
+
+    async def serve(self, path, ready=None):
+        """Listen on path until SIGTERM; ready (an Event) is set once up"""
+        self.queued = asyncio.Semaphore(0)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        if os.path.exists(path):
+            os.remove(path)
+        # A batch is one JSON line; asyncio's default allows only 64 KiB
+        server = await asyncio.start_unix_server(
+            self._handle, path, limit=BROKER_LINE_LIMIT)
+        slots = []
+        for _ in range(self.engines):
+            slots.append(asyncio.create_task(self._engineSlot()))
+        if ready is not None:
+            ready.set()
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            for slot in slots:
+                slot.cancel()
+            # Let every connection's reader see its end instead of cancelling
+            handlers = list(self.handlers.values())
+            for connection in list(self.handlers):
+                connection.writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            for pool in self.pools.values():
+                await pool.close()
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def serve(
+    path,
+    engines=BROKER_ENGINES,
+    threads=BROKER_THREADS,
+    hash_mb=BROKER_HASH_MB,
+    ready=None,
+):
+    """Run a broker on path until SIGTERM (the broker process's target)"""
+    asyncio.run(Broker(engines, threads, hash_mb).serve(path, ready))
+
+
+def start(
+    path=None,
+    engines=BROKER_ENGINES,
+    threads=BROKER_THREADS,
+    hash_mb=BROKER_HASH_MB,
+):
+    """Start a broker process; returns (process, socket path) once it listens"""
+    if not BROKER_SUPPORTED:
+        raise OSError("the evaluation broker needs UNIX sockets")
+    if path is None:
+        path = os.path.join(
+            tempfile.gettempdir(),
+            f"duck-broker-{os.getpid()}.sock")
+    ready = Event()
+    process = Process(
+        target=serve,
+        args=(path, engines, threads, hash_mb, ready),
+        daemon=True,
+    )
+    process.start()
+    if not ready.wait(ChessFairy.ENGINE_TIMEOUT):
+        process.terminate()
+        raise TimeoutError("the evaluation broker did not start")
+    return process, path
+
+
+def stop(process):
+    """Stop a broker from start(); it closes its engines first"""
+    process.terminate()
+    process.join(ChessFairy.ENGINE_TIMEOUT)
+    if process.is_alive():
+        process.kill()
+
+
+# ───────────────────────── workers ─────────────────────────
+
+
+class _Batch:
+    def __init__(self, size):
+        self.future = concurrent.futures.Future()
+        self.results = [None] * size
+        self.remaining = size
+
+    def done(self, index, result):
+        self.results[index] = result
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.future.set_result(self.results)
+
+
+class BrokerClient:
+    """
+    A worker's connection to a broker. submitMany() sends a batch and
+    returns at once; a reader thread fills in the results.
+    """
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.lock = threading.Lock()
+        self.jobs = {}  # job id -> (_Batch, index in it)
+        self.ids = itertools.count()
+        self.closed = False
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def submitMany(self, positions, limit, options=None):
+        """
+        A concurrent.futures.Future of the analysis of every position (a
+        chess.Board or FEN), in order, like ChessFairy.submitMany: an
+        InfoDict with "score" (and "pv" when the engine gave one), or None
+        where the engine failed
+        """
+        fens = [p if isinstance(p, str) else p.fen() for p in positions]
+        batch = _Batch(len(fens))
+        if not fens:
+            batch.future.set_result([])
+            return batch.future
+        request = {
+            "limit": {
+                name: value
+                for name in ("time", "depth", "nodes")
+                if (value := getattr(limit, name)) is not None
+            },
+            "options": dict(options or {}),
+            "jobs": [],
+        }
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("the broker connection is closed")
+            for index, fen in enumerate(fens):
+                job_id = next(self.ids)
+                self.jobs[job_id] = batch, index
+                request["jobs"].append([job_id, fen])
+            try:
+                self.sock.sendall(json.dumps(request).encode() + b"\n")
+            except OSError:
+                for job_id, _ in request["jobs"]:
+                    del self.jobs[job_id]
+                self.closed = True
+                raise
+        return batch.future
+
+    def _read(self):
+        try:
+            with self.sock.makefile("rb") as lines:
+                for line in lines:
+                    reply = json.loads(line)
+                    with self.lock:
+                        job = self.jobs.pop(reply["id"], None)
+                    if job is None:
+                        continue  # not a job of this client's
+                    batch, index = job
+                    batch.done(index, _infoDict(reply))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # a broken connection or a malformed reply ends it
+        with self.lock:
+            self.closed = True
+            jobs, self.jobs = self.jobs, {}
+        error = ConnectionError("the broker closed the connection")
+        for batch in {id(batch): batch for batch, _ in jobs.values()}.values():
+            if not batch.future.done():
+                batch.future.set_exception(error)
+
+    def close(self):
+        self.sock.close()
+
+
+def _infoDict(reply):
+    if "error" in reply:
+        return None
+    info = {}
+    if reply["mate"] is not None:
+        info["score"] = chess.engine.PovScore(
+            chess.engine.Mate(reply["mate"]), chess.WHITE
+        )
+    elif reply["cp"] is not None:
+        info["score"] = chess.engine.PovScore(
+            chess.engine.Cp(reply["cp"]), chess.WHITE)
+    if reply["best_move"] is not None:
+        info["pv"] = [chess.Move.from_uci(reply["best_move"])]
+    return info
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def connect(path):
+    """Send this process's engine work to the broker at path (None: don't)"""
+    global address
+    address = path
+
+
+def getClient():
+    """This process's connection to the broker at address, or None"""
+    global _client, _client_pid
+    if address is None:
+        return None
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid() or _client.closed:
+            # A forked child must not share its parent's socket
+            try:
+                _client = BrokerClient(address)
+            except OSError:
+                _client = None
+            _client_pid = os.getpid()
+        return _client
+
+
+def submitMany(positions, limit, options=None):
+    """ChessFairy.submitMany, run by the broker when this process has one"""
+    client = getClient()
+    if client is None:
+        return ChessFairy.submitMany(positions, limit, options=options)
+    return client.submitMany(positions, limit, options)
+
+
+def analyse(fen, limit, options=None):
+    """
+    Engine analysis (an InfoDict) of one FEN: by the broker when this
+    process has one, otherwise by a pooled engine of its own
+    """
+    client = getClient()
+    if client is None:
+        with ChessFairy.engine(options) as engine:
+            return engine.analyse(chess.Board(fen), limit)
+    info = client.submitMany([fen], limit, options).result()
+    if info[0] is None:
+        raise chess.engine.EngineError("the broker's engine failed")
+    return info[0]
+
+
+if __name__ == "__main__":
+    # A broker for several runs: run_parallel_games(..., broker=path)
+    path = sys.argv[1] if len(sys.argv) > 1 else BROKER_SOCKET
+    print(f"Evaluation broker listening on: {path}")
+    serve(path)
@@ -0,0 +1,95 @@
+"""
+Search control.
+A SearchControl gives one search a budget: a deadline, a node limit and a
+stop flag that another thread or process can raise. The searches look at
+ChessControl.current, poll the budget every CHECK_INTERVAL nodes, and once
+stopped unwind at once and return the best move of the work they finished.
+"""
+
+import time
+
+CHECK_INTERVAL = 1024  # nodes between budget polls, ~40ms at 25k nodes/s
+MAX_DEPTH = 32  # deepest iteration of a search run to a time or node budget
+
+current = None  # SearchControl of the search running in this process
+
+
+class SearchControl:
+    """
+    Budget of one search. time_limit is in seconds from begin(); node_limit
+    counts search nodes and is kept to within CHECK_INTERVAL. stop_event is
+    anything with is_set() and set(), e.g. a multiprocessing.Event for a
+    search running in another process; without one, stop() only reaches a
+    search in this process.
+    """
+
+    def __init__(
+        self, time_limit=None, node_limit=None, max_depth=None, stop_event=None
+    ):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.stop_event = stop_event
+        self.deadline = None
+        self.nodes = 0
+        self.stopped = False
+
+    @property
+    def budgeted(self):
+        return self.time_limit is not None or self.node_limit is not None
+
+    def depthLimit(self, depth):
+        """Deepest iteration to run when the search's own depth is depth"""
+        if self.max_depth is not None:
+            return self.max_depth
+        return MAX_DEPTH if self.budgeted else depth
+
+    def start(self):
+        self.nodes = 0
+        if self.time_limit is not None:
+            self.deadline = time.monotonic() + self.time_limit
+        self.poll()
+
+    def check(self):
+        """Count a node; True once the search has to stop"""
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0 and not self.stopped:
+            self.poll()
+        return self.stopped
+
+    def poll(self):
+        """Look at the stop flag and the budget now"""
+        if (
+            (self.stop_event is not None and self.stop_event.is_set())
+            or (self.deadline is not None and time.monotonic() >= self.deadline)
+            or (self.node_limit is not None and self.nodes >= self.node_limit)
+        ):
+            self.stopped = True
+        return self.stopped
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def stop(self):
+        """Ask the search to return its best move so far"""
+        self.stopped = True
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+
+def begin(control):
+    """Make control (None for none) the current search's and start its clock"""
+    global current
+    current = control
+    if control is not None:
+        control.start()
+    return control
+
+
+def end(control):
+    global current
+    if current is control:
+        current = None
@@ -8,6 +8,98 @@ Special rules:
 3. Two-phase turns: piece move -> duck move
 """
 
+import random
+
+from ChessEval import PIECE_SQUARE_TABLES, evaluateBoard
+
+# Exchange values used by GameState.see(); taking the king ends the game
+see_piece_values = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 100}
+
+
+def _buildAttackTables():
+    """Precompute per-square attack lists, squares indexed as row * 8 + col"""
+    knight_steps = [
+        (-2, -1),
+        (-2, 1),
+        (-1, -2),
+        (-1, 2),
+        (1, -2),
+        (1, 2),
+        (2, -1),
+        (2, 1),
+    ]
+    king_steps = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                  (0, 1), (1, -1), (1, 0), (1, 1)]
+    # Rook directions first, then bishop directions
+    ray_steps = [(-1, 0), (1, 0), (0, -1), (0, 1),
+                 (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+    def onBoard(r, c):
+        return 0 <= r < 8 and 0 <= c < 8
+
+    knight, king, rays = [], [], []
+    pawn_attackers = {"w": [], "b": []}
+    for row in range(8):
+        for col in range(8):
+            knight.append(
+                [
+                    (row + dr, col + dc)
+                    for dr, dc in knight_steps
+                    if onBoard(row + dr, col + dc)
+                ]
+            )
+            king.append(
+                [
+                    (row + dr, col + dc)
+                    for dr, dc in king_steps
+                    if onBoard(row + dr, col + dc)
+                ]
+            )
+            square_rays = []
+            for dr, dc in ray_steps:
+                ray = []
+                r, c = row + dr, col + dc
+                while onBoard(r, c):
+                    ray.append((r, c))
+                    r, c = r + dr, c + dc
+                square_rays.append(ray)
+            rays.append(square_rays)
+            # White pawns capture upwards, so they sit one row below the target
+            for color, pawn_row in (("w", row + 1), ("b", row - 1)):
+                pawn_attackers[color].append(
+                    [
+                        (pawn_row, col + dc)
+                        for dc in (-1, 1)
+                        if onBoard(pawn_row, col + dc)
+                    ]
+                )
+    return knight, king, rays, pawn_attackers
+
+
+KNIGHT_ATTACKS, KING_ATTACKS, RAYS, PAWN_ATTACKERS = _buildAttackTables()
+
+
+def _buildZobristTables():
+    """Random 64-bit keys for hashing positions (fixed seed, stable across runs)"""
+    rng = random.Random(0xD0C4)
+    pieces = [color + kind for color in "wb" for kind in "pRNBQK"] + ["DD"]
+    piece_keys = {piece: [rng.getrandbits(64)
+                          for _ in range(64)] for piece in pieces}
+    black_to_move = rng.getrandbits(64)
+    duck_phase = rng.getrandbits(64)
+    castling = [rng.getrandbits(64) for _ in range(16)]
+    enpassant = [rng.getrandbits(64) for _ in range(8)]
+    return piece_keys, black_to_move, duck_phase, castling, enpassant
+
+
+(
+    ZOBRIST_PIECES,
+    ZOBRIST_BLACK_TO_MOVE,
+    ZOBRIST_DUCK_PHASE,
+    ZOBRIST_CASTLING,
+    ZOBRIST_ENPASSANT,
+) = _buildZobristTables()
+
 
 class GameState:
     def __init__(self):
@@ -70,17 +162,32 @@ class GameState:
         # Half-move counter for 50-move rule
         self.no_progress_count = 0
 
+        # Zobrist key of the pieces and duck, kept up to date by makeMove
+        self.board_key = self.computeBoardKey()
+        self.board_key_log = []
+
+        # Running material + piece-square total in milli-pawns (white positive)
+        self.eval_score = evaluateBoard(self.board)
+        self.eval_score_log = []
+
+        # Optional ChessNNUE.Accumulator, kept in step by setSquare
+        self.nnue = None
+
     def makeMove(self, move):
         """Execute a move (piece or duck) and check for king capture"""
         if self.game_over:
             return
 
         move.prev_no_progress_count = self.no_progress_count
+        self.board_key_log.append(self.board_key)
+        self.eval_score_log.append(self.eval_score)
+        if self.nnue is not None:
+            self.nnue.push()
 
         if not move.is_duck_move:  # Piece movement
             captured_piece = self.board[move.end_row][move.end_col]
-            self.board[move.start_row][move.start_col] = "--"
-            self.board[move.end_row][move.end_col] = move.piece_moved
+            self.setSquare(move.start_row, move.start_col, "--")
+            self.setSquare(move.end_row, move.end_col, move.piece_moved)
             self.move_log.append(move)
 
             # Update king location if moved
@@ -93,19 +200,32 @@ class GameState:
             if captured_piece in ["wK", "bK"]:
                 self.game_over = True
                 self.winner = "w" if captured_piece == "bK" else "b"
+                # Keep turn state and logs in step so undoMove can take it back
+                self.duck_move_phase = True
+                self.enpassant_possible_log.append(self.enpassant_possible)
+                self.castle_rights_log.append(
+                    CastleRights(
+                        self.current_castling_rights.wks,
+                        self.current_castling_rights.bks,
+                        self.current_castling_rights.wqs,
+                        self.current_castling_rights.bqs,
+                    )
+                )
                 return
 
             # Handle pawn-specific rules
             if move.piece_moved[1] == "p":
                 # Pawn promotion
                 if move.is_pawn_promotion:
-                    self.board[move.end_row][move.end_col] = move.piece_moved[0] + "Q"
+                    self.setSquare(
+                        move.end_row, move.end_col, move.piece_moved[0] + "Q"
+                    )
 
                 # En passant capture
                 if move.is_enpassant_move:
                     captured_pawn_row = move.start_row
                     captured_pawn_col = move.end_col
-                    self.board[captured_pawn_row][captured_pawn_col] = "--"
+                    self.setSquare(captured_pawn_row, captured_pawn_col, "--")
 
                 # Set en passant opportunity
                 if abs(move.start_row - move.end_row) == 2:
@@ -124,14 +244,14 @@ class GameState:
                     rook_start_col = move.end_col + 1
                     rook_end_col = move.end_col - 1
                     rook = self.board[move.end_row][rook_start_col]
-                    self.board[move.end_row][rook_end_col] = rook
-                    self.board[move.end_row][rook_start_col] = "--"
+                    self.setSquare(move.end_row, rook_end_col, rook)
+                    self.setSquare(move.end_row, rook_start_col, "--")
                 else:  # Queenside
                     rook_start_col = move.end_col - 2
                     rook_end_col = move.end_col + 1
                     rook = self.board[move.end_row][rook_start_col]
-                    self.board[move.end_row][rook_end_col] = rook
-                    self.board[move.end_row][rook_start_col] = "--"
+                    self.setSquare(move.end_row, rook_end_col, rook)
+                    self.setSquare(move.end_row, rook_start_col, "--")
 
             # Update turn phase
             if not self.duck_move_phase:
@@ -151,8 +271,8 @@ class GameState:
 
         else:  # Duck movement
             # Move duck to new position
-            self.board[self.duck_location[0]][self.duck_location[1]] = "--"
-            self.board[move.end_row][move.end_col] = "DD"
+            self.setSquare(self.duck_location[0], self.duck_location[1], "--")
+            self.setSquare(move.end_row, move.end_col, "DD")
             self.duck_location = (move.end_row, move.end_col)
             self.duck_location_log.append(self.duck_location)
             self.move_log.append(move)
@@ -184,6 +304,10 @@ class GameState:
         move = self.move_log.pop()
 
         self.no_progress_count = move.prev_no_progress_count
+        self.board_key = self.board_key_log.pop()
+        self.eval_score = self.eval_score_log.pop()
+        if self.nnue is not None:
+            self.nnue.pop()
 
         if not move.is_duck_move:  # Undo piece move
             # Restore board state
@@ -203,7 +327,10 @@ class GameState:
 
             # Restore castling rights
             self.castle_rights_log.pop()
-            self.current_castling_rights = self.castle_rights_log[-1]
+            # Copy, so later updates don't rewrite the logged rights
+            last_rights = self.castle_rights_log[-1]
+            self.current_castling_rights = CastleRights(
+                last_rights.wks, last_rights.bks, last_rights.wqs, last_rights.bqs)
 
             # Restore castle state
             if move.is_castle_move:
@@ -238,9 +365,9 @@ class GameState:
             self.duck_location = (move.start_row, move.start_col)
             self.duck_location_log.pop()
 
-            # Restore turn state
+            # Restore turn state: back to the duck phase of the same player
             self.duck_move_phase = True
-            # Player doesn't change because duck move is part of the same turn
+            self.white_to_move = not self.white_to_move
 
             # Clear game over state
             self.game_over = False
@@ -253,6 +380,45 @@ class GameState:
         # Restore 50-move counter
         self.prev_no_progress_count = 0
 
+    def setSquare(self, row, col, piece):
+        """Put piece (or "--") on a square, keeping board_key and eval_score in sync"""
+        square = row * 8 + col
+        old_piece = self.board[row][col]
+        if old_piece != "--":
+            self.board_key ^= ZOBRIST_PIECES[old_piece][square]
+            self.eval_score -= PIECE_SQUARE_TABLES[old_piece][square]
+        if piece != "--":
+            self.board_key ^= ZOBRIST_PIECES[piece][square]
+            self.eval_score += PIECE_SQUARE_TABLES[piece][square]
+        if self.nnue is not None:
+            self.nnue.update(square, old_piece, piece)
+        self.board[row][col] = piece
+
+    def computeBoardKey(self):
+        """Zobrist key of the pieces and duck, computed from scratch"""
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+        return key
+
+    def positionKey(self):
+        """64-bit key of the whole position: board, duck, side, phase and rights"""
+        key = self.board_key
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.duck_move_phase:
+            key ^= ZOBRIST_DUCK_PHASE
+        rights = self.current_castling_rights
+        key ^= ZOBRIST_CASTLING[
+            rights.wks | rights.bks << 1 | rights.wqs << 2 | rights.bqs << 3
+        ]
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
+        return key
+
     def updateCastleRights(self, move):
         """Update castling rights based on move"""
         if move.is_duck_move:
@@ -640,6 +806,104 @@ class GameState:
         """Check if square has a piece (not duck or empty)"""
         return self.board[row][col] != "--" and self.board[row][col] != "DD"
 
+    def squareUnderAttack(self, row, col, attacker_color):
+        """Check if attacker_color could capture on (row, col), duck blocks lines"""
+        return self.leastValuableAttacker(row, col, attacker_color) is not None
+
+    def leastValuableAttacker(self, row, col, attacker_color, removed=()):
+        """
+        Find the cheapest attacker_color piece that can capture on (row, col).
+        Squares in `removed` count as empty, so x-ray attackers show up once the
+        pieces in front of them have captured. The duck always blocks.
+        Returns (piece, (row, col)) or None.
+        """
+        board = self.board
+        square = row * 8 + col
+        best = None
+        best_value = None
+
+        pawn = attacker_color + "p"
+        for r, c in PAWN_ATTACKERS[attacker_color][square]:
+            if board[r][c] == pawn and (r, c) not in removed:
+                return pawn, (r, c)
+
+        knight = attacker_color + "N"
+        for r, c in KNIGHT_ATTACKS[square]:
+            if board[r][c] == knight and (r, c) not in removed:
+                return knight, (r, c)
+
+        for direction, ray in enumerate(RAYS[square]):
+            sliders = "RQ" if direction < 4 else "BQ"
+            for r, c in ray:
+                piece = board[r][c]
+                if piece == "--" or (r, c) in removed:
+                    continue
+                if piece[0] == attacker_color and piece[1] in sliders:
+                    value = see_piece_values[piece[1]]
+                    if best is None or value < best_value:
+                        best, best_value = (piece, (r, c)), value
+                break
+
+        if best is None:
+            king = attacker_color + "K"
+            for r, c in KING_ATTACKS[square]:
+                if board[r][c] == king and (r, c) not in removed:
+                    return king, (r, c)
+        return best
+
+    def see(self, move):
+        """
+        Static exchange evaluation: material won by `move` if both sides keep
+        recapturing on its target square with their cheapest piece. The duck
+        stays where it is and blocks recaptures along its lines.
+        """
+        if move.is_duck_move:
+            return 0
+
+        if move.is_enpassant_move:
+            gain = [see_piece_values["p"]]
+        elif move.is_capture:
+            gain = [see_piece_values[move.piece_captured[1]]]
+        else:
+            gain = [0]
+        on_square = move.piece_moved[1]
+        if move.is_pawn_promotion:
+            gain[0] += see_piece_values["Q"] - see_piece_values["p"]
+            on_square = "Q"
+        if move.piece_captured[1:] == "K":
+            return gain[0]
+
+        removed = {(move.start_row, move.start_col)}
+        if move.is_enpassant_move:
+            removed.add((move.start_row, move.end_col))
+        color = "b" if move.piece_moved[0] == "w" else "w"
+        while True:
+            attacker = self.leastValuableAttacker(
+                move.end_row, move.end_col, color, removed
+            )
+            if attacker is None:
+                break
+            piece, square = attacker
+            gain.append(see_piece_values[on_square] - gain[-1])
+            if on_square == "K":
+                break  # the game ends when a king is taken
+            on_square = piece[1]
+            removed.add(square)
+            color = "b" if color == "w" else "w"
+
+        # Each side may stop recapturing when continuing would lose material
+        for i in range(len(gain) - 1, 0, -1):
+            gain[i - 1] = -max(-gain[i - 1], gain[i])
+        return gain[0]
+
+    def kingCaptureAvailable(self):
+        """Check if either side could capture the opposing king from here"""
+        white_row, white_col = self.white_king_location
+        black_row, black_col = self.black_king_location
+        return self.squareUnderAttack(
+            white_row, white_col, "b"
+        ) or self.squareUnderAttack(black_row, black_col, "w")
+
 
 class CastleRights:
     def __init__(self, wks, bks, wqs, bqs):
@@ -687,6 +951,10 @@ class Move:
         self.end_col = end_sq[1]
         self.piece_moved = board[self.start_row][self.start_col]
         self.piece_captured = board[self.end_row][self.end_col]
+        if is_enpassant_move:
+            # The captured pawn sits beside the start square, not on the end
+            # one
+            self.piece_captured = "bp" if self.piece_moved == "wp" else "wp"
         self.prev_no_progress_count = 0
 
         # Special move flags
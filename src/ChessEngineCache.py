@@ -0,0 +1,160 @@
+"""
+Persistent cache of fairy-stockfish results.
+Scores and best moves live in an SQLite file keyed by the duck-aware FEN
+(without its move counters), the engine limit and the network file, so
+positions analysed in an earlier run, or by another Pool worker, aren't sent
+to the engine again. The file runs in WAL mode for concurrent workers and is
+held to max_entries by dropping the least recently used results.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import chess
+import chess.engine
+
+ENGINE_CACHE_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "engine_cache.sqlite")
+ENGINE_CACHE_ENTRIES = 1000000
+EVICT_INTERVAL = 1000  # puts between size checks
+EVICT_FRACTION = 0.1  # share of max_entries dropped when over the cap
+BUSY_TIMEOUT_MS = 30000  # wait for another worker's write to finish
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    cp INTEGER,
+    mate INTEGER,
+    best_move TEXT,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+def positionKey(fen):
+    """A duck FEN without the halfmove and fullmove counters"""
+    return " ".join(fen.split()[:4])
+
+
+def networkKey(options=None):
+    """The network an engine with these UCI options evaluates with"""
+    eval_file = (options or {}).get("EvalFile")
+    if not eval_file:
+        return "builtin"
+    try:
+        size = os.path.getsize(eval_file)
+    except OSError:
+        size = "missing"
+    return f"{os.path.basename(eval_file)}:{size}"
+
+
+def entryKey(fen, limit, network):
+    return f"{positionKey(fen)}|{limit!r}|{network}"
+
+
+class EngineCache:
+    """
+    get() and put() of (white POV chess.engine.PovScore, UCI best move).
+    One connection per process, shared by its threads; open it again
+    after a fork.
+    """
+
+    def __init__(
+            self,
+            path=ENGINE_CACHE_PATH,
+            max_entries=ENGINE_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.puts = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        self.db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, fen, limit, network="builtin"):
+        """(score, best move) stored for the position, or None"""
+        key = entryKey(fen, limit, network)
+        try:
+            with self.lock, self.db:
+                row = self.db.execute(
+                    "SELECT cp, mate, best_move FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self.db.execute(
+                    "UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error:
+            return None  # a cache miss rather than a failed evaluation
+        cp, mate, best_move = row
+        score = chess.engine.Mate(
+            mate) if mate is not None else chess.engine.Cp(cp)
+        return chess.engine.PovScore(score, chess.WHITE), best_move
+
+    def put(self, fen, limit, network, score, best_move=None):
+        """Store a result; score is a chess.engine.PovScore"""
+        white = score.white()
+        try:
+            with self.lock, self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (
+                        entryKey(fen, limit, network),
+                        white.score(),
+                        white.mate(),
+                        best_move,
+                        time.time(),
+                    ),
+                )
+        except sqlite3.Error:
+            return  # the result just isn't kept
+        self.puts += 1
+        if self.puts % EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently used results once over max_entries"""
+        try:
+            excess = len(self) - self.max_entries
+        except sqlite3.Error:
+            return
+        if excess <= 0:
+            return
+        excess += int(self.max_entries * EVICT_FRACTION)
+        try:
+            with self.lock, self.db:
+                self.db.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY used LIMIT ?)",
+                    (excess,),
+                )
+        except sqlite3.Error:
+            pass  # another worker is writing; try again at the next check
+
+    def close(self):
+        self.db.close()
+
+
+_cache = None
+_cache_pid = None
+
+
+def getCache():
+    """This process's connection to the cache at ENGINE_CACHE_PATH"""
+    global _cache, _cache_pid
+    if _cache is None or _cache_pid != os.getpid():
+        # A forked child must not share its parent's connection
+        _cache = EngineCache(ENGINE_CACHE_PATH)
+        _cache_pid = os.getpid()
+    return _cache
@@ -0,0 +1,237 @@
+"""
+Static evaluation shared by the AIs.
+Material and piece-square values live in flat 64-entry tables, and
+GameState keeps a running total of them up to date in makeMove/undoMove,
+so scoring a leaf does not walk the board.
+"""
+
+import numpy as np
+
+# Piece values and position scores remain the same as before
+piece_score = {
+    "K": 0,
+    "Q": 9,
+    "R": 5,
+    "B": 3,
+    "N": 3,
+    "p": 1,
+    "D": 0,
+}  # Duck has 0 value
+
+knight_scores = [
+    [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
+    [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
+    [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
+    [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
+    [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
+    [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
+    [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
+    [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
+]
+
+bishop_scores = [
+    [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+    [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+    [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
+    [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
+    [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
+    [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
+    [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
+    [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+]
+
+rook_scores = [
+    [0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
+    [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
+    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+    [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25],
+]
+
+queen_scores = [
+    [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
+    [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+    [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+    [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+    [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+    [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+    [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
+    [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
+]
+
+pawn_scores = [
+    [0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
+    [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
+    [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
+    [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
+    [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
+    [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
+    [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
+    [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2],
+]
+
+piece_position_scores = {
+    "wN": knight_scores,
+    "bN": knight_scores[::-1],
+    "wB": bishop_scores,
+    "bB": bishop_scores[::-1],
+    "wQ": queen_scores,
+    "bQ": queen_scores[::-1],
+    "wR": rook_scores,
+    "bR": rook_scores[::-1],
+    "wp": pawn_scores,
+    "bp": pawn_scores[::-1],
+}
+
+# Add duck position scores (ducks are best in the center)
+duck_scores = [
+    [0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
+    [0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1],
+    [0.1, 0.2, 0.3, 0.3, 0.3, 0.3, 0.2, 0.1],
+    [0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.1],
+    [0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.1],
+    [0.1, 0.2, 0.3, 0.3, 0.3, 0.3, 0.2, 0.1],
+    [0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1],
+    [0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
+]
+
+piece_position_scores["DD"] = duck_scores
+
+CHECKMATE = 1000
+STALEMATE = 0
+
+# Table entries are whole milli-pawns so the running total is exact
+EVAL_SCALE = 1000
+
+# Bump whenever scores change, so saved search results go stale with them
+EVAL_VERSION = 1
+
+
+def _buildPieceSquareTables():
+    """
+    Flat 64-entry tables (square = row * 8 + col) of material plus position,
+    positive for white pieces and negative for black ones.
+    The duck entry is its centre-control bonus.
+    """
+    tables = {}
+    for color, sign in (("w", 1), ("b", -1)):
+        for kind in "pRNBQK":
+            piece = color + kind
+            position = piece_position_scores.get(piece)
+            tables[piece] = [
+                sign
+                * round(
+                    (piece_score[kind] + (position[row][col] if position else 0))
+                    * EVAL_SCALE
+                )
+                for row in range(8)
+                for col in range(8)
+            ]
+    # Small bonus for good duck position
+    tables["DD"] = [
+        round(duck_scores[row][col] * 0.3 * EVAL_SCALE)
+        for row in range(8)
+        for col in range(8)
+    ]
+    return tables
+
+
+PIECE_SQUARE_TABLES = _buildPieceSquareTables()
+
+
+def evaluateBoard(board):
+    """Material + position total of a board in milli-pawns, from scratch"""
+    total = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece != "--":
+                total += PIECE_SQUARE_TABLES[piece][row * 8 + col]
+    return total
+
+
+# Small integer code per piece for batched scoring; 0 is an empty square
+PIECE_CODES = {"--": 0}
+PIECE_CODES.update(
+    {piece: code for code, piece in enumerate(PIECE_SQUARE_TABLES, 1)})
+PIECE_SQUARE_MATRIX = np.array(
+    [[0] * 64] + [PIECE_SQUARE_TABLES[piece] for piece in PIECE_CODES if piece != "--"]
+)
+
+
+def boardCodes(board):
+    """The board as 64 piece codes, square = row * 8 + col"""
+    return [PIECE_CODES[piece] for row in board for piece in row]
+
+
+def scoreBoards(codes):
+    """
+    Material + position of many boards at once, in pawns (white positive).
+    codes is an (N, 64) array of boardCodes rows.
+    """
+    codes = np.asarray(codes)
+    return PIECE_SQUARE_MATRIX[codes, np.arange(64)].sum(axis=1) / EVAL_SCALE
+
+
+def scoreBoard(game_state):
+    """
+    Score the board. A positive score is good for white, a negative score is good for black.
+    Now considers duck position in evaluation.
+    """
+    if game_state.game_over:
+        if game_state.winner == "w":
+            return CHECKMATE
+        elif game_state.winner == "b":
+            return -CHECKMATE
+        else:
+            return STALEMATE  # 平局
+
+    if game_state.nnue is not None:
+        return game_state.nnue.evaluate()  # in-process network, if attached
+    return game_state.eval_score / EVAL_SCALE
+
+
+class EvalCache:
+    """
+    Fixed-size hash table of static evaluations keyed by
+    GameState.positionKey(), kept apart from any search transposition table.
+    A slot is simply overwritten on collision, which is the cheapest policy
+    and good enough for leaf scores. hits/misses count every lookup.
+    """
+
+    def __init__(self, size=1 << 16):
+        size = 1 << (max(1, size).bit_length() - 1)  # round down to 2^n
+        self.mask = size - 1
+        self.keys = [None] * size
+        self.scores = [0] * size
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.mask + 1
+
+    def get(self, key):
+        """Return the cached score for key, or None"""
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        self.misses += 1
+        return None
+
+    def put(self, key, score):
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self.keys = [None] * len(self)
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,518 @@
+"""
+Fairy-Stockfish engine pool.
+Starting the binary and loading its network costs far more than the short
+searches asked of it, so every process keeps long-lived engines, configured
+once per set of options, and lends them out with engine(). An engine starts
+a new game (ucinewgame) each time it is lent out.
+DuckSession follows one game under the engine's own duck-chess rules.
+evaluate_many() is the asyncio side: it analyses many positions at once on
+several engines driven by one event loop, so waiting for an engine's output
+blocks nothing else. evaluateMany() and submitMany() run it on a background
+loop for synchronous callers.
+"""
+
+import asyncio
+import atexit
+import contextlib
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+import chess.engine
+
+FAIRY_STOCKFISH_PATH = (
+    os.path.join(".", "fairy-stockfish.exe")
+    if sys.platform == "win32"
+    else (
+        os.path.join(".", "fairy-stockfish_x86-64")
+        if sys.platform.startswith("linux")
+        else None
+    )
+)
+POOL_SIZE = 1  # engines per set of options in each process
+ASYNC_ENGINES = 4  # engines analysing at once for evaluate_many()
+ENGINE_TIMEOUT = 10  # seconds to start an engine
+DUCK_VARIANT = "duck"  # UCI_Variant of Fairy-Stockfish builds with duck chess
+
+# A dead engine raises one of these; it is dropped instead of lent out again
+ENGINE_ERRORS = (
+    chess.engine.EngineError,
+    chess.engine.EngineTerminatedError,
+    TimeoutError,
+)
+
+
+class _LentEngine:
+    """
+    An engine for the length of one loan. analyse() and play() pass
+    python-chess a game object of the loan's own, and python-chess sends
+    ucinewgame whenever that object changes, so each loan starts a new game.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.game = object()
+
+    def analyse(self, board, limit, **kwargs):
+        kwargs.setdefault("game", self.game)
+        return self.engine.analyse(board, limit, **kwargs)
+
+    def play(self, board, limit, **kwargs):
+        kwargs.setdefault("game", self.game)
+        return self.engine.play(board, limit, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+
+class EnginePool:
+    """
+    Up to size engines of one binary and options. Engines start on first
+    use; a caller waits when all of them are lent out.
+    """
+
+    def __init__(
+            self,
+            options=None,
+            size=POOL_SIZE,
+            path=FAIRY_STOCKFISH_PATH):
+        self.options = dict(options or {})
+        self.size = size
+        self.path = path
+        self.idle = queue.LifoQueue()  # the last engine used is warmest
+        self.engines = []
+        self.lock = threading.Lock()
+
+    def _start(self):
+        engine = chess.engine.SimpleEngine.popen_uci(
+            self.path, timeout=ENGINE_TIMEOUT)
+        try:
+            if self.options:
+                engine.configure(self.options)
+        except BaseException:
+            engine.quit()
+            raise
+        return engine
+
+    def _take(self):
+        while True:
+            with self.lock:
+                try:
+                    return self.idle.get_nowait()
+                except queue.Empty:
+                    pass
+                if len(self.engines) < self.size:
+                    engine = self._start()
+                    self.engines.append(engine)
+                    return engine
+            # Wait for a lent engine, or for a dropped one to be replaced
+            try:
+                return self.idle.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _drop(self, engine):
+        with self.lock:
+            self.engines.remove(engine)
+        try:
+            engine.close()
+        except Exception:
+            pass
+
+    @contextlib.contextmanager
+    def engine(self):
+        """with pool.engine() as engine: a configured engine in a new game"""
+        engine = self._take()
+        try:
+            yield _LentEngine(engine)
+        except ENGINE_ERRORS:
+            self._drop(engine)
+            raise
+        except BaseException:
+            self.idle.put(engine)
+            raise
+        self.idle.put(engine)
+
+    def close(self):
+        with self.lock:
+            engines, self.engines = self.engines, []
+        for engine in engines:
+            try:
+                engine.quit()
+            except Exception:
+                engine.close()
+
+
+class DuckSession:
+    """
+    One engine set to the duck variant, following a game. A position is
+    sent as the game's start FEN and its turns in Fairy-Stockfish's duck
+    notation (e2e4,e4d5: the piece move, then its square and the duck's),
+    so the engine's hash and game history carry over from move to move and
+    ucinewgame is only sent for another game. A chess.Board can't hold duck
+    moves, so the session speaks UCI itself instead of through python-chess.
+    """
+
+    def __init__(self, options=None, path=FAIRY_STOCKFISH_PATH):
+        self.options = dict(options or {})
+        self.path = path
+        self.process = None
+        self.lines = None  # engine output, None once it has exited
+        self.supported = None  # whether the engine has DUCK_VARIANT
+        self.game = None
+        self.start_fen = None
+        self.lock = threading.Lock()
+
+    def _send(self, line):
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+
+    def _readUntil(self, command, timeout=ENGINE_TIMEOUT):
+        """Engine output up to and including the first line of command"""
+        lines = []
+        while True:
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"engine sent no {command}") from None
+            if line is None:
+                raise chess.engine.EngineTerminatedError("engine exited")
+            lines.append(line)
+            if line.split(" ", 1)[0] == command:
+                return lines
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            [self.path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        lines = self.lines = queue.Queue()
+
+        def pump(stdout=self.process.stdout):
+            for line in stdout:
+                lines.put(line.strip())
+            lines.put(None)
+
+        threading.Thread(target=pump, daemon=True).start()
+        try:
+            self._send("uci")
+            variants = []
+            for line in self._readUntil("uciok"):
+                if line.startswith("option name UCI_Variant "):
+                    variants = [v.strip() for v in line.split(" var ")[1:]]
+            self.supported = DUCK_VARIANT in variants
+            if not self.supported:
+                self.close()
+                return
+            self._send(f"setoption name UCI_Variant value {DUCK_VARIANT}")
+            for name, value in self.options.items():
+                if isinstance(value, bool):
+                    value = str(value).lower()
+                self._send(f"setoption name {name} value {value}")
+            self._send("isready")
+            self._readUntil("readyok")
+        except BaseException:
+            self.close()
+            raise
+
+    def available(self):
+        """Start the engine if needed; False when it has no duck variant"""
+        with self.lock:
+            if self.supported is None:
+                try:
+                    self._start()
+                except (*ENGINE_ERRORS, OSError):
+                    self.supported = False
+            return self.supported
+
+    def play(self, start_fen, moves, limit, game=None):
+        """
+        (best turn in duck notation or None, chess.engine.PovScore or None)
+        after moves from start_fen, searched within limit. game is any
+        object standing for the game, like python-chess's game argument:
+        ucinewgame is sent when it or the start position changes.
+        """
+        go = []
+        if limit.time is not None:
+            go += ["movetime", str(max(1, round(limit.time * 1000)))]
+        if limit.nodes is not None:
+            go += ["nodes", str(limit.nodes)]
+        if limit.depth is not None:
+            go += ["depth", str(limit.depth)]
+        if not go:
+            raise ValueError("limit needs a time, node or depth bound")
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.close()
+                self._start()
+                if not self.supported:
+                    raise chess.engine.EngineError(
+                        f"engine has no {DUCK_VARIANT} variant"
+                    )
+            try:
+                if game is not self.game or start_fen != self.start_fen:
+                    self._send("ucinewgame")
+                    self.game, self.start_fen = game, start_fen
+                position = f"position fen {start_fen}"
+                if moves:
+                    position += " moves " + " ".join(moves)
+                self._send(position)
+                self._send("go " + " ".join(go))
+                lines = self._readUntil(
+                    "bestmove", (limit.time or 0) + ENGINE_TIMEOUT)
+            except (*ENGINE_ERRORS, OSError):
+                self.close()
+                raise
+        score = None
+        for line in lines:
+            tokens = line.split()
+            if tokens[0] == "info" and "score" in tokens:
+                i = tokens.index("score")
+                kind, value = tokens[i + 1], int(tokens[i + 2])
+                score = (chess.engine.Cp(value) if kind ==
+                         "cp" else chess.engine.Mate(value))
+        # Each duck-notation move is a whole turn, so turns alternate
+        white = (start_fen.split()[1] == "w") == (len(moves) % 2 == 0)
+        _, *best = lines[-1].split()
+        return (
+            best[0] if best and best[0] != "(none)" else None,
+            None if score is None else chess.engine.PovScore(score, white),
+        )
+
+    def close(self):
+        process, self.process = self.process, None
+        self.game = self.start_fen = None
+        if process is None:
+            return
+        try:
+            process.stdin.write("quit\n")
+            process.stdin.flush()
+            process.wait(ENGINE_TIMEOUT)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            process.kill()
+
+
+_pools = {}  # sorted option items -> EnginePool, for the process in _pid
+_sessions = {}  # sorted option items -> DuckSession, for the same process
+_pid = None
+_pools_lock = threading.Lock()
+
+
+def _checkProcess():
+    """Forget a parent's engines in a forked child; hold _pools_lock"""
+    global _pid
+    if _pid != os.getpid():
+        # A forked child can't use its parent's engines
+        _pools.clear()
+        _sessions.clear()
+        _pid = os.getpid()
+        threading.Thread(target=_closeAtExit, daemon=True).start()
+
+
+def getPool(options=None):
+    """This process's pool for the given engine options"""
+    key = tuple(sorted((options or {}).items()))
+    with _pools_lock:
+        _checkProcess()
+        if key not in _pools:
+            _pools[key] = EnginePool(options)
+        return _pools[key]
+
+
+def engine(options=None):
+    """with ChessFairy.engine(options) as engine: lend one from getPool()"""
+    return getPool(options).engine()
+
+
+def duckSession(options=None):
+    """This process's DuckSession for the given engine options"""
+    key = tuple(sorted((options or {}).items()))
+    with _pools_lock:
+        _checkProcess()
+        if key not in _sessions:
+            _sessions[key] = DuckSession(options)
+        return _sessions[key]
+
+
+# ───────────────────────── asyncio ─────────────────────────
+
+
+class AsyncEnginePool:
+    """
+    EnginePool for one event loop: up to size engines started with
+    chess.engine.popen_uci, each analysing one position at a time
+    """
+
+    def __init__(
+            self,
+            options=None,
+            size=ASYNC_ENGINES,
+            path=FAIRY_STOCKFISH_PATH):
+        self.options = dict(options or {})
+        self.size = size
+        self.path = path
+        self.idle = asyncio.LifoQueue()  # engines, or None for a free slot
+        self.engines = []  # (transport, protocol) of every live engine
+        self.slots = 0  # engines started, counting free slots
+
+    async def _start(self):
+        transport, protocol = await asyncio.wait_for(
+            chess.engine.popen_uci(self.path), ENGINE_TIMEOUT
+        )
+        try:
+            if self.options:
+                await protocol.configure(self.options)
+        except BaseException:
+            transport.close()
+            raise
+        self.engines.append((transport, protocol))
+        return transport, protocol
+
+    async def _take(self):
+        if self.idle.empty() and self.slots < self.size:
+            self.slots += 1
+            try:
+                return await self._start()
+            except BaseException:
+                self.slots -= 1
+                raise
+        engine = await self.idle.get()
+        if engine is None:
+            try:
+                return await self._start()
+            except BaseException:
+                self.idle.put_nowait(None)
+                raise
+        return engine
+
+    async def analyse(self, board, limit):
+        """Analyse board on an idle engine, as a new game"""
+        engine = await self._take()
+        try:
+            info = await engine[1].analyse(board, limit, game=object())
+        except ENGINE_ERRORS:
+            # Drop the engine; the next taker starts one in its slot
+            self.engines.remove(engine)
+            engine[0].close()
+            self.idle.put_nowait(None)
+            raise
+        except BaseException:
+            self.idle.put_nowait(engine)
+            raise
+        self.idle.put_nowait(engine)
+        return info
+
+    async def close(self):
+        engines, self.engines = self.engines, []
+        for transport, protocol in engines:
+            try:
+                await asyncio.wait_for(protocol.quit(), ENGINE_TIMEOUT)
+            except Exception:
+                transport.close()
+
+
+_async_pools = {}  # (event loop, sorted option items) -> AsyncEnginePool
+
+
+async def evaluate_many(
+        positions,
+        limit,
+        concurrency=ASYNC_ENGINES,
+        options=None):
+    """
+    Engine analysis (an InfoDict, or None if the engine failed) of every
+    position, a chess.Board or FEN, in order. At most concurrency positions
+    are analysed at once; engines are kept per options for later calls.
+    """
+    key = asyncio.get_running_loop(), tuple(sorted((options or {}).items()))
+    if key not in _async_pools:
+        _async_pools[key] = AsyncEnginePool(options, max(1, concurrency))
+    pool = _async_pools[key]
+    pool.size = max(pool.size, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def evaluate(position):
+        async with semaphore:
+            try:
+                if isinstance(position, str):
+                    position = chess.Board(position)
+                return await pool.analyse(position, limit)
+            except (*ENGINE_ERRORS, asyncio.TimeoutError, OSError, ValueError):
+                return None
+
+    return await asyncio.gather(*(evaluate(p) for p in positions))
+
+
+_loop = None  # background event loop of _loop_pid for the sync wrappers
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def _backgroundLoop():
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            # A forked child has the loop object but not its thread
+            _async_pools.clear()
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+        return _loop
+
+
+def submitMany(positions, limit, concurrency=ASYNC_ENGINES, options=None):
+    """
+    Start evaluate_many() on the background loop and return a
+    concurrent.futures.Future of its result, leaving the caller free
+    """
+    return asyncio.run_coroutine_threadsafe(
+        evaluate_many(list(positions), limit, concurrency, options),
+        _backgroundLoop(),
+    )
+
+
+def evaluateMany(positions, limit, concurrency=ASYNC_ENGINES, options=None):
+    """evaluate_many() for synchronous code"""
+    return submitMany(positions, limit, concurrency, options).result()
+
+
+def _closeAtExit():
+    """
+    Each SimpleEngine runs a non-daemon thread, which the interpreter waits
+    for before atexit handlers run; close the engines once the main thread
+    is done instead, or the process never exits.
+    """
+    threading.main_thread().join()
+    closeAll()
+
+
+@atexit.register
+def closeAll():
+    with _pools_lock:
+        if _pid == os.getpid():
+            pools = list(_pools.values()) + list(_sessions.values())
+            _pools.clear()
+            _sessions.clear()
+            for pool in pools:
+                pool.close()
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            return
+        async_pools = [
+            pool for (loop, _), pool in _async_pools.items() if loop is _loop
+        ]
+        _async_pools.clear()
+        for pool in async_pools:
+            try:
+                asyncio.run_coroutine_threadsafe(pool.close(), _loop).result(
+                    ENGINE_TIMEOUT
+                )
+            except Exception:
+                pass
+        _loop.call_soon_threadsafe(_loop.stop)
@@ -0,0 +1,388 @@
+"""
+Monte Carlo Tree Search player for Duck Chess.
+Every GameState move is one tree edge, so a turn is a piece move edge
+followed by a duck move edge. Children are picked with PUCT, using cheap
+move priors (SEE for piece moves, duck square scores for duck moves) to
+tame the huge duck branching factor. Leaves are scored by a short capture
+search, in batches that can be shared out to a pool of worker processes.
+"""
+
+import math
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import ChessAI
+import chessAi_handcraft
+import ChessStats
+import ChessTablebase
+from ChessEval import CHECKMATE
+
+MCTS_PLAYOUTS = 1000  # playouts per move (None for time only)
+MCTS_TIME = None  # seconds per move (None for playouts only)
+BATCH_SIZE = 8  # leaves evaluated together, per worker
+C_PUCT = 1.5  # exploration weight
+VIRTUAL_LOSS = 1  # visits (each a loss) added to a path until it is scored
+FIRST_PLAY_URGENCY = 0.0  # value of an unvisited child
+VALUE_SCALE = 3  # pawns; leaf value = tanh(score / VALUE_SCALE)
+PIECE_PRIOR_TEMPERATURE = 2  # pawns of SEE per e-fold of prior
+DUCK_PRIOR_TEMPERATURE = 1  # duck square score per e-fold of prior
+PROMOTION_BONUS = 8  # prior logit of a promotion, in pawns
+
+# Worker-side copy of the root position, keyed by search id
+_root = (None, None)
+
+
+def evaluateLeaf(game_state):
+    """
+    Value of a position in [-1, 1] for the side to move.
+    A piece-move position is scored with the handcraft capture search; in
+    a duck phase the duck goes to its best heuristic square first.
+    """
+    if game_state.duck_move_phase:
+        duck_moves = game_state.getValidMoves()
+        if not duck_moves:
+            return 0.0
+        scores = ChessAI.duckSquareScores(game_state)
+        squares = [m.end_row * 8 + m.end_col for m in duck_moves]
+        game_state.makeMove(duck_moves[int(np.argmax(scores[squares]))])
+        value = -evaluateLeaf(game_state)
+        game_state.undoMove()
+        return value
+
+    color = 1 if game_state.white_to_move else -1
+    score = chessAi_handcraft.quiescence(
+        game_state, -CHECKMATE, CHECKMATE, color)
+    return math.tanh(score / VALUE_SCALE)
+
+
+def evaluatePath(game_state, path):
+    """evaluateLeaf after playing path from game_state, which is restored"""
+    for move in path:
+        game_state.makeMove(move)
+    value = evaluateLeaf(game_state)
+    for _ in path:
+        game_state.undoMove()
+    return value
+
+
+def _evaluateBatch(search_id, root_bytes, paths):
+    """Worker task: leaf values and the CPU time spent on them"""
+    global _root
+    if _root[0] != search_id:
+        _root = (search_id, pickle.loads(root_bytes))
+    started = time.process_time()
+    values = [evaluatePath(_root[1], path) for path in paths]
+    return values, time.process_time() - started
+
+
+def _warmUp():
+    return os.getpid()
+
+
+def movePriors(game_state, moves):
+    """Softmax over cheap move scores, one prior per move"""
+    if game_state.duck_move_phase:
+        scores = ChessAI.duckSquareScores(game_state)
+        logits = np.array(
+            [scores[m.end_row * 8 + m.end_col] for m in moves], dtype=float
+        )
+        logits /= DUCK_PRIOR_TEMPERATURE
+    else:
+        logits = np.zeros(len(moves))
+        for i, move in enumerate(moves):
+            if move.is_capture:
+                logits[i] = game_state.see(move)
+            if move.is_pawn_promotion:
+                logits[i] += PROMOTION_BONUS
+        logits /= PIECE_PRIOR_TEMPERATURE
+    priors = np.exp(logits - logits.max())
+    return priors / priors.sum()
+
+
+class Node:
+    """
+    A position in the tree with per-child statistics.
+    values[i] sums the results of child i from the point of view of the
+    side to move here (the duck is moved by the same side as the piece).
+    """
+
+    __slots__ = (
+        "moves",
+        "priors",
+        "visits",
+        "values",
+        "children",
+        "white_to_move",
+        "key",
+        "terminal",
+    )
+
+    def __init__(self, game_state):
+        self.white_to_move = game_state.white_to_move
+        self.key = game_state.positionKey()
+        self.children = {}
+        self.terminal = None  # value for the side to move once the game ends
+        self.moves = [] if game_state.game_over else game_state.getValidMoves()
+        if game_state.game_over or not self.moves:
+            if game_state.winner is None:
+                self.terminal = 0.0
+            else:
+                won = (game_state.winner == "w") == self.white_to_move
+                self.terminal = 1.0 if won else -1.0
+            self.moves = []
+        self.priors = movePriors(game_state, self.moves) if self.moves else []
+        self.visits = np.zeros(len(self.moves))
+        self.values = np.zeros(len(self.moves))
+
+    def select(self):
+        """Index of the child with the best PUCT score"""
+        q = np.divide(
+            self.values,
+            self.visits,
+            out=np.full(len(self.moves), FIRST_PLAY_URGENCY),
+            where=self.visits > 0,
+        )
+        u = C_PUCT * self.priors * math.sqrt(self.visits.sum() + 1)
+        return int(np.argmax(q + u / (1 + self.visits)))
+
+
+class MCTSPlayer:
+    """
+    An MCTS player that keeps its tree between moves of one game.
+    workers > 1 evaluates leaf batches on a pool of warm processes; with
+    fewer the leaves are scored in this process (as inside a Pool worker,
+    which can't start processes of its own). cpu_time adds up the CPU
+    seconds spent by the search and its workers, for strength per
+    CPU-second comparisons.
+    """
+
+    def __init__(
+            self,
+            workers=0,
+            playouts=MCTS_PLAYOUTS,
+            time_limit=MCTS_TIME):
+        self.workers = workers
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.root = None
+        self.root_ply = 0
+        self.search_id = 0
+        self.stop = False
+        self.cpu_time = 0.0
+
+        self.executor = None
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            for future in [self.executor.submit(
+                    _warmUp) for _ in range(workers)]:
+                future.result()
+
+    def findBestMove(self, game_state, valid_moves, return_queue):
+        """Same contract as chessAi_handcraft.findBestMove"""
+        stats = ChessStats.begin()
+        move, source = chessAi_handcraft.presearchMove(game_state, valid_moves)
+        if move is not None:
+            return_queue.put(move)
+            return ChessStats.end(stats, source)
+        return_queue.put(self.search(game_state, valid_moves))
+        return ChessStats.end(stats)
+
+    def search(self, game_state, valid_moves, playouts=None, time_limit=None):
+        """Run the playouts and return the most visited move (piece or duck)"""
+        playouts = self.playouts if playouts is None else playouts
+        time_limit = self.time_limit if time_limit is None else time_limit
+        if not valid_moves:
+            return None
+
+        started = time.monotonic()
+        cpu_started = time.thread_time()
+        deadline = None if time_limit is None else started + time_limit
+        move = self.begin(game_state, valid_moves)
+        if move is not None or not self.root.moves:
+            return move
+
+        root_bytes = None
+        if self.executor is not None:
+            root_bytes = pickle.dumps(game_state)
+
+        done = 0
+        batch_size = BATCH_SIZE * max(1, self.workers)
+        while not self.stop:
+            if playouts is not None and done >= playouts:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if playouts is None and deadline is None:
+                break  # no budget at all
+
+            size = batch_size if playouts is None else min(
+                batch_size, playouts - done)
+            batch = self.selectBatch(game_state, size)
+            done += size
+            self.backupBatch(
+                batch, self._evaluate(
+                    game_state, root_bytes, batch))
+
+        self.cpu_time += time.thread_time() - cpu_started
+        return self.bestMove()
+
+    def begin(self, game_state, valid_moves):
+        """
+        Get the tree ready for a new move. Returns a move that needs no
+        search (a king capture or a tablebase move), otherwise None.
+        """
+        self.stop = False
+        self.search_id += 1
+        enemy_king = "bK" if game_state.white_to_move else "wK"
+        for move in valid_moves:
+            if move.piece_captured == enemy_king and not move.is_duck_move:
+                return move
+        tablebase_move = ChessTablebase.tablebaseMove(game_state, valid_moves)
+        if tablebase_move is not None:
+            return tablebase_move
+        self._reuseRoot(game_state)
+        return None
+
+    def selectBatch(self, game_state, size, on_leaf=None):
+        """
+        Select size leaves under virtual loss. Game-over leaves are backed up
+        at once; the rest are returned to be scored and passed to
+        backupBatch. on_leaf(game_state) is called at each of those, while
+        the position is on the board.
+        """
+        batch = []
+        for _ in range(size):
+            path, moves, leaf = self._selectLeaf(
+                game_state, self.root, on_leaf)
+            if leaf.terminal is not None:
+                self._backup(path, leaf.white_to_move, leaf.terminal)
+            else:
+                batch.append((path, moves, leaf))
+        return batch
+
+    def backupBatch(self, batch, values):
+        """Back up leaf values (for each leaf's side to move) from selectBatch"""
+        for (path, _, leaf), value in zip(batch, values):
+            self._backup(path, leaf.white_to_move, value)
+
+    def bestMove(self, temperature=0):
+        """
+        The most visited move at the root, or with temperature > 0 a move
+        drawn with odds of visits ** (1 / temperature), for varied play
+        """
+        if self.root is None or not self.root.moves:
+            return None
+        visits = self.root.visits
+        if temperature > 0 and visits.sum() > 0:
+            weights = visits ** (1 / temperature)
+            index = np.random.choice(len(visits), p=weights / weights.sum())
+            return self.root.moves[int(index)]
+        return self.root.moves[int(np.argmax(visits))]
+
+    def _reuseRoot(self, game_state):
+        """Walk the old tree down the moves played since, or start afresh"""
+        node = self.root
+        move_log = game_state.move_log
+        if node is None or self.root_ply > len(move_log):
+            node = None
+        else:
+            for move in move_log[self.root_ply:]:
+                if move not in node.moves:
+                    node = None
+                    break
+                node = node.children.get(node.moves.index(move))
+                if node is None:
+                    break
+        if node is None or node.key != game_state.positionKey():
+            node = Node(game_state)
+        self.root, self.root_ply = node, len(move_log)
+        return node
+
+    def _selectLeaf(self, game_state, root, on_leaf=None):
+        """
+        Descend by PUCT to a new (or terminal) node, adding virtual loss on
+        the way so the rest of the batch spreads out.
+        """
+        path, moves = [], []
+        node = root
+        while node.terminal is None:
+            i = node.select()
+            node.visits[i] += VIRTUAL_LOSS
+            node.values[i] -= VIRTUAL_LOSS
+            path.append((node, i))
+            move = node.moves[i]
+            game_state.makeMove(move)
+            moves.append(move)
+            child = node.children.get(i)
+            if child is None:
+                child = node.children[i] = Node(game_state)
+                stats = ChessStats.current
+                if stats is not None:
+                    if game_state.duck_move_phase:
+                        stats.duck_nodes += 1
+                    else:
+                        stats.piece_nodes += 1
+                    stats.depth = max(stats.depth, len(moves))
+                node = child
+                break
+            node = child
+        if on_leaf is not None and node.terminal is None:
+            on_leaf(game_state)
+        for _ in moves:
+            game_state.undoMove()
+        return path, moves, node
+
+    def _backup(self, path, leaf_white_to_move, value):
+        """Add a leaf value up the path and take back its virtual loss"""
+        for node, i in path:
+            own = node.white_to_move == leaf_white_to_move
+            node.visits[i] += 1 - VIRTUAL_LOSS
+            node.values[i] += (value if own else -value) + VIRTUAL_LOSS
+
+    def _evaluate(self, game_state, root_bytes, batch):
+        """Leaf values for a batch, in order"""
+        if not batch:
+            return []
+        paths = [moves for _, moves, _ in batch]
+        if self.executor is None:
+            return [evaluatePath(game_state, path) for path in paths]
+
+        chunk = math.ceil(len(paths) / self.workers)
+        futures = [
+            self.executor.submit(
+                _evaluateBatch,
+                self.search_id,
+                root_bytes,
+                paths[i: i + chunk],
+            )
+            for i in range(0, len(paths), chunk)
+        ]
+        values = []
+        for future in futures:
+            chunk_values, cpu_seconds = future.result()
+            values.extend(chunk_values)
+            self.cpu_time += cpu_seconds
+        return values
+
+    def reset(self):
+        """Forget the tree, e.g. when a new game starts"""
+        self.root = None
+        self.root_ply = 0
+
+    def cancel(self):
+        """Stop the current search after its batch; it returns its best move"""
+        self.stop = True
+
+    def close(self):
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
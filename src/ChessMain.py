@@ -4,14 +4,16 @@ Handling user input.
 Displaying current GameStatus object.
 """
 
+import copy
 import functools
+import json
 import os
 import queue
 import random
 import sys
-from multiprocessing import Pool, Process, Queue, cpu_count
+import threading
+from multiprocessing import Event, Pool, Process, Queue, cpu_count
 
-import chess.engine
 import matplotlib.pyplot as plt
 import numpy as np
 import pygame as p
@@ -19,7 +21,16 @@ from tqdm import tqdm
 
 import ChessAI
 import chessAi_handcraft
+import ChessBroker
+import ChessControl
 import ChessEngine
+import ChessMCTS
+import ChessParallel
+import ChessPonder
+import ChessScoring
+import ChessSelfPlay
+import ChessStats
+import ChessTT
 
 BOARD_WIDTH = BOARD_HEIGHT = 512
 MOVE_LOG_PANEL_WIDTH = 250
@@ -58,12 +69,14 @@ def loadImages():
 
 
 def is_ai_player(player_type):
-    return player_type in ("ai_random", "ai_handcraft", "ai_nnue")
+    return player_type in ("ai_random", "ai_handcraft", "ai_nnue", "ai_mcts")
 
 
 def run_ai_vs_ai(game_state, player_one, player_two):
     import queue
 
+    # One MCTS player (and tree) per side
+    mcts_players = {}
     while not game_state.game_over:
         white_to_move = game_state.white_to_move
         player_type = player_one if white_to_move else player_two
@@ -76,6 +89,10 @@ def run_ai_vs_ai(game_state, player_one, player_two):
             q = queue.Queue()
             ChessAI.findRandomMove(valid_moves, q)
             move = q.get()
+        elif player_type == "ai_mcts":
+            if white_to_move not in mcts_players:
+                mcts_players[white_to_move] = ChessMCTS.MCTSPlayer()
+            move = mcts_players[white_to_move].search(game_state, valid_moves)
         else:
             mode = player_type.split("_")[1]  # 'handcraft' or 'nnue'
             q = queue.Queue()
@@ -102,11 +119,16 @@ def run_ai_vs_ai(game_state, player_one, player_two):
         print("Game ended in a draw.")
 
 
-def main(player_one, player_two, visualize_game=True):
-    # 'human', 'ai_random', 'ai_handcraft', 'ai_nnue'
+def main(player_one, player_two, visualize_game=True, ai_workers=0,
+         ponder=False):
+    # 'human', 'ai_random', 'ai_handcraft', 'ai_nnue', 'ai_mcts'
     # player_one = "ai_handcraft"  # white
     # player_two = "ai_random"  # black
     # visualize_game = True  # True to show pygame UI, False to run silently
+    # ai_workers > 1 splits the handcraft root search over that many processes
+    # (and scores MCTS leaf batches on that many processes)
+    # ponder searches the AI's answers to the human's likeliest turns while
+    # the human thinks (ai_handcraft / ai_nnue against a human, serial only)
     # if AI vs AI
 
     if visualize_game is False:
@@ -143,6 +165,26 @@ def main(player_one, player_two, visualize_game=True):
     ai_thinking = False
     move_undone = False
     move_finder_process = None
+    thread_searcher = None  # pool or MCTS player behind a search thread
+    search_control = None  # ChessControl.SearchControl of a search process
+    root_search_pool = None
+    if ai_workers > 1 and "ai_handcraft" in (player_one, player_two):
+        root_search_pool = ChessParallel.RootSearchPool(workers=ai_workers)
+    # MCTS players keep their trees between moves, so they live here
+    mcts_players = {}
+    if player_one == "ai_mcts":
+        mcts_players[True] = ChessMCTS.MCTSPlayer(workers=ai_workers)
+    if player_two == "ai_mcts":
+        mcts_players[False] = ChessMCTS.MCTSPlayer(workers=ai_workers)
+    ponderer = None
+    ai_player = player_two if player_one == "human" else player_one
+    if (
+        ponder
+        and "human" in (player_one, player_two)
+        and ai_player in ("ai_handcraft", "ai_nnue")
+        and root_search_pool is None
+    ):
+        ponderer = ChessPonder.Ponderer(mode=ai_player.split("_")[1])
     move_log_font = p.font.SysFont("Arial", 14, False, False)
 
     while running:
@@ -162,6 +204,12 @@ def main(player_one, player_two, visualize_game=True):
 
         for e in p.event.get():
             if e.type == p.QUIT:
+                if root_search_pool is not None:
+                    root_search_pool.close()
+                for mcts_player in mcts_players.values():
+                    mcts_player.close()
+                if ponderer is not None:
+                    ponderer.close()
                 p.quit()
                 sys.exit()
 
@@ -221,8 +269,11 @@ def main(player_one, player_two, visualize_game=True):
                     animate = False
                     game_over = False
                     if ai_thinking:
-                        move_finder_process.terminate()
+                        stopMoveFinder(
+                            move_finder_process, thread_searcher, search_control)
                         ai_thinking = False
+                    if ponderer is not None:
+                        ponderer.stop()
                     move_undone = True
                 if e.key == p.K_r:  # reset the game when 'r' is pressed
                     game_state = ChessEngine.GameState()
@@ -233,30 +284,84 @@ def main(player_one, player_two, visualize_game=True):
                     animate = False
                     game_over = False
                     if ai_thinking:
-                        move_finder_process.terminate()
+                        stopMoveFinder(
+                            move_finder_process, thread_searcher, search_control)
                         ai_thinking = False
+                    if ponderer is not None:
+                        ponderer.stop()
                     move_undone = True
 
         # AI move finder
         if not game_over and not human_turn and not move_undone:
-            if not ai_thinking:
+            pondered_move = None
+            if ponderer is not None and not ai_thinking:
+                pondered_move = ponderer.answer(game_state)
+            if pondered_move is ChessPonder.PENDING:
+                pass  # the ponder is searching this position; let it finish
+            elif pondered_move is not None:
+                game_state.makeMove(pondered_move)
+                move_made = True
+                animate = True
+            elif not ai_thinking:
                 ai_thinking = True
                 return_queue = Queue()
+                search_control = ChessControl.SearchControl(stop_event=Event())
                 current_player = player_one if game_state.white_to_move else player_two
 
                 if current_player == "ai_random":
                     move_finder_process = Process(
                         target=ChessAI.findRandomMove, args=(
                             valid_moves, return_queue))
+                elif current_player == "ai_handcraft" and root_search_pool is not None:
+                    # The pool lives in this process, so search from a thread
+                    # on a private copy of the position
+                    return_queue = queue.Queue()
+                    thread_searcher = root_search_pool
+                    move_finder_process = threading.Thread(
+                        target=root_search_pool.findBestMove,
+                        args=(
+                            copy.deepcopy(game_state),
+                            valid_moves,
+                            return_queue,
+                        ),
+                        daemon=True,
+                    )
+                elif current_player == "ai_mcts":
+                    return_queue = queue.Queue()
+                    thread_searcher = mcts_players[game_state.white_to_move]
+                    move_finder_process = threading.Thread(
+                        target=thread_searcher.findBestMove,
+                        args=(
+                            copy.deepcopy(game_state),
+                            valid_moves,
+                            return_queue,
+                        ),
+                        daemon=True,
+                    )
+                elif ponderer is not None:
+                    # Search with the table the ponder has been filling
+                    move_finder_process = Process(
+                        target=ChessPonder.search,
+                        args=(
+                            game_state,
+                            valid_moves,
+                            return_queue,
+                            ponderer.mode,
+                            ponderer.tt_name,
+                            search_control,
+                        ),
+                    )
                 elif current_player == "ai_handcraft":
                     move_finder_process = Process(
                         target=chessAi_handcraft.findBestMove,
-                        args=(game_state, valid_moves, return_queue),
+                        args=(game_state, valid_moves,
+                              return_queue, search_control),
                     )
                 elif current_player == "ai_nnue":
                     move_finder_process = Process(
                         target=ChessAI.findBestMove,
-                        args=(game_state, valid_moves, return_queue, "nnue"),
+                        args=(game_state, valid_moves, return_queue, "nnue",
+                              search_control),
                     )
                 else:
                     raise NameError("no such ai")
@@ -265,7 +370,7 @@ def main(player_one, player_two, visualize_game=True):
                             valid_moves, return_queue))
                 move_finder_process.start()
 
-            if not move_finder_process.is_alive():
+            if ai_thinking and not move_finder_process.is_alive():
                 ai_move = return_queue.get()
                 if ai_move is None:
                     # ai_move = ChessAI.findRandomMove(valid_moves,ai_move)
@@ -283,6 +388,16 @@ def main(player_one, player_two, visualize_game=True):
             move_made = False
             animate = False
             move_undone = False
+            human_to_move = (
+                player_one if game_state.white_to_move else player_two
+            ) == "human"
+            if (
+                ponderer is not None
+                and human_to_move
+                and not game_state.duck_move_phase
+                and not game_state.game_over
+            ):
+                ponderer.start(game_state)
 
         drawGameState(screen, game_state, valid_moves, square_selected)
 
@@ -319,6 +434,19 @@ def main(player_one, player_two, visualize_game=True):
         p.display.flip()
 
 
+def stopMoveFinder(move_finder_process, thread_searcher, search_control):
+    """Stop a running AI search, whether it is a Process or a search thread"""
+    if isinstance(move_finder_process, threading.Thread):
+        # The thread can't be killed; its queue is dropped and the searcher
+        # (parallel pool or MCTS player) abandons the rest of its work
+        thread_searcher.cancel()
+    else:
+        # The search returns within ChessControl.CHECK_INTERVAL nodes and
+        # exits by itself; its move lands on the dropped queue (a random
+        # move finder is done at once anyway)
+        search_control.stop()
+
+
 def drawGameState(screen, game_state, valid_moves, square_selected):
     """
     Responsible for all the graphics within current game state.
@@ -498,39 +626,26 @@ def animateMove(move, screen, board, clock):
         clock.tick(60)
 
 
-def evaluate_position_with_fairy_stockfish(game_state):
-    FAIRY_STOCKFISH_PATH = (
-        os.path.join(".", "fairy-stockfish.exe")
-        if sys.platform == "win32"
-        else (
-            os.path.join(".", "fairy-stockfish_x86-64")
-            if sys.platform.startswith("linux")
-            else None
-        )
-    )
-    fen = ChessAI.convert_to_fen(game_state)
-    board = chess.Board(fen)
-    try:
-        with chess.engine.SimpleEngine.popen_uci(FAIRY_STOCKFISH_PATH) as engine:
-            result = engine.analyse(board, chess.engine.Limit(depth=5))
-            score = result["score"]
-
-            if score.is_mate():
-                # Use score.white().mate() if you want White's POV, or
-                # score.relative.mate() for side-to-move POV
-                mate_val = score.white().mate()
-                eval_score = 100000 if mate_val > 0 else -100000
-            else:
-                eval_score = score.white().score()
-        return eval_score
-    except Exception as e:
-        print(f"[Error] 評估失敗：{e} 在chessMain.py")
-        return 0
-
-
-def run_single_game(dummy_arg, player_one, player_two):
+def run_single_game(
+    dummy_arg,
+    player_one,
+    player_two,
+    root_search_pool=None,
+    mcts_players=None,
+    collect_stats=False,
+):
+    # Returns the result label and the recorded moves, which
+    # ChessScoring scores apart from play (or not at all).
+    # collect_stats: also return the summed ChessStats.SearchStats of each
+    # side, {"White": ..., "Black": ...}, as a third value
     game_state = ChessEngine.GameState()
-    step_scores = []
+    moves = []
+    ChessStats.enable(collect_stats)
+    side_stats = {"White": ChessStats.SearchStats(),
+                  "Black": ChessStats.SearchStats()}
+    # MCTS players by white_to_move; made per game (in this process) if not
+    # given, since a Pool worker can't start a leaf evaluation pool
+    mcts_players = {} if mcts_players is None else mcts_players
     try:
         while not game_state.game_over:
             white_to_move = game_state.white_to_move
@@ -540,22 +655,35 @@ def run_single_game(dummy_arg, player_one, player_two):
                 break
 
             q = queue.Queue()
+            stats = None  # random moves aren't searched
             if player_type == "ai_random":
                 ChessAI.findRandomMove(valid_moves, q)
             else:
                 mode = player_type.split("_")[1]  # e.g. 'handcraft', 'nnue'
                 if mode == "nnue":
-                    ChessAI.findBestMove(game_state, valid_moves, q, mode=mode)
+                    stats = ChessAI.findBestMove(
+                        game_state, valid_moves, q, mode=mode)
+                elif mode == "handcraft" and root_search_pool is not None:
+                    stats = root_search_pool.findBestMove(
+                        game_state, valid_moves, q)
                 elif mode == "handcraft":
-                    chessAi_handcraft.findBestMove(game_state, valid_moves, q)
+                    stats = chessAi_handcraft.findBestMove(
+                        game_state, valid_moves, q)
+                elif mode == "mcts":
+                    if white_to_move not in mcts_players:
+                        mcts_players[white_to_move] = ChessMCTS.MCTSPlayer()
+                    stats = mcts_players[white_to_move].findBestMove(
+                        game_state, valid_moves, q
+                    )
                 else:
                     raise ValueError("here's bug fix it")
+            if stats is not None:
+                side_stats["White" if white_to_move else "Black"].add(stats)
             move = q.get()
             if move is None:
                 move = valid_moves[0]
             game_state.makeMove(move)
-            step_scores.append(
-                evaluate_position_with_fairy_stockfish(game_state))
+            moves.append(ChessScoring.recordMove(move))
     except Exception as e:
         if "Maximum number of moves" in str(e):
             return "over200"  # "Maximum number of moves (200) exceeded."
@@ -563,14 +691,19 @@ def run_single_game(dummy_arg, player_one, player_two):
             raise  # re-raise any other exceptions
 
     if game_state.winner == "w":
-        return "White", step_scores
+        result = "White", moves
     elif game_state.winner == "b":
-        return "Black", step_scores
+        result = "Black", moves
     else:
-        return "Draw", step_scores
+        result = "Draw", moves
+    if collect_stats:
+        return result + (side_stats,)
+    return result
 
 
-def output_result(results, player_one, player_two):
+def output_result(results, player_one, player_two, step_scores=None):
+    # step_scores: per game, the analysis stage's score (or None) of each ply;
+    # without them only the results are reported, with no plot
 
     counts = {"White": 0, "Black": 0, "Draw": 0, "over200": 0}
 
@@ -582,26 +715,28 @@ def output_result(results, player_one, player_two):
     INVALID_VALUES = {100000, -100000}
 
     # Process the data
-    for label, values in results:
+    for result in results:
+        label = result if isinstance(result, str) else result[0]
         if label in counts:
             counts[label] += 1
         else:
             counts[label] = 1
 
+    for values in step_scores or []:
         for i, val in enumerate(values):
-            if val in INVALID_VALUES:
-                continue  # skip invalid values
+            if val is None or val in INVALID_VALUES:
+                continue  # skip unscored and invalid values
 
             # Extend lists if needed
-            if i >= len(sums):
-                sums.append(val)
-                counts_per_index.append(1)
-            else:
-                sums[i] += val
-                counts_per_index[i] += 1
+            while i >= len(sums):
+                sums.append(0)
+                counts_per_index.append(0)
+            sums[i] += val
+            counts_per_index[i] += 1
 
     # Calculate averages (only where count > 0)
-    averages = [s / c for s, c in zip(sums, counts_per_index)] if sums else []
+    plies = [i + 1 for i, c in enumerate(counts_per_index) if c]
+    averages = [s / c for s, c in zip(sums, counts_per_index) if c]
     num_games = len(results)
     print(f"Out of {num_games} games:")
     print(
@@ -624,7 +759,7 @@ def output_result(results, player_one, player_two):
         # Create the plot
         plt.figure(figsize=(12, 6))
         plt.plot(
-            range(1, len(averages) + 1),
+            plies,
             averages,
             marker="o",
             linestyle="-",
@@ -665,21 +800,145 @@ def output_result(results, player_one, player_two):
         print(f"Plot saved as: {filename}")
 
 
-def run_parallel_games(player_one, player_two, num_games=100, num_workers=4):
+def output_stats(results, player_one, player_two):
+    # Sum the search stats of every game per side (results of run_single_game
+    # with collect_stats), print them and save them as JSON under results/
+    totals = {"White": ChessStats.SearchStats(),
+              "Black": ChessStats.SearchStats()}
+    for result in results:
+        # A bare "over200" (an unfinished game) comes without stats
+        if isinstance(result, str) or len(result) < 3:
+            continue
+        for side, stats in result[2].items():
+            totals[side].add(stats)
+    for side, player in (("White", player_one), ("Black", player_two)):
+        print(f"{side} ({player}) search over {totals[side].moves} moves: "
+              f"{totals[side]}")
+
+    result_dir = os.path.join(os.path.dirname(__file__), "..", "results")
+    os.makedirs(result_dir, exist_ok=True)
+    filename = os.path.join(
+        result_dir, f"{player_one}_vs_{player_two}_stats.json")
+    with open(filename, "w") as f:
+        json.dump({side: stats.asDict() for side, stats in totals.items()},
+                  f, indent=2)
+    print(f"Search stats saved as: {filename}")
+
+
+def init_worker(tt_name=None, broker_path=None):
+    # Pool initializer: search with the parent's shared warm table, and send
+    # engine work to the evaluation broker
+    if tt_name is not None:
+        chessAi_handcraft.transposition_table = (
+            ChessTT.TranspositionTable.attach(tt_name))
+    ChessBroker.connect(broker_path)
+
+
+def run_parallel_games(
+    player_one,
+    player_two,
+    num_games=100,
+    num_workers=4,
+    tt_path=None,
+    collect_stats=False,
+    broker=False,
+    score_every=1,
+):
+    # tt_path: load the search table saved there (if it is still valid) into
+    # shared memory for every worker, and save it back when the games end
+    # collect_stats: also report the search stats of both sides
+    # score_every: score every n-th position of the finished games (1: all
+    # of them) while the other games are played; None only plays the games
+    # broker: True to start an evaluation broker that runs every worker's
+    # fairy-stockfish work on one fixed set of engines, or the socket path of
+    # a running one (python ChessBroker.py)
+    table = None
+    tt_name = None
+    if tt_path is not None:
+        table = ChessTT.loadTable(tt_path, shared=True)
+        tt_name = table.name
+    broker_process = None
+    broker_path = broker if isinstance(broker, str) else None
+    if broker is True:
+        if ChessBroker.BROKER_SUPPORTED:
+            broker_process, broker_path = ChessBroker.start()
+        else:
+            print("[WARN] 評估 broker 需要 UNIX socket，各 worker 自行啟動引擎")
+    # The analysis stage in this process uses the broker's engines too
+    ChessBroker.connect(broker_path)
+
     func = functools.partial(
-        run_single_game, player_one=player_one, player_two=player_two
+        run_single_game,
+        player_one=player_one,
+        player_two=player_two,
+        collect_stats=collect_stats,
+    )
+    try:
+        with Pool(
+            processes=num_workers,
+            initializer=init_worker,
+            initargs=(tt_name, broker_path),
+        ) as pool:
+            results = []
+            scoring = []
+            for result in tqdm(
+                pool.imap_unordered(func, range(num_games)), total=num_games
+            ):
+                results.append(result)
+                if score_every and not isinstance(result, str):
+                    scoring.append(
+                        ChessScoring.submitGames([result[1]], score_every))
+        if table is not None:
+            table.save(tt_path)
+        step_scores = None
+        if score_every:
+            step_scores = [
+                scores for pending in scoring for scores in pending.collect()]
+    finally:
+        if table is not None:
+            table.close()
+        ChessBroker.connect(None)
+        if broker_process is not None:
+            ChessBroker.stop(broker_process)
+    output_result(results, player_one, player_two, step_scores)
+    if collect_stats:
+        output_stats(results, player_one, player_two)
+
+
+def run_lockstep_games(
+    player_one,
+    player_two,
+    num_games=100,
+    num_workers=4,
+    evaluator="material",
+):
+    """
+    Like run_parallel_games, but every worker plays its share of the games
+    side by side and scores their leaves in batches (ai_mcts / ai_random
+    only). Step scores come from the batch evaluator, not fairy-stockfish.
+    """
+    shares = [num_games // num_workers + (i < num_games % num_workers)
+              for i in range(num_workers)]
+    shares = [share for share in shares if share]
+    func = functools.partial(
+        ChessSelfPlay.playGames,
+        player_one=player_one,
+        player_two=player_two,
+        evaluator=evaluator,
     )
     with Pool(processes=num_workers) as pool:
         results = []
-        for result in tqdm(
-            pool.imap_unordered(func, range(num_games)), total=num_games
+        for share in tqdm(
+            pool.imap_unordered(func, shares), total=len(shares)
         ):
-            results.append(result)
-    output_result(results, player_one, player_two)
+            results.extend(share)
+    # Lock-step games come with their evaluator's step scores
+    output_result(results, player_one, player_two,
+                  [values for _, values in results])
 
 
 if __name__ == "__main__":
-    # 'human', 'ai_random', 'ai_handcraft', 'ai_nnue'
+    # 'human', 'ai_random', 'ai_handcraft', 'ai_nnue', 'ai_mcts'
     player_one = "ai_nnue"
     player_two = "ai_random"
 
@@ -688,5 +947,10 @@ if __name__ == "__main__":
         player_one, player_two, num_games=100, num_workers=cpu_count() // 2
     )
 
+    # to stop as soon as the result is clear (SPRT), with Elo and its interval
+    # import ChessMatch
+    # ChessMatch.report([ChessMatch.match(player_one, player_two)],
+    #                   f"{player_one}_vs_{player_two}_match")
+
     # to run the game
     # main(player_one, player_two, visualize_game=True)
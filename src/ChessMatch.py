@@ -0,0 +1,278 @@
+"""
+Matches between AI configurations (player types such as "ai_nnue").
+Games are played in pairs, one with each colour, and a match stops as soon
+as a sequential probability ratio test (SPRT) on its Elo bounds reaches a
+verdict instead of playing a fixed number of games. Every match reports
+the first player's Elo over the second with a 95% confidence interval.
+gauntlet() and roundRobin() run a match for every pairing they make.
+
+The SPRT works on the pentanomial counts of the pairs (their score of 0 to
+2), which stay correct when the two colours aren't equally strong. Its
+log-likelihood ratio uses the usual normal approximation of the
+generalized SPRT, with a Jeffreys prior on the counts so that a few
+lopsided pairs can't end a match alone.
+"""
+
+import functools
+import itertools
+import json
+import math
+import os
+from multiprocessing import Pool, cpu_count
+
+from tqdm import tqdm
+
+ELO0, ELO1 = 0, 10  # H0: elo <= ELO0 against H1: elo >= ELO1
+ALPHA = BETA = 0.05  # false H1 and false H0 rates
+MAX_PAIRS = 500  # game pairs before a match is called inconclusive
+PRIOR = 0.5  # Jeffreys prior: pseudo pairs of every pair score
+Z95 = 1.959964  # two-sided 95% normal quantile
+PAIR_SCORES = (0, 0.25, 0.5, 0.75, 1)  # score per game of 0 to 2 points
+
+RESULT_DIR = os.path.join(os.path.dirname(__file__), "..", "results")
+
+
+def scoreFromElo(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def eloFromScore(score):
+    return -400 * math.log10(1 / score - 1)
+
+
+def gameScore(label, as_white):
+    """The player's points from a run_single_game label ("over200": a draw)"""
+    if label == "White":
+        return 1.0 if as_white else 0.0
+    if label == "Black":
+        return 0.0 if as_white else 1.0
+    return 0.5
+
+
+class MatchResult:
+    """Pairs of one match so far, from player_a's point of view"""
+
+    def __init__(
+        self,
+        player_a,
+        player_b,
+        elo0=ELO0,
+        elo1=ELO1,
+        alpha=ALPHA,
+        beta=BETA,
+    ):
+        self.player_a = player_a
+        self.player_b = player_b
+        self.elo0, self.elo1 = elo0, elo1
+        self.alpha, self.beta = alpha, beta
+        self.pentanomial = [0] * 5  # pairs by player_a's points, 0 to 2
+        self.wins = self.draws = self.losses = 0
+        self.over200 = 0
+
+    @property
+    def pairs(self):
+        return sum(self.pentanomial)
+
+    @property
+    def games(self):
+        return 2 * self.pairs
+
+    @property
+    def lower_bound(self):
+        """LLR at or below which H0 is accepted"""
+        return math.log(self.beta / (1 - self.alpha))
+
+    @property
+    def upper_bound(self):
+        """LLR at or above which H1 is accepted"""
+        return math.log((1 - self.beta) / self.alpha)
+
+    def add(self, pair):
+        """Count a pair: labels of player_a's game as White, then as Black"""
+        points = 0.0
+        for label, as_white in zip(pair, (True, False)):
+            score = gameScore(label, as_white)
+            points += score
+            self.wins += score == 1
+            self.draws += score == 0.5
+            self.losses += score == 0
+            self.over200 += label == "over200"
+        self.pentanomial[int(points * 2)] += 1
+
+    def _moments(self):
+        """Mean and variance of a pair's score per game, with the prior"""
+        counts = [count + PRIOR for count in self.pentanomial]
+        total = sum(counts)
+        mean = sum(c * s for c, s in zip(counts, PAIR_SCORES)) / total
+        square = sum(c * s * s for c, s in zip(counts, PAIR_SCORES)) / total
+        variance = square - mean * mean
+        return mean, variance
+
+    def llr(self):
+        """Log-likelihood ratio of H1 against H0"""
+        if not self.pairs:
+            return 0.0
+        mean, variance = self._moments()
+        s0, s1 = scoreFromElo(self.elo0), scoreFromElo(self.elo1)
+        return self.pairs * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+    @property
+    def verdict(self):
+        """The SPRT's decision so far: "H1", "H0" or None"""
+        llr = self.llr()
+        if llr >= self.upper_bound:
+            return "H1"
+        if llr <= self.lower_bound:
+            return "H0"
+        return None
+
+    def elo(self):
+        """(Elo, low, high): player_a's Elo over player_b with its 95% CI"""
+        mean, variance = self._moments()
+        margin = Z95 * math.sqrt(variance / (self.pairs + 5 * PRIOR))
+        low = max(mean - margin, 1e-6)
+        high = min(mean + margin, 1 - 1e-6)
+        return eloFromScore(mean), eloFromScore(low), eloFromScore(high)
+
+    def asDict(self):
+        elo, low, high = self.elo()
+        return {
+            "player_a": self.player_a,
+            "player_b": self.player_b,
+            "games": self.games,
+            "wins": self.wins,
+            "draws": self.draws,
+            "losses": self.losses,
+            "over200": self.over200,
+            "pentanomial": self.pentanomial,
+            "elo": elo,
+            "elo_low": low,
+            "elo_high": high,
+            "elo0": self.elo0,
+            "elo1": self.elo1,
+            "llr": self.llr(),
+            "llr_bounds": [self.lower_bound, self.upper_bound],
+            "verdict": self.verdict,
+        }
+
+    def __repr__(self):
+        elo, low, high = self.elo()
+        verdict = {
+            "H1": f"H1 accepted ({self.player_a} +{self.elo1} Elo or more)",
+            "H0": f"H0 accepted (not {self.elo1} Elo better)",
+            None: "inconclusive",
+        }[self.verdict]
+        return (
+            f"{self.player_a} vs {self.player_b}: {self.games} games, "
+            f"+{self.wins} ={self.draws} -{self.losses}, "
+            f"Elo {elo:+.1f} [{low:+.1f}, {high:+.1f}], "
+            f"LLR {self.llr():.2f} ({self.lower_bound:.2f}, "
+            f"{self.upper_bound:.2f}), {verdict}"
+        )
+
+
+def playPair(index, player_a, player_b, play_game):
+    """Labels of player_a's game as White, then as Black, against player_b"""
+    labels = []
+    for game, (white, black) in enumerate(
+            ((player_a, player_b), (player_b, player_a))):
+        result = play_game(2 * index + game, white, black)
+        # run_single_game returns a bare "over200" for an unfinished game
+        labels.append(result if isinstance(result, str) else result[0])
+    return tuple(labels)
+
+
+def match(
+    player_a,
+    player_b,
+    elo0=ELO0,
+    elo1=ELO1,
+    alpha=ALPHA,
+    beta=BETA,
+    max_pairs=MAX_PAIRS,
+    num_workers=None,
+    play_game=None,
+):
+    """
+    Play pairs of player_a against player_b until the SPRT of H0 (elo <=
+    elo0) against H1 (elo >= elo1) decides, or max_pairs are played, and
+    return the MatchResult. play_game(index, white, black) returns a
+    result whose first item is "White", "Black", "Draw" or "over200";
+    ChessMain.run_single_game by default.
+    """
+    if play_game is None:
+        import ChessMain
+
+        play_game = ChessMain.run_single_game
+    result = MatchResult(player_a, player_b, elo0, elo1, alpha, beta)
+    func = functools.partial(
+        playPair, player_a=player_a, player_b=player_b, play_game=play_game
+    )
+    num_workers = num_workers or max(1, cpu_count() // 2)
+    # Leaving the with block stops the pairs still being played
+    with Pool(processes=num_workers) as pool:
+        for pair in tqdm(
+            pool.imap_unordered(func, range(max_pairs)),
+            total=max_pairs,
+            desc=f"{player_a} vs {player_b}",
+        ):
+            result.add(pair)
+            if result.verdict is not None:
+                break
+    print(result)
+    return result
+
+
+def gauntlet(candidate, opponents, **kwargs):
+    """A match of candidate against each opponent; takes match()'s options"""
+    return [match(candidate, opponent, **kwargs) for opponent in opponents]
+
+
+def roundRobin(players, **kwargs):
+    """A match between every two players; takes match()'s options"""
+    return [
+        match(player_a, player_b, **kwargs)
+        for player_a, player_b in itertools.combinations(players, 2)
+    ]
+
+
+def standings(results):
+    """(player, points, games) of every player in the matches, best first"""
+    table = {}
+    for result in results:
+        a_points = result.wins + result.draws / 2
+        for player, points in (
+            (result.player_a, a_points),
+            (result.player_b, result.games - a_points),
+        ):
+            total, games = table.get(player, (0.0, 0))
+            table[player] = total + points, games + result.games
+    return sorted(
+        ((player, points, games) for player, (points, games) in table.items()),
+        key=lambda entry: -entry[1] / max(entry[2], 1),
+    )
+
+
+def report(results, name):
+    """Print the matches and the standings and save them as JSON"""
+    for result in results:
+        print(result)
+    table = standings(results)
+    for player, points, games in table:
+        print(f"{player}: {points:g}/{games} ({points / max(games, 1):.1%})")
+
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    filename = os.path.join(RESULT_DIR, f"{name}.json")
+    with open(filename, "w") as f:
+        json.dump(
+            {
+                "matches": [result.asDict() for result in results],
+                "standings": [
+                    {"player": player, "points": points, "games": games}
+                    for player, points, games in table
+                ],
+            },
+            f,
+            indent=2,
+        )
+    print(f"Match results saved as: {filename}")
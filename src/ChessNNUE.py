@@ -0,0 +1,414 @@
+"""
+In-process NNUE evaluation for Duck Chess.
+Loads a Fairy-Stockfish .nnue file (HalfKAv2 features, 512x2-16-32-1 with
+8 layer stacks) into NumPy arrays. An Accumulator attached to a GameState
+keeps the first layer up to date square by square through setSquare, so a
+leaf only pays for the small dense layers.
+The order of the feature planes is this module's reading of the engine's:
+a file whose header or layer sizes don't fit it is refused, and
+tests/test_nnue.py compares the scores with the engine's own eval.
+"""
+
+import os
+
+import numpy as np
+
+from ChessEval import PIECE_CODES
+
+NNUE_PATH = os.path.join(os.path.dirname(__file__), "duck-ba21f91f5d81.nnue")
+NNUE_VERSION = 0x7AF32F20
+LEB128_MAGIC = b"COMPRESSED_LEB128"
+
+TRANSFORMED_SIZE = 512  # accumulator width per perspective
+PSQT_BUCKETS = 8
+LAYER_STACKS = 8
+HIDDEN_1 = 16
+HIDDEN_2 = 32
+WEIGHT_SCALE_BITS = 6
+OUTPUT_SCALE = 16
+PAWN_VALUE = 208  # engine units per pawn, as reported in UCI centipawns
+
+# Piece planes of HalfKAv2, per king square, from one side's point of view:
+# own/their pawn, knight, bishop, rook, queen, then one shared king plane.
+# A duck plane follows when the network has room for it.
+PIECE_PLANES = {"p": 0, "N": 2, "B": 4, "R": 6, "Q": 8}
+KING_PLANE = 10
+DUCK_PLANE = 11
+
+_networks = {}  # path -> loaded Network
+
+
+def _paddedSize(size):
+    """Affine layers pad their input rows to a multiple of 32"""
+    return (size + 31) // 32 * 32
+
+
+def _decodeLeb128(data):
+    """Signed LEB128 bytes to int64 values, without a Python-level loop"""
+    data = np.frombuffer(data, dtype=np.uint8)
+    ends = (data & 0x80) == 0
+    starts = np.concatenate(([0], np.flatnonzero(ends)[:-1] + 1))
+    position = np.arange(len(data)) - np.repeat(
+        starts, np.diff(np.concatenate((starts, [len(data)])))
+    )
+    parts = (data & 0x7F).astype(np.int64) << (7 * position)
+    values = np.add.reduceat(parts, starts)
+    shift = 7 * (np.flatnonzero(ends) - starts + 1)
+    negative = (data[ends] & 0x40) != 0
+    values[negative] -= np.int64(1) << shift[negative]
+    return values
+
+
+class _Reader:
+    """Sequential little-endian reader over the network file"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def _need(self, size):
+        if self.pos + size > len(self.data):
+            raise ValueError("NNUE file ends inside a block")
+
+    def uint32(self):
+        self._need(4)
+        value = int.from_bytes(self.data[self.pos: self.pos + 4], "little")
+        self.pos += 4
+        return value
+
+    def bytes(self, size):
+        self._need(size)
+        value = self.data[self.pos: self.pos + size]
+        self.pos += size
+        return value
+
+    def array(self, dtype, count=None):
+        """
+        count values of dtype, or every value of a LEB128 block. count=None
+        on a plain block reads up to the end of the file.
+        """
+        if self.data.startswith(LEB128_MAGIC, self.pos):
+            self.pos += len(LEB128_MAGIC)
+            size = self.uint32()
+            values = _decodeLeb128(self.bytes(size))
+            if count is not None and len(values) != count:
+                raise ValueError("unexpected NNUE block size")
+            return values.astype(dtype)
+        itemsize = np.dtype(dtype).itemsize
+        if count is None:
+            count = (len(self.data) - self.pos) // itemsize
+        self._need(count * itemsize)
+        values = np.frombuffer(
+            self.data,
+            dtype=dtype,
+            count=count,
+            offset=self.pos)
+        self.pos += count * itemsize
+        return values
+
+
+class Network:
+    """Weights of one .nnue file, laid out for NumPy"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            reader = _Reader(f.read())
+
+        version = reader.uint32()
+        if version != NNUE_VERSION:
+            raise ValueError(f"unsupported NNUE version {version:#x}")
+        reader.uint32()  # architecture hash
+        self.description = reader.bytes(
+            reader.uint32()).decode(
+            "utf-8", "replace")
+
+        # Feature transformer
+        reader.uint32()  # hash
+        self.biases = reader.array("<i2", TRANSFORMED_SIZE).astype(np.int32)
+        if reader.data.startswith(LEB128_MAGIC, reader.pos):
+            weights = reader.array("<i2")
+            psqt = reader.array("<i4")
+        else:
+            # The feature count is whatever is left once the layer stacks
+            # are set aside
+            stack_bytes = LAYER_STACKS * (
+                4
+                + HIDDEN_1 * 4
+                + HIDDEN_1 * _paddedSize(2 * TRANSFORMED_SIZE)
+                + HIDDEN_2 * 4
+                + HIDDEN_2 * _paddedSize(HIDDEN_1)
+                + 4
+                + _paddedSize(HIDDEN_2)
+            )
+            free = len(reader.data) - reader.pos - stack_bytes
+            feature_bytes = TRANSFORMED_SIZE * 2 + PSQT_BUCKETS * 4
+            if free <= 0 or free % feature_bytes:
+                raise ValueError("NNUE file size doesn't fit the architecture")
+            features = free // feature_bytes
+            weights = reader.array("<i2", features * TRANSFORMED_SIZE)
+            psqt = reader.array("<i4", features * PSQT_BUCKETS)
+        if len(weights) % TRANSFORMED_SIZE or len(psqt) % PSQT_BUCKETS:
+            raise ValueError("NNUE feature transformer has an unknown shape")
+        self.weights = weights.reshape(-1, TRANSFORMED_SIZE).astype(np.int16)
+        self.psqt = psqt.reshape(-1, PSQT_BUCKETS).astype(np.int32)
+        features = len(self.weights)
+        if features % (64 * 64) or len(self.psqt) != features:
+            raise ValueError("NNUE feature transformer has an unknown shape")
+        self.planes = features // 64 // 64  # planes per king square
+        if self.planes not in (KING_PLANE + 1, DUCK_PLANE + 1):
+            raise ValueError(
+                f"NNUE feature set has {self.planes} planes per king square, "
+                f"not the {KING_PLANE + 1} (or {DUCK_PLANE + 1} with the duck) "
+                "laid out here"
+            )
+        self.has_duck = self.planes > DUCK_PLANE
+
+        # Dense layers, one stack per piece count bucket
+        self.layers = []
+        stack_hashes = set()
+        for _ in range(LAYER_STACKS):
+            stack_hashes.add(reader.uint32())
+            stack = []
+            for inputs, outputs in (
+                (2 * TRANSFORMED_SIZE, HIDDEN_1),
+                (HIDDEN_1, HIDDEN_2),
+                (HIDDEN_2, 1),
+            ):
+                biases = reader.array("<i4", outputs).astype(np.int64)
+                weights = reader.array("i1", outputs * _paddedSize(inputs))
+                weights = weights.reshape(outputs, _paddedSize(inputs))
+                # float32 products sum exactly: 1024 * 127 * 128 < 2 ** 24
+                stack.append((biases, weights[:, :inputs].astype(np.float32)))
+            self.layers.append(stack)
+        if len(stack_hashes) != 1:
+            raise ValueError("NNUE layer stacks of different architectures")
+        if reader.pos != len(reader.data):
+            raise ValueError("trailing data after the NNUE layers")
+
+        self.indices = self._buildIndices()
+        # Same tables by piece code, -1 where a piece has no feature
+        self.code_indices = {}
+        for side, table in self.indices.items():
+            by_code = np.full((len(PIECE_CODES), 64, 64), -1, dtype=np.int64)
+            for piece, rows in table.items():
+                by_code[PIECE_CODES[piece]] = rows
+            self.code_indices[side] = by_code
+
+    def _buildIndices(self):
+        """
+        indices[perspective][piece][king square][square] -> feature row,
+        squares in board order (row * 8 + col, a8 first).
+        """
+        board_squares = np.arange(64)
+        # Engine squares count from a1; black sees the board flipped
+        oriented = {
+            "w": (7 - board_squares // 8) * 8 + board_squares % 8,
+            "b": (board_squares // 8) * 8 + board_squares % 8,
+        }
+        plane_size = 64
+        king_stride = self.planes * plane_size
+        indices = {}
+        for side in "wb":
+            table = {}
+            for piece_color in "wb":
+                for kind, plane in PIECE_PLANES.items():
+                    own = 0 if piece_color == side else 1
+                    table[piece_color + kind] = plane + own
+                table[piece_color + "K"] = KING_PLANE
+            if self.has_duck:
+                table["DD"] = DUCK_PLANE
+            indices[side] = {
+                piece: oriented[side][:, None] * king_stride
+                + plane * plane_size
+                + oriented[side][None, :]
+                for piece, plane in table.items()
+            }
+        return indices
+
+    def dense(self, hidden, bucket):
+        """
+        The dense layers of one stack over clipped first-layer outputs
+        (1024 values, or N rows of them); returns the positional score.
+        """
+        (b0, w0), (b1, w1), (b2, w2) = self.layers[bucket]
+        for biases, weights in ((b0, w0), (b1, w1)):
+            hidden = (biases + (hidden @ weights.T).astype(np.int64)) >> (
+                WEIGHT_SCALE_BITS
+            )
+            hidden = hidden.clip(0, 127).astype(np.float32)
+        return b2[0] + (hidden @ w2.T)[..., 0].astype(np.int64)
+
+    def evaluateBatch(self, codes, white_to_move):
+        """
+        Score N boards at once, in pawns (white positive), from an (N, 64)
+        array of ChessEval.boardCodes rows and the side to move of each.
+        """
+        codes = np.asarray(codes)
+        white_to_move = np.asarray(white_to_move, dtype=bool)
+        squares = np.arange(64)
+        sums = {}
+        for side in "wb":
+            king_squares = (codes == PIECE_CODES[side + "K"]).argmax(axis=1)
+            rows = self.code_indices[side][codes,
+                                           king_squares[:, None], squares]
+            # Pack each board's features to the left and pad with row 0,
+            # whose extra copies are taken off again after the sum
+            present = rows >= 0
+            counts = present.sum(axis=1)
+            width = counts.max()
+            order = np.argsort(~present, axis=1, kind="stable")[:, :width]
+            rows = np.take_along_axis(np.where(present, rows, 0), order, 1)
+            padding = (width - counts)[:, None]
+            sums[side] = (
+                self.biases
+                + self.weights[rows].sum(axis=1, dtype=np.int32)
+                - padding * self.weights[0].astype(np.int32),
+                self.psqt[rows].sum(axis=1) - padding * self.psqt[0],
+            )
+
+        us = {
+            part: np.where(white_to_move[:, None], sums["w"][part], sums["b"][part])
+            for part in (0, 1)
+        }
+        them = {
+            part: np.where(white_to_move[:, None], sums["b"][part], sums["w"][part])
+            for part in (0, 1)
+        }
+        pieces = ((codes != PIECE_CODES["--"]) &
+                  (codes != PIECE_CODES["DD"])).sum(axis=1)
+        buckets = (pieces - 1) // 4
+        index = np.arange(len(codes))
+        psqt = np.trunc((us[1][index, buckets] - them[1][index, buckets]) / 2)
+
+        hidden = np.concatenate((us[0], them[0]), axis=1).clip(0, 127)
+        hidden = hidden.astype(np.float32)
+        positional = np.zeros(len(codes))
+        for bucket in np.unique(buckets):
+            rows = buckets == bucket
+            positional[rows] = self.dense(hidden[rows], bucket)
+
+        scores = np.trunc((psqt + positional) / OUTPUT_SCALE) / PAWN_VALUE
+        return np.where(white_to_move, scores, -scores)
+
+
+def loadNetwork(path=NNUE_PATH):
+    """The network at path (loaded once per process), or None if missing"""
+    if path not in _networks:
+        if not os.path.exists(path):
+            return None
+        _networks[path] = Network(path)
+    return _networks[path]
+
+
+class Accumulator:
+    """
+    First-layer sums for both perspectives of one GameState.
+    GameState calls push() at the start of makeMove, update() from setSquare
+    and pop() in undoMove. A king move only marks that side's sums stale;
+    they are rebuilt from the board when the position is next evaluated.
+    The piece count that picks the layer stack is kept the same way.
+    """
+
+    def __init__(self, network, game_state):
+        self.network = network
+        self.game_state = game_state
+        # Per perspective: TRANSFORMED_SIZE sums then PSQT_BUCKETS sums
+        self.sums = np.zeros((2, TRANSFORMED_SIZE + PSQT_BUCKETS), np.int32)
+        self.king_squares = [None, None]
+        self.stale = [True, True]
+        self.stack = []
+        self.pieces = sum(
+            1 for row in game_state.board for piece in row if piece not in (
+                "--", "DD"))
+        for perspective in (0, 1):
+            self.refresh(perspective)
+
+    def push(self):
+        self.stack.append(
+            (self.sums.copy(), list(
+                self.king_squares), list(
+                self.stale), self.pieces))
+
+    def pop(self):
+        (self.sums, self.king_squares, self.stale,
+         self.pieces) = self.stack.pop()
+
+    def refresh(self, perspective):
+        """Rebuild one perspective's sums from the board"""
+        side = "wb"[perspective]
+        board = self.game_state.board
+        row, col = (
+            self.game_state.white_king_location
+            if side == "w"
+            else self.game_state.black_king_location
+        )
+        king_square = row * 8 + col
+        rows = [
+            self.network.indices[side][piece][king_square][r * 8 + c]
+            for r in range(8)
+            for c in range(8)
+            if (piece := board[r][c]) in self.network.indices[side]
+        ]
+        sums = self.sums[perspective]
+        sums[:TRANSFORMED_SIZE] = self.network.biases + \
+            self.network.weights[rows].sum(axis=0, dtype=np.int32)
+        sums[TRANSFORMED_SIZE:] = self.network.psqt[rows].sum(axis=0)
+        self.king_squares[perspective] = king_square
+        self.stale[perspective] = False
+
+    def update(self, square, old_piece, piece):
+        """Apply one square changing from old_piece to piece"""
+        self.pieces += (piece not in ("--", "DD")) - (
+            old_piece not in ("--", "DD"))
+        for perspective, side in enumerate("wb"):
+            if self.stale[perspective]:
+                continue
+            if side + "K" in (old_piece, piece):
+                self.stale[perspective] = True  # new king bucket
+                continue
+            indices = self.network.indices[side]
+            king_square = self.king_squares[perspective]
+            sums = self.sums[perspective]
+            if old_piece in indices:
+                row = indices[old_piece][king_square][square]
+                sums[:TRANSFORMED_SIZE] -= self.network.weights[row]
+                sums[TRANSFORMED_SIZE:] -= self.network.psqt[row]
+            if piece in indices:
+                row = indices[piece][king_square][square]
+                sums[:TRANSFORMED_SIZE] += self.network.weights[row]
+                sums[TRANSFORMED_SIZE:] += self.network.psqt[row]
+
+    def evaluate(self):
+        """Network score in pawns, positive for white"""
+        for perspective in (0, 1):
+            if self.stale[perspective]:
+                self.refresh(perspective)
+
+        game_state = self.game_state
+        bucket = (self.pieces - 1) // 4
+        us, them = (0, 1) if game_state.white_to_move else (1, 0)
+
+        # The engine divides with C++ truncation, not floor
+        psqt = int(
+            (
+                int(self.sums[us, TRANSFORMED_SIZE + bucket])
+                - int(self.sums[them, TRANSFORMED_SIZE + bucket])
+            )
+            / 2
+        )
+        hidden = self.sums[(us, them), :TRANSFORMED_SIZE].clip(0, 127)
+        hidden = hidden.ravel().astype(np.float32)
+        positional = int(self.network.dense(hidden, bucket))
+
+        score = int((psqt + positional) / OUTPUT_SCALE) / PAWN_VALUE
+        return score if game_state.white_to_move else -score
+
+
+def attach(game_state, network):
+    """Start keeping an accumulator for game_state; scoreBoard then uses it"""
+    game_state.nnue = Accumulator(network, game_state)
+    return game_state.nnue
+
+
+def detach(game_state):
+    game_state.nnue = None
@@ -0,0 +1,439 @@
+"""
+Parallel searches for the handcraft AI.
+RootSearchPool shares root piece moves (or full piece + duck turns) out to a
+pool of warm worker processes. LazySmpPool has every worker search the whole
+position at staggered depths, all sharing one transposition table.
+"""
+
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import chessAi_handcraft
+import ChessControl
+import ChessStats
+import ChessTT
+from chessAi_handcraft import CHECKMATE
+
+MAX_ROOT_MOVES = 256  # more than any legal piece move count
+UNSEARCHED = math.nan
+
+# Worker-side handles to the shared search state (set by the initializers)
+_root_scores = None
+_search_id = None
+_results = None
+_tables = {}  # shared TT name -> attached table
+_root = (None, None)  # (search id, root GameState) of this worker
+
+
+def _initWorker(root_scores, search_id):
+    global _root_scores, _search_id
+    _root_scores = root_scores
+    _search_id = search_id
+
+
+def _initLazySmpWorker(results, search_id):
+    global _results, _search_id
+    _results = results
+    _search_id = search_id
+
+
+class _SearchIdStop:
+    """Stop flag of a worker's search: set once the pool moves past it"""
+
+    def __init__(self, search_id):
+        self.search_id = search_id
+
+    def is_set(self):
+        return _search_id.value != self.search_id
+
+    def set(self):
+        pass  # only the pool's cancel() or next search stops a worker
+
+
+def _warmUp():
+    """Cheap task used to start every worker before the first search"""
+    return os.getpid()
+
+
+def _finishedAlpha(index):
+    """Best shared score of the root moves before index that have finished"""
+    alpha = -CHECKMATE
+    for i in range(index):
+        score = _root_scores[i]
+        if not math.isnan(score) and score > alpha:
+            alpha = score
+    return alpha
+
+
+def _searchRootTurn(
+    search_id,
+    root_bytes,
+    index,
+    move,
+    depth,
+    beta,
+    color,
+    duck_squares,
+    collect=False,
+):
+    """
+    Search one root move in a worker.
+    Alpha is the best score of the root moves ordered before this one that
+    have finished, read again before each duck reply, which keeps the result
+    identical to the serial search (a move can only fail low against moves
+    it would lose a tie to). The root position is unpickled once per search.
+    With collect, ChessStats counters of the task come back as well.
+    """
+    global _root
+    if _search_id.value != search_id:
+        return None  # the search was cancelled before this task started
+    if _root[0] != search_id:
+        _root = (search_id, pickle.loads(root_bytes))
+    game_state = _root[1]
+
+    ChessStats.enable(collect)
+    stats = ChessStats.begin(chessAi_handcraft.transposition_table)
+    control = ChessControl.begin(
+        ChessControl.SearchControl(stop_event=_SearchIdStop(search_id))
+    )
+    try:
+        score, best_duck = chessAi_handcraft.searchTurn(
+            game_state,
+            move,
+            depth,
+            _finishedAlpha(index),
+            beta,
+            color,
+            duck_squares=duck_squares,
+            refresh_alpha=lambda: _finishedAlpha(index),
+        )
+    finally:
+        ChessControl.end(control)
+    ChessStats.end(stats)
+    if control.stopped:
+        return None  # cancelled part way; the score is unfinished
+    return score, best_duck, None if stats is None else stats.counters()
+
+
+class RootSearchPool:
+    """
+    A ProcessPoolExecutor of warm workers that split the root of the handcraft
+    search. split="moves" hands out one root piece move per task, and
+    split="turns" one (piece move, duck square) pair per task, which evens out
+    the load when a few piece moves have many more duck replies than others.
+    """
+
+    def __init__(self, workers=None, split="moves"):
+        if split not in ("moves", "turns"):
+            raise ValueError(f"unknown split mode: {split}")
+        self.workers = workers or os.cpu_count()
+        self.split = split
+
+        context = multiprocessing.get_context("spawn")
+        self.root_scores = context.Array("d", MAX_ROOT_MOVES, lock=False)
+        self.search_id = context.Value("i", 0, lock=False)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_initWorker,
+            initargs=(self.root_scores, self.search_id),
+        )
+        # Start every worker now so the first move doesn't pay for it
+        for future in [
+            self.executor.submit(_warmUp) for _ in range(
+                self.workers)]:
+            future.result()
+
+    def findBestMove(self, game_state, valid_moves, return_queue):
+        """Same contract as chessAi_handcraft.findBestMove"""
+        stats = ChessStats.begin()
+        move, source = chessAi_handcraft.presearchMove(game_state, valid_moves)
+        if move is not None:
+            return_queue.put(move)
+            return ChessStats.end(stats, source)
+        return_queue.put(self.search(game_state, valid_moves))
+        return ChessStats.end(stats, depth=chessAi_handcraft.DEPTH)
+
+    def search(self, game_state, valid_moves, depth=None):
+        """Return the root piece move the serial search would pick"""
+        depth = chessAi_handcraft.DEPTH if depth is None else depth
+        piece_moves = [m for m in valid_moves if not m.is_duck_move]
+        if not piece_moves:
+            return None
+
+        # A king capture ends the search before any work is handed out
+        enemy_king = "bK" if game_state.white_to_move else "wK"
+        for move in piece_moves:
+            if move.piece_captured == enemy_king:
+                return move
+
+        moves = chessAi_handcraft.orderMoves(game_state, piece_moves)
+        if len(moves) > MAX_ROOT_MOVES:
+            raise ValueError("too many root moves for the shared score table")
+        color = 1 if game_state.white_to_move else -1
+        beta = CHECKMATE
+
+        self.search_id.value += 1
+        search_id = self.search_id.value
+        for i in range(len(moves)):
+            self.root_scores[i] = UNSEARCHED
+        stats = ChessStats.current
+        # Pickled once here; each worker unpickles it once per search
+        root_bytes = pickle.dumps(game_state)
+
+        # index -> number of unfinished tasks and the best score seen so far
+        remaining = {}
+        partial = {}
+        pending = {}
+        for index, move in enumerate(moves):
+            for duck_squares in self._duckSplits(game_state, move):
+                future = self.executor.submit(
+                    _searchRootTurn,
+                    search_id,
+                    root_bytes,
+                    index,
+                    move,
+                    depth,
+                    beta,
+                    color,
+                    duck_squares,
+                    stats is not None,
+                )
+                pending[future] = index
+                remaining[index] = remaining.get(index, 0) + 1
+                partial[index] = -math.inf
+
+        scores = [UNSEARCHED] * len(moves)  # this search's, kept locally
+        cutoff_index = len(moves)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            if self.search_id.value != search_id:
+                # cancel() was called: leave the shared scores to the next
+                # search
+                self._cancel(pending, lambda i: True)
+                return None
+            for future in done:
+                index = pending.pop(future)
+                result = future.result()
+                if result is not None:
+                    partial[index] = max(partial[index], result[0])
+                    if stats is not None and result[2] is not None:
+                        stats.addCounters(result[2])
+                remaining[index] -= 1
+                if remaining[index] > 0:
+                    continue
+
+                # Every duck reply of this root move is in. A cancel() and a
+                # new search may have come since wait() returned: the shared
+                # scores are then the new search's, and this one is over
+                if self.search_id.value != search_id:
+                    self._cancel(pending, lambda i: True)
+                    return None
+                scores[index] = self.root_scores[index] = partial[index]
+                if partial[index] >= beta and index < cutoff_index:
+                    # Beta cutoff: moves ordered after this one don't matter
+                    cutoff_index = index
+                    self._cancel(pending, lambda i: i > cutoff_index)
+
+        best_move = None
+        best_score = -math.inf
+        for index in range(min(cutoff_index + 1, len(moves))):
+            if scores[index] > best_score:
+                best_score = scores[index]
+                best_move = moves[index]
+        return best_move
+
+    def _duckSplits(self, game_state, move):
+        """Duck square sets to search for one root move, one per task"""
+        if self.split == "moves":
+            return [None]
+        game_state.makeMove(move)
+        squares = [(m.end_row, m.end_col) for m in game_state.getValidMoves()]
+        game_state.undoMove()
+        return [{square} for square in squares] or [None]
+
+    def _cancel(self, pending, should_cancel):
+        """Drop queued tasks; already running ones finish and are ignored"""
+        for future, index in list(pending.items()):
+            if should_cancel(index):
+                future.cancel()
+                del pending[future]
+
+    def cancel(self):
+        """Abandon the current search; running tasks return as soon as they can"""
+        self.search_id.value += 1
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _lazySmpWorker(
+        search_id,
+        worker_id,
+        tt_name,
+        game_state,
+        piece_moves,
+        max_depth,
+        collect=False):
+    """
+    Iterative deepening over the whole position, reporting every finished
+    depth as (search_id, depth, index into piece_moves, worker_id, counters).
+    counters are the worker's ChessStats counters so far with collect, else
+    None. Odd workers start one ply deeper (unless max_depth is 1) and
+    helpers shuffle their quiet moves, so the workers spread out over the
+    tree and fill the shared table for each other.
+    """
+    if tt_name not in _tables:
+        _tables[tt_name] = ChessTT.TranspositionTable.attach(tt_name)
+    chessAi_handcraft.transposition_table = _tables[tt_name]
+    ChessStats.enable(collect)
+    stats = ChessStats.begin(chessAi_handcraft.transposition_table)
+
+    moves = list(piece_moves)
+    if worker_id > 0:
+        random.Random(worker_id).shuffle(moves)
+    color = 1 if game_state.white_to_move else -1
+
+    last = None
+    control = ChessControl.begin(
+        ChessControl.SearchControl(stop_event=_SearchIdStop(search_id))
+    )
+    for depth in range(min(1 + worker_id % 2, max_depth), max_depth + 1):
+        if control.poll():
+            break
+        chessAi_handcraft.next_move = None
+        chessAi_handcraft.negamax_full(
+            game_state, moves, depth, -CHECKMATE, CHECKMATE, color
+        )
+        if control.stopped or chessAi_handcraft.next_move is None:
+            break
+        last = (
+            search_id,
+            depth,
+            piece_moves.index(chessAi_handcraft.next_move),
+            worker_id,
+            None if stats is None else stats.snapshot(),
+        )
+        _results.put(last)
+    ChessControl.end(control)
+    ChessStats.end(stats)
+    return last
+
+
+class LazySmpPool:
+    """
+    Lazy SMP: N warm workers search the same position at staggered depths and
+    share one lock-free transposition table in shared memory. The search
+    returns the move from the deepest iteration any worker completed, either
+    when one reaches max_depth or when time_limit runs out.
+    """
+
+    def __init__(self, workers=None, tt_size_mb=64):
+        self.workers = workers or os.cpu_count()
+        self.table = ChessTT.TranspositionTable(tt_size_mb, shared=True)
+
+        context = multiprocessing.get_context("spawn")
+        self.results = context.Queue()
+        self.search_id = context.Value("i", 0, lock=False)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_initLazySmpWorker,
+            initargs=(self.results, self.search_id),
+        )
+        for future in [
+            self.executor.submit(_warmUp) for _ in range(
+                self.workers)]:
+            future.result()
+
+    def findBestMove(self, game_state, valid_moves, return_queue):
+        """Same contract as chessAi_handcraft.findBestMove"""
+        stats = ChessStats.begin()
+        move, source = chessAi_handcraft.presearchMove(game_state, valid_moves)
+        if move is not None:
+            return_queue.put(move)
+            return ChessStats.end(stats, source)
+        return_queue.put(self.search(game_state, valid_moves))
+        return ChessStats.end(stats)
+
+    def search(self, game_state, valid_moves, max_depth=None, time_limit=None):
+        """Return the best root piece move from the deepest finished iteration"""
+        max_depth = chessAi_handcraft.DEPTH if max_depth is None else max_depth
+        piece_moves = [m for m in valid_moves if not m.is_duck_move]
+        if not piece_moves:
+            return None
+
+        enemy_king = "bK" if game_state.white_to_move else "wK"
+        for move in piece_moves:
+            if move.piece_captured == enemy_king:
+                return move
+
+        self.search_id.value += 1
+        search_id = self.search_id.value
+        stats = ChessStats.current
+        futures = [
+            self.executor.submit(
+                _lazySmpWorker,
+                search_id,
+                worker_id,
+                self.table.name,
+                game_state,
+                piece_moves,
+                max_depth,
+                stats is not None,
+            )
+            for worker_id in range(self.workers)
+        ]
+        reported = {}  # worker_id -> latest counters
+
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        best_depth, best_index = 0, None
+        while best_depth < max_depth:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                result = self.results.get(timeout=0.05)
+            except queue.Empty:
+                if all(future.done() for future in futures):
+                    # Pick up anything the queue hasn't delivered yet
+                    finished = [f.result() for f in futures if f.result()]
+                    for result in finished:
+                        if result[0] != search_id:
+                            continue
+                        reported[result[3]] = result[4]
+                        if result[1] > best_depth:
+                            best_depth, best_index = result[1], result[2]
+                    break
+                continue
+            if result[0] != search_id:
+                continue
+            reported[result[3]] = result[4]
+            if result[1] > best_depth:
+                best_depth, best_index = result[1], result[2]
+
+        # Workers still mid-iteration stop within ChessControl.CHECK_INTERVAL
+        # nodes
+        self.search_id.value += 1
+        if stats is not None:
+            # Work reported by the time the move was chosen
+            for counters in reported.values():
+                stats.addCounters(counters)
+            stats.depth = best_depth
+        if best_index is None:
+            return piece_moves[0]
+        return piece_moves[best_index]
+
+    def cancel(self):
+        self.search_id.value += 1
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.table.close()
@@ -0,0 +1,188 @@
+"""
+Pondering for the pygame UI.
+While the human thinks, a background process plays the human turns it
+expects (likeliest first) and searches the AI's answer to each one. If the
+human plays one of them, its answer is used, or its search is waited for.
+Otherwise the ponder is stopped. The shared transposition table keeps
+everything the ponder searches found, and the AI's own searches use that
+table too.
+"""
+
+import queue
+from multiprocessing import Event, Process, Queue
+
+import ChessAI
+import chessAi_handcraft
+import ChessControl
+import ChessTT
+from chessAi_handcraft import CHECKMATE
+
+PONDER_REPLIES = 8  # human turns searched, likeliest first
+PREDICT_DEPTH = 1  # full turns used to rank the human's turns
+PONDER_TT_SIZE_MB = 64
+
+PENDING = "pending"  # answer(): the ponder search of this position is running
+
+
+def search(
+        game_state,
+        valid_moves,
+        return_queue,
+        mode,
+        tt_name=None,
+        control=None):
+    """
+    findBestMove of the given AI mode ('handcraft' or 'nnue'), searching
+    with the shared table tt_name when given.
+    """
+    if tt_name is not None:
+        chessAi_handcraft.transposition_table = ChessTT.TranspositionTable.attach(
+            tt_name)
+    if mode == "handcraft":
+        return chessAi_handcraft.findBestMove(
+            game_state, valid_moves, return_queue, control
+        )
+    return ChessAI.findBestMove(
+        game_state,
+        valid_moves,
+        return_queue,
+        mode,
+        control)
+
+
+def predictReplies(game_state, limit=PONDER_REPLIES, depth=PREDICT_DEPTH):
+    """
+    The side to move's likeliest full turns as (piece move, duck move),
+    best first, by a shallow search of every piece move
+    """
+    color = 1 if game_state.white_to_move else -1
+    piece_moves = [m for m in game_state.getValidMoves() if not m.is_duck_move]
+    scored = []
+    for move in chessAi_handcraft.orderMoves(game_state, piece_moves):
+        score, duck_move = chessAi_handcraft.searchTurn(
+            game_state, move, depth, -CHECKMATE, CHECKMATE, color
+        )
+        if duck_move is not None:
+            scored.append((score, move, duck_move))
+    scored.sort(key=lambda entry: -entry[0])
+    return [(move, duck_move) for _, move, duck_move in scored[:limit]]
+
+
+def _ponderWorker(game_state, mode, tt_name, results, control):
+    """
+    Search the AI's answer to each predicted human turn, reporting
+    (position key, PENDING) when a search starts and (position key, move)
+    when it is done, until control is stopped
+    """
+    if tt_name is not None:
+        chessAi_handcraft.transposition_table = ChessTT.TranspositionTable.attach(
+            tt_name)
+    for move, duck_move in predictReplies(game_state):
+        if control.stopped or control.poll():
+            return
+        game_state.makeMove(move)
+        game_state.makeMove(duck_move)
+        key = game_state.positionKey()
+        results.put((key, PENDING))
+        answer = queue.Queue()
+        search(
+            game_state,
+            game_state.getValidMoves(),
+            answer,
+            mode,
+            control=control)
+        if control.stopped:
+            return  # the answer is unfinished
+        results.put((key, answer.get()))
+        game_state.undoMove()
+        game_state.undoMove()
+
+
+class Ponderer:
+    """
+    Background searches of the AI's answers while the human is to move.
+    start() after the AI's turn, answer() when the AI is to move again.
+    """
+
+    def __init__(self, mode="handcraft", tt_size_mb=PONDER_TT_SIZE_MB):
+        self.mode = mode
+        self.table = ChessTT.TranspositionTable(tt_size_mb, shared=True)
+        self.process = None
+        self.results = None
+        self.control = None
+        self.root_key = None  # position the ponder started from
+        self.answers = {}  # position key -> pondered move
+        self.searching = None  # position key being searched now
+
+    @property
+    def tt_name(self):
+        return self.table.name
+
+    def start(self, game_state):
+        """Ponder the human's turn in game_state (a piece move is due)"""
+        key = game_state.positionKey()
+        if key == self.root_key and self.process is not None:
+            return
+        self.stop()
+        self.root_key = key
+        self.results = Queue()
+        self.control = ChessControl.SearchControl(stop_event=Event())
+        self.process = Process(
+            target=_ponderWorker,
+            args=(
+                game_state,
+                self.mode,
+                self.tt_name,
+                self.results,
+                self.control,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+
+    def _collect(self):
+        while True:
+            try:
+                key, move = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if move == PENDING:
+                self.searching = key
+            else:
+                self.answers[key] = move
+                self.searching = None
+
+    def answer(self, game_state):
+        """
+        The pondered move for game_state. PENDING while the ponder search of
+        this very position is still running; None, with the ponder stopped,
+        when the human's turn wasn't predicted.
+        """
+        if self.process is None:
+            return None
+        self._collect()
+        key = game_state.positionKey()
+        if key not in self.answers:
+            if key == self.searching and self.process.is_alive():
+                return PENDING
+            if key == self.searching:
+                self._collect()  # its result may have landed meanwhile
+        move = self.answers.get(key)
+        self.stop()
+        return move
+
+    def stop(self):
+        """Drop the running ponder; the table keeps what it found"""
+        if self.process is not None:
+            self.control.stop()
+            self.process.join()
+        self.process = None
+        self.results = None
+        self.control = None
+        self.root_key = None
+        self.answers = {}
+        self.searching = None
+
+    def close(self):
+        self.stop()
+        self.table.close()
@@ -0,0 +1,356 @@
+"""
+Proof-number search for Duck Chess.
+Depth-first proof-number search (df-pn) answers one yes/no question exactly:
+can the side to move capture the enemy king within N of its turns, whatever
+the opponent does? Every GameState move is one node, so the duck square of
+each turn is part of the proof. Results are kept in a table of bounded size
+that drops the entries with the least work behind them when it fills up.
+"""
+
+import ChessControl
+import ChessEngine
+from ChessEval import piece_score
+
+PROOF_TURNS = 2  # turns of the side to move looked at by findBestMove
+PROOF_NODE_LIMIT = 1000  # nodes per findBestMove check, about 0.3s
+PROOF_MATERIAL = 20  # non-pawn material of both sides worth a check at any time
+PROOF_TABLE_ENTRIES = 200000
+INFINITY = 10**9
+QUIET_PROOF_NUMBER = 8  # first guess for a defender with its king unattacked
+
+# Outcome of a search
+PROVEN = "proven"
+DISPROVEN = "disproven"
+UNKNOWN = "unknown"
+
+
+class ProofResult:
+    """Outcome, the proving move (piece or duck) if proven, nodes searched"""
+
+    def __init__(self, status, move=None, turns=None, nodes=0):
+        self.status = status
+        self.move = move
+        self.turns = turns  # turns the proof needs, when proven
+        self.nodes = nodes
+
+    @property
+    def proven(self):
+        return self.status == PROVEN
+
+    def __repr__(self):
+        return (
+            f"ProofResult({self.status}, move={self.move}, "
+            f"turns={self.turns}, nodes={self.nodes})"
+        )
+
+
+class ProofTable:
+    """
+    (position key, turns left, attacker) -> (proof number, disproof number,
+    work),
+    holding at most max_entries entries. When full, the half of the entries
+    that took the least work to compute is dropped (small tree GC).
+    """
+
+    def __init__(self, max_entries=PROOF_TABLE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def store(self, key, pn, dn, work):
+        self.entries[key] = (pn, dn, work)
+        if len(self.entries) > self.max_entries:
+            self.collect()
+
+    def collect(self):
+        """Keep the half of the entries with the most work behind them"""
+        works = sorted(entry[2] for entry in self.entries.values())
+        threshold = works[len(works) // 2]
+        self.entries = {
+            key: entry for key,
+            entry in self.entries.items() if entry[2] > threshold}
+
+    def clear(self):
+        self.entries = {}
+
+
+class ProofSolver:
+    """
+    df-pn over GameState. The attacker is the side to move at the root;
+    an OR node is one where the attacker moves (a piece or the duck), an
+    AND node one where the defender does. turns counts the attacker's
+    turns left, including the current one.
+    """
+
+    def __init__(
+            self,
+            max_entries=PROOF_TABLE_ENTRIES,
+            node_limit=PROOF_NODE_LIMIT):
+        self.table = ProofTable(max_entries)
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.limit = node_limit
+        self.attacker_white = True
+
+    def solve(self, game_state, turns, node_limit=None):
+        """
+        Prove or disprove that the side to move captures the king within
+        turns of its turns. Shorter proofs are tried first, so a proven
+        result has the fewest turns. The game state is left as it was.
+        """
+        node_limit = self.node_limit if node_limit is None else node_limit
+        self.nodes = 0
+        self.attacker_white = game_state.white_to_move
+        status = DISPROVEN
+        self.limit = node_limit
+        first = 2 if game_state.duck_move_phase else 1
+        for depth in range(first, turns + 1):
+            pn, dn = self._mid(game_state, depth, INFINITY - 1, INFINITY - 1)
+            if pn == 0:
+                move = self._provingMove(game_state, depth)
+                return ProofResult(PROVEN, move, depth, self.nodes)
+            if dn != 0:
+                status = UNKNOWN  # out of nodes; deeper proofs may exist
+                break
+        return ProofResult(status, None, None, self.nodes)
+
+    # ───────────────────────── nodes ─────────────────────────
+
+    def _isOrNode(self, game_state):
+        return game_state.white_to_move == self.attacker_white
+
+    def _terminal(self, game_state, turns):
+        """(pn, dn) of a node decided without search, or None"""
+        if game_state.game_over:
+            won = game_state.winner == ("w" if self.attacker_white else "b")
+            return (0, INFINITY) if won else (INFINITY, 0)
+        if game_state.duck_move_phase:
+            return None
+        attacker = "w" if self.attacker_white else "b"
+        defender = "b" if self.attacker_white else "w"
+        if self._isOrNode(game_state):
+            king = (
+                game_state.black_king_location
+                if self.attacker_white
+                else game_state.white_king_location
+            )
+            if game_state.squareUnderAttack(*king, attacker):
+                return 0, INFINITY
+            if turns <= 1:
+                return INFINITY, 0
+        else:
+            king = (
+                game_state.white_king_location
+                if self.attacker_white
+                else game_state.black_king_location
+            )
+            if game_state.squareUnderAttack(*king, defender):
+                return INFINITY, 0
+        return None
+
+    def _key(self, game_state, turns):
+        return game_state.positionKey(), turns, self.attacker_white
+
+    def _childTurns(self, game_state, turns):
+        """Turns left after a move: the attacker's duck move ends its turn"""
+        if game_state.duck_move_phase and self._isOrNode(game_state):
+            return turns - 1
+        return turns
+
+    def _lookup(self, game_state, turns):
+        terminal = self._terminal(game_state, turns)
+        if terminal is not None:
+            return terminal
+        entry = self.table.get(self._key(game_state, turns))
+        if entry is not None:
+            return entry[:2]
+        return self._initial(game_state)
+
+    def _initial(self, game_state):
+        """
+        First guess at a new node's numbers. A defender whose king isn't
+        attacked is unlikely to lose next turn, so it starts harder to prove.
+        """
+        if game_state.duck_move_phase or self._isOrNode(game_state):
+            return 1, 1
+        king = (
+            game_state.black_king_location
+            if self.attacker_white
+            else game_state.white_king_location
+        )
+        attacker = "w" if self.attacker_white else "b"
+        if game_state.squareUnderAttack(*king, attacker):
+            return 1, 1
+        return QUIET_PROOF_NUMBER, 1
+
+    def _mid(self, game_state, turns, pn_threshold, dn_threshold):
+        """Search the node until its numbers reach a threshold"""
+        terminal = self._terminal(game_state, turns)
+        if terminal is not None:
+            return terminal
+        key = self._key(game_state, turns)
+        self.nodes += 1
+        work_started = self.nodes
+        control = ChessControl.current
+        if control is not None:
+            # Proof nodes come out of the move's budget; one costs far more
+            # than a poll, so the budget is looked at every node
+            control.nodes += 1
+            control.poll()
+
+        moves = game_state.getValidMoves()
+        or_node = self._isOrNode(game_state)
+        child_turns = self._childTurns(game_state, turns)
+        if not moves:  # no legal move is a draw
+            self.table.store(key, INFINITY, 0, 1)
+            return INFINITY, 0
+
+        # Children's numbers, refreshed only for the child just searched
+        children = []
+        for move in moves:
+            game_state.makeMove(move)
+            children.append(self._lookup(game_state, child_turns))
+            game_state.undoMove()
+
+        while True:
+            if or_node:
+                pn = min(c[0] for c in children)
+                dn = min(INFINITY, sum(c[1] for c in children))
+            else:
+                pn = min(INFINITY, sum(c[0] for c in children))
+                dn = min(c[1] for c in children)
+            if pn >= pn_threshold or dn >= dn_threshold or pn == 0 or dn == 0:
+                break
+            if self.nodes >= self.limit:
+                break
+            if control is not None and control.stopped:
+                break
+
+            # Most promising child and the runner-up's number
+            index = 0 if or_node else 1
+            order = sorted(
+                range(
+                    len(children)),
+                key=lambda i: children[i][index])
+            best = order[0]
+            second = children[order[1]][index] if len(order) > 1 else INFINITY
+            child_pn, child_dn = children[best]
+            if or_node:
+                child_pn_threshold = min(pn_threshold, second + 1)
+                child_dn_threshold = dn_threshold - dn + child_dn
+            else:
+                child_pn_threshold = pn_threshold - pn + child_pn
+                child_dn_threshold = min(dn_threshold, second + 1)
+
+            game_state.makeMove(moves[best])
+            children[best] = self._mid(
+                game_state,
+                child_turns,
+                min(child_pn_threshold, INFINITY - 1),
+                min(child_dn_threshold, INFINITY - 1),
+            )
+            game_state.undoMove()
+
+        self.table.store(key, pn, dn, self.nodes - work_started + 1)
+        return pn, dn
+
+    def _provingMove(self, game_state, turns):
+        """The root move whose child is proven"""
+        child_turns = self._childTurns(game_state, turns)
+        for move in game_state.getValidMoves():
+            game_state.makeMove(move)
+            pn = self._lookup(game_state, child_turns)[0]
+            game_state.undoMove()
+            if pn == 0:
+                return move
+        return None
+
+
+_solver = None  # shared by the findBestMove checks of this process
+
+
+def prove(game_state, turns=PROOF_TURNS, node_limit=None):
+    """solve() with this process's shared solver and table"""
+    global _solver
+    if _solver is None:
+        _solver = ProofSolver()
+    return _solver.solve(game_state, turns, node_limit)
+
+
+def worthProving(game_state, valid_moves):
+    """
+    Whether a proof search can pay off here: little material is left, or
+    the side to move has a piece move after which the enemy king is
+    attacked (the duck, which it moves next, counts as gone). In an opening
+    or a quiet middlegame the search can't succeed and costs a full budget.
+    """
+    material = 0
+    for row in game_state.board:
+        for piece in row:
+            if piece[1] not in "p-D":
+                material += piece_score[piece[1]]
+    if material <= PROOF_MATERIAL:
+        return True
+
+    attacker = "w" if game_state.white_to_move else "b"
+    king = (
+        game_state.black_king_location
+        if game_state.white_to_move
+        else game_state.white_king_location
+    )
+    if game_state.duck_move_phase:
+        return _kingAttacked(game_state, king, attacker)
+    for move in valid_moves:
+        if move.is_duck_move:
+            continue
+        game_state.makeMove(move)
+        attacked = _kingAttacked(game_state, king, attacker)
+        game_state.undoMove()
+        if attacked:
+            return True
+    return False
+
+
+def _kingAttacked(game_state, king, attacker):
+    return (
+        game_state.leastValuableAttacker(
+            *king, attacker, removed=(game_state.duck_location,)
+        )
+        is not None
+    )
+
+
+def proofMove(game_state, valid_moves, turns=PROOF_TURNS):
+    """
+    A move of a forced king capture within turns, or None. The search runs
+    only where worthProving() and within what is left of the budget of
+    ChessControl.current, whose node count it adds to.
+    """
+    if not valid_moves or game_state.game_over:
+        return None
+    if not worthProving(game_state, valid_moves):
+        return None
+    node_limit = PROOF_NODE_LIMIT
+    control = ChessControl.current
+    if control is not None:
+        if control.poll():
+            return None
+        if control.node_limit is not None:
+            node_limit = min(node_limit, control.node_limit - control.nodes)
+    result = prove(game_state, turns, node_limit)
+    if result.proven and result.move in valid_moves:
+        return result.move
+    return None
+
+
+if __name__ == "__main__":
+    import time
+
+    started = time.perf_counter()
+    print(prove(ChessEngine.GameState(), PROOF_TURNS))
+    print(f"{time.perf_counter() - started:.2f}s")
@@ -0,0 +1,133 @@
+"""
+Analysis stage for played games.
+Games record only their moves while they are played; this stage replays
+them and scores the position after each ply with a depth-5 fairy-stockfish
+search, White positive, in batches on persistent engines (the background
+engines of ChessFairy, or the evaluation broker's). submitGames() returns
+at once, so finished games are scored while others are still being played;
+collect() waits for the scores. With every=n only every n-th ply is
+scored and the others are None.
+"""
+
+import chess.engine
+
+import ChessAI
+import ChessBroker
+import ChessEngine
+import ChessEngineCache
+import ChessEval
+
+STEP_EVAL_LIMIT = chess.engine.Limit(depth=5)
+MATE_SCORE = 100000  # step score of a forced mate
+
+# Step scores by position key; openings repeated across games are scored once
+step_eval_cache = ChessEval.EvalCache()
+
+
+def recordMove(move):
+    """A played ChessEngine.Move as recorded in a game's move list"""
+    return move.start_row, move.start_col, move.end_row, move.end_col
+
+
+def replay(moves):
+    """Yield the game state after each recorded ply (the same object)"""
+    game_state = ChessEngine.GameState()
+    for recorded in moves:
+        for move in game_state.getValidMoves():
+            if recordMove(move) == tuple(recorded):
+                break
+        else:
+            raise ValueError(f"recorded move {recorded} is not legal")
+        game_state.makeMove(move)
+        yield game_state
+
+
+def stepScore(score):
+    """White's view of an engine PovScore, mates as +-MATE_SCORE"""
+    if score.is_mate():
+        return MATE_SCORE if score.white().mate() > 0 else -MATE_SCORE
+    return score.white().score()
+
+
+class PendingScores:
+    """Step scores of games from submitGames(); collect() fills them in"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.scores = []  # per game, a score or None per ply
+        self.positions = []  # (key, duck FEN) of every position sent
+        self.plies = []  # (scores of its game, ply, key) of plies waiting
+        self.future = None
+
+    def collect(self):
+        """The step scores of every game, None where a ply wasn't scored"""
+        if self.future is None:
+            return self.scores
+        try:
+            results = self.future.result()
+        except Exception as e:
+            print(f"[Error] 評估失敗：{e} 在ChessScoring.py")
+            results = [None] * len(self.positions)
+        self.future = None
+        network = ChessEngineCache.networkKey()
+        scored = {}
+        for (key, duck_fen), result in zip(self.positions, results):
+            if result is None or "score" not in result:
+                continue
+            scored[key] = stepScore(result["score"])
+            step_eval_cache.put(key, scored[key])
+            pv = result.get("pv")
+            ChessEngineCache.getCache().put(
+                duck_fen,
+                self.limit,
+                network,
+                result["score"],
+                pv[0].uci() if pv else None,
+            )
+        for scores, ply, key in self.plies:
+            scores[ply] = scored.get(key)
+        return self.scores
+
+
+def submitGames(games, every=1, limit=STEP_EVAL_LIMIT):
+    """
+    Start scoring games, each a list of recorded moves, and return their
+    PendingScores at once. Positions cached in memory or on disk aren't
+    sent to the engines, nor is a position more than once.
+    """
+    pending = PendingScores(limit)
+    network = ChessEngineCache.networkKey()
+    sent = set()  # keys of the positions sent
+    fens = []
+    for moves in games:
+        scores = []
+        pending.scores.append(scores)
+        for ply, game_state in enumerate(replay(moves)):
+            scores.append(None)
+            if (ply + 1) % every:
+                continue
+            key = game_state.positionKey()
+            score = step_eval_cache.get(key)
+            duck_fen = None
+            if score is None:
+                duck_fen = ChessAI.convert_to_fen(game_state, duck=True)
+                stored = ChessEngineCache.getCache().get(duck_fen, limit, network)
+                if stored is not None:
+                    score = stepScore(stored[0])
+                    step_eval_cache.put(key, score)
+            if score is not None:
+                scores[ply] = score
+                continue
+            if key not in sent:
+                sent.add(key)
+                pending.positions.append((key, duck_fen))
+                fens.append(ChessAI.convert_to_fen(game_state))
+            pending.plies.append((scores, ply, key))
+    if fens:
+        pending.future = ChessBroker.submitMany(fens, limit)
+    return pending
+
+
+def scoreGames(games, every=1, limit=STEP_EVAL_LIMIT):
+    """Step scores of the recorded games, scored now (see submitGames)"""
+    return submitGames(games, every, limit).collect()
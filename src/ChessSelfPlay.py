@@ -0,0 +1,187 @@
+"""
+Lock-step self-play for Duck Chess.
+Many games advance together in one process: each MCTS search selects a few
+leaves, the leaves of every game are scored in one vectorised call, and the
+values are scattered back to their trees. One process can then keep dozens
+of games going without paying Python and IPC overhead per position.
+"""
+
+import random
+
+import numpy as np
+
+import ChessEngine
+import ChessMCTS
+import ChessNNUE
+from ChessEval import boardCodes, scoreBoards
+
+SELF_PLAY_PLAYOUTS = 200  # playouts per move
+LEAVES_PER_GAME = 8  # leaves each searching game adds to a batch
+MAX_TURNS = 200  # piece moves per game before it is given up as "over200"
+MATE_SCORE = 100000  # step score of a captured king, as in ChessScoring
+
+
+def materialEvaluator(codes, white_to_move):
+    """Material + position, white positive, in pawns"""
+    return scoreBoards(codes)
+
+
+def getEvaluator(evaluator):
+    """A batch evaluator from a name ("material" or "nnue") or a callable"""
+    if callable(evaluator):
+        return evaluator
+    if evaluator == "material":
+        return materialEvaluator
+    if evaluator == "nnue":
+        network = ChessNNUE.loadNetwork()
+        if network is None:
+            raise FileNotFoundError(ChessNNUE.NNUE_PATH)
+        return network.evaluateBatch
+    raise ValueError(f"unknown evaluator: {evaluator}")
+
+
+class SelfPlayGame:
+    """One game of a lock-step run and its per-side MCTS players"""
+
+    def __init__(self, player_one, player_two):
+        self.state = ChessEngine.GameState()
+        # MCTS players by white_to_move; random players have none
+        self.players = {
+            white: ChessMCTS.MCTSPlayer()
+            for white, player_type in ((True, player_one), (False, player_two))
+            if player_type == "ai_mcts"
+        }
+        self.step_scores = []
+        self.turns = 0
+        self.move = None
+        self.playouts = 0
+
+    @property
+    def player(self):
+        return self.players.get(self.state.white_to_move)
+
+    def result(self):
+        """(label, step scores), as ChessMain.run_lockstep_games reports"""
+        if self.state.winner == "w":
+            return "White", self.step_scores
+        if self.state.winner == "b":
+            return "Black", self.step_scores
+        if self.turns > MAX_TURNS:
+            return "over200", self.step_scores
+        return "Draw", self.step_scores
+
+
+def playGames(
+    num_games,
+    player_one="ai_mcts",
+    player_two="ai_mcts",
+    evaluator="material",
+    playouts=SELF_PLAY_PLAYOUTS,
+):
+    """Play num_games games side by side and return their results"""
+    games = runGames(num_games, player_one, player_two, evaluator, playouts)
+    return [game.result() for game in games]
+
+
+def runGames(
+    num_games,
+    player_one="ai_mcts",
+    player_two="ai_mcts",
+    evaluator="material",
+    playouts=SELF_PLAY_PLAYOUTS,
+    sample_plies=0,
+):
+    """
+    Play num_games games side by side and return the finished games.
+    Players are "ai_mcts" or "ai_random". evaluator scores a batch of
+    boards, white positive in pawns: "material", "nnue" or a callable taking
+    an (N, 64) array of ChessEval.boardCodes rows and the sides to move.
+    Step scores are the same evaluator's scores in centipawns. MCTS moves
+    of the first sample_plies plies are drawn by visit count instead of
+    always taking the most visited one, so the games differ.
+    """
+    for player_type in (player_one, player_two):
+        if player_type not in ("ai_mcts", "ai_random"):
+            raise ValueError(f"{player_type} can't play lock-step games")
+    evaluator = getEvaluator(evaluator)
+
+    games = [SelfPlayGame(player_one, player_two) for _ in range(num_games)]
+    active = list(games)
+    while active:
+        # Start this move's search in every game
+        searching = []
+        for game in active:
+            valid_moves = game.state.getValidMoves()
+            game.playouts = 0
+            if game.player is None:
+                game.move = random.choice(valid_moves)
+                continue
+            game.move = game.player.begin(game.state, valid_moves)
+            if game.move is None and game.player.root.moves:
+                searching.append(game)
+
+        # Lock-step playouts: one evaluator call per round for every game
+        while searching:
+            codes, sides, batches = [], [], []
+
+            def onLeaf(game_state):
+                codes.append(boardCodes(game_state.board))
+                sides.append(game_state.white_to_move)
+
+            for game in searching:
+                size = min(LEAVES_PER_GAME, playouts - game.playouts)
+                batches.append(
+                    game.player.selectBatch(
+                        game.state, size, onLeaf))
+                game.playouts += size
+
+            values = []
+            if codes:
+                sides = np.array(sides)
+                scores = evaluator(np.array(codes), sides)
+                values = np.tanh(
+                    np.where(sides, scores, -scores) / ChessMCTS.VALUE_SCALE
+                )
+            start = 0
+            for game, batch in zip(searching, batches):
+                game.player.backupBatch(
+                    batch, values[start: start + len(batch)])
+                start += len(batch)
+            searching = [
+                game for game in searching if game.playouts < playouts]
+
+        # Play every game's move, then score the new positions in one batch
+        for game in active:
+            if game.move is None:
+                sample = len(game.state.move_log) < sample_plies
+                game.move = game.player.bestMove(1 if sample else 0)
+            if not game.move.is_duck_move:
+                game.turns += 1
+            game.state.makeMove(game.move)
+
+        running = [game for game in active if not game.state.game_over]
+        if running:
+            scores = evaluator(
+                np.array([boardCodes(game.state.board) for game in running]),
+                np.array([game.state.white_to_move for game in running]),
+            )
+            for game, score in zip(running, scores):
+                game.step_scores.append(float(score) * 100)
+        for game in active:
+            if game.state.game_over:
+                if game.state.winner == "w":
+                    game.step_scores.append(MATE_SCORE)
+                elif game.state.winner == "b":
+                    game.step_scores.append(-MATE_SCORE)
+                else:
+                    game.step_scores.append(0)
+
+        active = [
+            game
+            for game in active
+            if not game.state.game_over
+            and game.turns <= MAX_TURNS
+            and game.state.getValidMoves()
+        ]
+
+    return games
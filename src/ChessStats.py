@@ -0,0 +1,160 @@
+"""
+Search statistics.
+Every findBestMove returns a SearchStats for its move when collection is
+switched on with enable(), and None otherwise. The searches count into
+ChessStats.current, so while collection is off each counting site only
+tests one global for None.
+"""
+
+import time
+
+# Counters summed by SearchStats.add, in the order workers report them
+COUNTERS = (
+    "piece_nodes",  # positions searched with a piece to move
+    "duck_nodes",  # duck placements searched
+    "qnodes",  # quiescence positions
+    "cutoffs",  # beta cutoffs
+    "first_move_cutoffs",  # beta cutoffs by the first move tried
+    "tt_probes",
+    "tt_hits",
+    "eval_probes",  # static eval cache lookups
+    "eval_hits",
+)
+
+enabled = False
+current = None  # SearchStats of the search running in this process
+
+
+def enable(on=True):
+    """Switch collection on (or off) for this process"""
+    global enabled
+    enabled = on
+
+
+class SearchStats:
+    """Counters, depth and time of one move search (or a sum of them)"""
+
+    def __init__(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.depth = 0  # deepest completed depth, in full turns (MCTS: plies)
+        self.elapsed = 0.0  # seconds
+        self.source = "search"  # or "book", "tablebase", "proof"
+        self.moves = 0  # moves summed up by add()
+        self.started = time.perf_counter()
+        self.tables = []  # (kind, table, hits, lookups) at begin()
+
+    @property
+    def nodes(self):
+        return self.piece_nodes + self.duck_nodes + self.qnodes
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def eval_hit_rate(self):
+        return self.eval_hits / self.eval_probes if self.eval_probes else 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def counters(self):
+        return [getattr(self, name) for name in COUNTERS]
+
+    def addCounters(self, values):
+        """Add counters reported by a worker process (see counters())"""
+        for name, value in zip(COUNTERS, values):
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        """counters() so far, with table hits since begin() included"""
+        values = dict(zip(COUNTERS, self.counters()))
+        for kind, table, hits, lookups in self.tables:
+            if kind == "tt":
+                values["tt_hits"] += table.hits - hits
+                values["tt_probes"] += table.probes - lookups
+            else:
+                values["eval_hits"] += table.hits - hits
+                values["eval_probes"] += table.hits + table.misses - lookups
+        return [values[name] for name in COUNTERS]
+
+    def add(self, other):
+        """Fold another move's stats into this one, e.g. for a whole game"""
+        self.addCounters(other.counters())
+        self.depth = max(self.depth, other.depth)
+        self.elapsed += other.elapsed
+        self.moves += other.moves or 1
+        return self
+
+    def asDict(self):
+        result = {name: getattr(self, name) for name in COUNTERS}
+        result.update(
+            nodes=self.nodes,
+            nps=self.nps,
+            tt_hit_rate=self.tt_hit_rate,
+            eval_hit_rate=self.eval_hit_rate,
+            first_move_cutoff_rate=self.first_move_cutoff_rate,
+            depth=self.depth,
+            elapsed=self.elapsed,
+            source=self.source,
+            moves=self.moves,
+        )
+        return result
+
+    def __repr__(self):
+        return (
+            f"SearchStats({self.source}, nodes={self.nodes} "
+            f"(piece {self.piece_nodes}, duck {self.duck_nodes}, "
+            f"q {self.qnodes}), depth={self.depth}, "
+            f"{self.elapsed:.3f}s, {self.nps:.0f} nps, "
+            f"tt {self.tt_hit_rate:.0%}, eval cache {self.eval_hit_rate:.0%}, "
+            f"first-move cutoffs {self.first_move_cutoff_rate:.0%})"
+        )
+
+
+def begin(tt=None, eval_cache=None):
+    """
+    Start the stats of one findBestMove call in this process, or return
+    None when collection is off. Hits of the given transposition table and
+    eval cache are counted from here on.
+    """
+    global current
+    if not enabled:
+        current = None
+        return None
+    current = SearchStats()
+    if tt is not None:
+        current.tables.append(("tt", tt, tt.hits, tt.probes))
+    if eval_cache is not None:
+        current.tables.append(
+            ("eval",
+             eval_cache,
+             eval_cache.hits,
+             eval_cache.hits +
+             eval_cache.misses))
+    return current
+
+
+def end(stats, source=None, depth=None):
+    """Finish stats from begin() (None passes through) and return them"""
+    global current
+    if stats is None:
+        return None
+    if source is not None:
+        stats.source = source
+    if depth is not None:
+        stats.depth = depth
+    values = stats.snapshot()
+    stats.tables = []
+    for name, value in zip(COUNTERS, values):
+        setattr(stats, name, value)
+    stats.elapsed = time.perf_counter() - stats.started
+    if current is stats:
+        current = None
+    return stats
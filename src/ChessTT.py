@@ -0,0 +1,260 @@
+"""
+Transposition table for the handcraft search.
+Entries live in a NumPy array that can sit in multiprocessing.shared_memory,
+so several search processes can share one table without locks. A table can
+be saved to disk and loaded again, so deep results outlive the process.
+"""
+
+import mmap
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import ChessEngine
+from ChessEval import EVAL_VERSION
+
+# Bound types stored with each score
+EXACT = 0
+LOWER_BOUND = 1  # score >= stored value (fail high)
+UPPER_BOUND = 2  # score <= stored value (fail low)
+
+NO_SQUARE = 64  # stored duck square when an entry has no duck reply
+ENTRY_WORDS = 2  # [key ^ data, data]
+MASK_64 = (1 << 64) - 1
+
+# Python < 3.13 registers a block with the resource tracker even when only
+# attaching to it (POSIX only), so attach() unregisters it again
+TRACKS_ATTACHED = sys.version_info < (3, 13) and os.name == "posix"
+
+TT_PATH = os.path.join(os.path.dirname(__file__), "duck_tt.bin")
+TT_MAGIC = b"DUCKHASH"
+TT_VERSION = 1
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("eval_version", "<u4"),  # ChessEval.EVAL_VERSION of the scores
+        ("entries", "<u8"),
+        ("start_key", "<u8"),  # start position key, to catch other hashing
+    ]
+)
+
+
+def packEntry(score, depth, flag, move=None, duck_square=None):
+    """
+    Pack one result into 64 bits:
+    score as float32 (bits 0-31), depth (32-39), flag (40-41),
+    move start square (42-47), move end square (48-53), duck square (54-60).
+    """
+    score_bits = int(np.array(score, dtype=np.float32).view(np.uint32))
+    start, end = (0, 0) if move is None else move
+    duck = NO_SQUARE if duck_square is None else duck_square
+    return (
+        score_bits
+        | (min(depth, 255) << 32)
+        | (flag << 40)
+        | (start << 42)
+        | (end << 48)
+        | (duck << 54)
+    )
+
+
+def unpackEntry(data):
+    """Inverse of packEntry: (score, depth, flag, (start, end) or None, duck)"""
+    score = float(
+        np.array(
+            data & 0xFFFFFFFF,
+            dtype=np.uint32).view(
+            np.float32))
+    depth = (data >> 32) & 0xFF
+    flag = (data >> 40) & 0x3
+    start = (data >> 42) & 0x3F
+    end = (data >> 48) & 0x3F
+    duck = (data >> 54) & 0x7F
+    move = None if start == end else (start, end)
+    return score, depth, flag, move, None if duck == NO_SQUARE else duck
+
+
+class TranspositionTable:
+    """
+    Fixed-size, always-power-of-two hash table of search results.
+
+    Each slot holds two 64-bit words, key ^ data and data. A reader only
+    accepts a slot whose words XOR back to its own key, so a slot torn by
+    two processes writing at once just looks like a miss (lockless hashing).
+    Pass shared=True to place the table in shared memory, and attach to it
+    from other processes with TranspositionTable.attach(name).
+    """
+
+    def __init__(self, size_mb=16, shared=False, _shm=None, _mmap=None):
+        if _mmap is not None:
+            entries = int(_readHeader(_mmap)["entries"])
+        elif _shm is None:
+            entries = max(1, (size_mb * 1024 * 1024) // (ENTRY_WORDS * 8))
+            entries = 1 << (entries.bit_length() - 1)  # round down to 2^n
+            nbytes = entries * ENTRY_WORDS * 8
+            if shared:
+                _shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            entries = _shm.size // (ENTRY_WORDS * 8)
+            entries = 1 << (entries.bit_length() - 1)
+
+        self.shm = _shm
+        self.mmap = _mmap
+        if _mmap is not None:
+            # Copy-on-write: pages stay shared with the file until written
+            self.table = np.frombuffer(
+                _mmap,
+                dtype=np.uint64,
+                count=entries * ENTRY_WORDS,
+                offset=HEADER.itemsize,
+            ).reshape(entries, ENTRY_WORDS)
+        elif _shm is None:
+            self.table = np.zeros((entries, ENTRY_WORDS), dtype=np.uint64)
+        else:
+            self.table = np.ndarray(
+                (entries, ENTRY_WORDS), dtype=np.uint64, buffer=_shm.buf
+            )
+            if shared:
+                self.table[:] = 0
+        self.mask = entries - 1
+        self.owner = shared
+        self.hits = 0
+        self.probes = 0
+
+    @classmethod
+    def attach(cls, name):
+        """Open a shared table created by another process"""
+        try:
+            # Only the creating process should unlink the block at exit
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13 always tracks
+            shm = shared_memory.SharedMemory(name=name)
+            if TRACKS_ATTACHED:
+                resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(_shm=shm)
+
+    @classmethod
+    def load(cls, path=TT_PATH, shared=False):
+        """
+        Open a table written by save(). The file is mapped copy-on-write, so
+        processes loading it share its pages until they store into them; with
+        shared=True it is copied into a new shared-memory table instead.
+        Raises ValueError for a file of another format or eval version.
+        """
+        with open(path, "rb") as f:
+            file_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        try:
+            header = _readHeader(file_map)
+            if header["magic"] != TT_MAGIC or header["version"] != TT_VERSION:
+                raise ValueError(f"{path} is not a version {TT_VERSION} table")
+            if header["eval_version"] != EVAL_VERSION:
+                raise ValueError(
+                    f"{path} holds scores of eval version "
+                    f"{header['eval_version']}, not {EVAL_VERSION}"
+                )
+            if header["start_key"] != ChessEngine.GameState().positionKey():
+                raise ValueError(f"{path} was saved with other position keys")
+        except ValueError:
+            file_map.close()
+            raise
+        table = cls(_mmap=file_map)
+        if not shared:
+            return table
+
+        warm = cls(
+            _shm=shared_memory.SharedMemory(
+                create=True,
+                size=table.table.nbytes))
+        warm.owner = True
+        warm.table[:] = table.table
+        table.close()
+        return warm
+
+    def save(self, path=TT_PATH):
+        """Write the table to path, replacing any older file at once"""
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = TT_MAGIC
+        header["version"] = TT_VERSION
+        header["eval_version"] = EVAL_VERSION
+        header["entries"] = len(self)
+        header["start_key"] = ChessEngine.GameState().positionKey()
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(self.table.tobytes())
+        os.replace(temp_path, path)
+
+    @property
+    def name(self):
+        return None if self.shm is None else self.shm.name
+
+    def __len__(self):
+        return self.mask + 1
+
+    def probe(self, key):
+        """Return (score, depth, flag, move, duck_square) for key, or None"""
+        self.probes += 1
+        slot = self.table[key & self.mask]
+        data = int(slot[1])
+        if int(slot[0]) ^ data != key or data == 0:
+            return None
+        self.hits += 1
+        return unpackEntry(data)
+
+    def store(self, key, score, depth, flag, move=None, duck_square=None):
+        """Save a result; a deeper result for the same position is kept"""
+        slot = self.table[key & self.mask]
+        old_data = int(slot[1])
+        if int(slot[0]) ^ old_data == key and (old_data >> 32) & 0xFF > depth:
+            return
+        data = packEntry(score, depth, flag, move, duck_square)
+        slot[0] = (key ^ data) & MASK_64
+        slot[1] = data
+
+    def clear(self):
+        self.table[:] = 0
+        self.hits = 0
+        self.probes = 0
+
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def close(self):
+        """Release the shared block (and free it if this process created it)"""
+        if self.mmap is not None:
+            self.table = None
+            self.mmap.close()
+            self.mmap = None
+        if self.shm is None:
+            return
+        self.table = None
+        self.shm.close()
+        if self.owner:
+            if TRACKS_ATTACHED:
+                # A process attached to it dropped it from the shared tracker
+                resource_tracker.register(self.shm._name, "shared_memory")
+            self.shm.unlink()
+        self.shm = None
+
+
+def _readHeader(file_map):
+    if len(file_map) < HEADER.itemsize:
+        raise ValueError("file too short for a table header")
+    return np.frombuffer(file_map, dtype=HEADER, count=1).copy()[0]
+
+
+def loadTable(path=TT_PATH, size_mb=16, shared=False):
+    """
+    The table saved at path, or a new empty one of size_mb if there is no
+    file or it can't be used (old format, other eval version)
+    """
+    if os.path.exists(path):
+        try:
+            return TranspositionTable.load(path, shared=shared)
+        except ValueError:
+            pass
+    return TranspositionTable(size_mb, shared=shared)
@@ -0,0 +1,436 @@
+"""
+Endgame tablebases for Duck Chess.
+Small piece sets (a lone king against king + queen or king + rook) are
+solved by retrograde analysis: every placement of the pieces and the duck
+gets its exact result under best play, as the number of turns until a king
+is captured. Tables are written as flat int8 files and opened with mmap,
+so a probe is one lookup and processes share the same pages.
+
+Values are for the side to move at the start of a turn (piece phase):
+WIN - n means the king is captured n turns (of either side) from now,
+so WIN itself is a capture this turn, and -(WIN - n) is a loss in n
+turns; 0 is a draw. Tables ignore castling and the 50-move rule, and a
+side with no legal move draws, as in ChessMain.
+"""
+
+import mmap
+import os
+import random
+
+import numpy as np
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(__file__), "tablebases")
+TABLEBASE_MAGIC = b"DUCKEGTB"
+TABLEBASE_VERSION = 1
+TABLEBASE_SIGNATURES = ("KvK", "KQvK", "KRvK")  # built by __main__
+MAX_TABLEBASE_MEN = 3  # pieces on the board (the duck aside) worth probing
+
+WIN = 120  # value of a turn that captures the king
+NO_MOVE = -128  # placeholder while looking for a side's best move
+INVALID = 127  # two things on one square
+
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("men", "<u4"),  # pieces in the table, the duck not counted
+        ("signature", "S8"),
+    ]
+)
+
+# (directions, squares a move can go)
+PIECE_MOVES = {
+    "K": (
+        [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)],
+        1,
+    ),
+    "Q": (
+        [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)],
+        7,
+    ),
+    "R": ([(-1, 0), (1, 0), (0, -1), (0, 1)], 7),
+    "B": ([(-1, -1), (-1, 1), (1, -1), (1, 1)], 7),
+    "N": (
+        [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)],
+        1,
+    ),
+}
+PIECE_ORDER = "KQRBN"
+
+_tables = {}  # signature -> open Tablebase, or None if there is no file
+
+
+def parseSignature(signature):
+    """ "KQvK" -> [("w", "K"), ("w", "Q"), ("b", "K")], strong side white"""
+    strong, weak = signature.split("v")
+    for side in (strong, weak):
+        if (
+            side[:1] != "K"
+            or len(set(side)) < len(side)
+            or not set(side) <= set(PIECE_ORDER)
+        ):
+            raise ValueError(f"unsupported signature: {signature}")
+    return [("w", kind) for kind in strong] + [("b", kind) for kind in weak]
+
+
+def tablePath(signature):
+    return os.path.join(TABLEBASE_DIR, f"{signature}.bin")
+
+
+def shrink(values):
+    """One turn further away: wins and losses move towards a draw"""
+    return values - np.sign(values)
+
+
+class Tablebase:
+    """Read-only view of a table file through mmap"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self.mmap, dtype=HEADER, count=1)[0]
+        if header["magic"] != TABLEBASE_MAGIC or header["version"] != TABLEBASE_VERSION:
+            raise ValueError(
+                f"{path} is not a version {TABLEBASE_VERSION} tablebase")
+        self.signature = header["signature"].decode()
+        self.men = int(header["men"])
+        # [strong side to move?][piece squares..., duck square]
+        self.values = np.frombuffer(
+            self.mmap, dtype=np.int8, offset=HEADER.itemsize
+        ).reshape(2, 64 ** (self.men + 1))
+
+    def duckValues(self, strong_to_move, squares):
+        """Values for the side to move, one per duck square"""
+        index = 0
+        for square in squares:
+            index = index * 64 + square
+        return self.values[0 if strong_to_move else 1,
+                           index * 64: index * 64 + 64]
+
+    def close(self):
+        self.values = None
+        self.mmap.close()
+
+
+def openTable(signature):
+    """The table for a signature, opened once per process, or None"""
+    if signature not in _tables:
+        path = tablePath(signature)
+        _tables[signature] = Tablebase(path) if os.path.exists(path) else None
+    return _tables[signature]
+
+
+def _lookup(game_state, white_to_move):
+    """
+    (table, strong side to move, piece squares, board flipped) for the
+    position with white_to_move to play, or None if no table covers it.
+    A table is stored with the strong side as white; when black is the
+    strong side the board is mirrored top to bottom.
+    """
+    pieces = {"w": [], "b": []}
+    for row in range(8):
+        for col in range(8):
+            piece = game_state.board[row][col]
+            if piece == "--" or piece == "DD":
+                continue
+            pieces[piece[0]].append((piece[1], row, col))
+            if len(pieces["w"]) + len(pieces["b"]) > MAX_TABLEBASE_MEN:
+                return None
+
+    for side in pieces.values():
+        side.sort(key=lambda p: PIECE_ORDER.index(p[0]))
+    for strong, weak, flip in (("w", "b", False), ("b", "w", True)):
+        signature = (
+            "".join(p[0] for p in pieces[strong])
+            + "v"
+            + "".join(p[0] for p in pieces[weak])
+        )
+        if signature not in TABLEBASE_SIGNATURES:
+            continue
+        table = openTable(signature)
+        if table is None:
+            return None
+        squares = [
+            ((7 - row) if flip else row) * 8 + col
+            for _, row, col in pieces[strong] + pieces[weak]
+        ]
+        strong_to_move = white_to_move != flip
+        return table, strong_to_move, squares, flip
+    return None
+
+
+def _afterDuck(game_state, duck_moves):
+    """
+    Values for the opponent after each duck move of the side to move,
+    or None if no table covers the position
+    """
+    found = _lookup(game_state, not game_state.white_to_move)
+    if found is None:
+        return None
+    table, strong_to_move, squares, flip = found
+    values = table.duckValues(strong_to_move, squares)
+    return np.array(
+        [
+            values[((7 - m.end_row) if flip else m.end_row) * 8 + m.end_col]
+            for m in duck_moves
+        ],
+        dtype=int,
+    )
+
+
+def probe(game_state):
+    """Value of a piece-phase position for the side to move, or None"""
+    if game_state.game_over or game_state.duck_move_phase:
+        return None
+    found = _lookup(game_state, game_state.white_to_move)
+    if found is None:
+        return None
+    table, strong_to_move, squares, flip = found
+    duck_row, duck_col = game_state.duck_location
+    duck = ((7 - duck_row) if flip else duck_row) * 8 + duck_col
+    return int(table.duckValues(strong_to_move, squares)[duck])
+
+
+def tablebaseMove(game_state, valid_moves):
+    """
+    The tablebase move (piece or duck) for the side to move, or None when
+    no table covers the position. Wins are played out by the fastest line,
+    losses by the slowest; among equal moves one is drawn at random.
+    """
+    if not valid_moves or game_state.game_over:
+        return None
+
+    if game_state.duck_move_phase:
+        values = _afterDuck(game_state, valid_moves)
+        if values is None:
+            return None
+        scores = shrink(-values)
+    else:
+        if any(m.is_castle_move for m in valid_moves):
+            return None  # the tables leave castling out
+        if _lookup(game_state, game_state.white_to_move) is None:
+            return None
+        enemy_king = "bK" if game_state.white_to_move else "wK"
+        scores = []
+        for move in valid_moves:
+            if move.piece_captured == enemy_king:
+                return move
+            game_state.makeMove(move)
+            if game_state.game_over:
+                scores.append(0)  # 50-move rule
+            else:
+                values = _afterDuck(game_state, game_state.getValidMoves())
+                if values is None:
+                    game_state.undoMove()
+                    return None
+                scores.append(int(shrink(-values.min())))
+            game_state.undoMove()
+        scores = np.array(scores)
+
+    best = np.flatnonzero(scores == scores.max())
+    return valid_moves[int(random.choice(best))]
+
+
+# ───────────────────────── Retrograde solver ─────────────────────────
+#
+# A table is an array with two axes (row, col) for each piece and two for
+# the duck, so a piece move is a shifted slice of the array. The duck
+# square is chosen by the side that just moved: after[c, d] is the best
+# result over every duck square of configuration c except the old square d,
+# which comes from the two smallest opponent values per configuration.
+
+
+def _axisRange(axis, ndim):
+    shape = [1] * ndim
+    shape[axis] = 8
+    return np.arange(8).reshape(shape)
+
+
+def _onSquare(i, j, dr, dc, ndim):
+    """Mask: thing j stands (dr, dc) away from thing i"""
+    return (_axisRange(2 * j, ndim) == _axisRange(2 * i, ndim) + dr) & (
+        _axisRange(2 * j + 1, ndim) == _axisRange(2 * i + 1, ndim) + dc
+    )
+
+
+def _validMask(count):
+    """Mask of placements where no two of count things share a square"""
+    ndim = 2 * count
+    valid = np.ones((8, 8) * count, dtype=bool)
+    for i in range(count):
+        for j in range(i + 1, count):
+            valid &= ~_onSquare(i, j, 0, 0, ndim)
+    return valid
+
+
+def _afterMove(opponent_values):
+    """
+    after[c, d]: the mover's value once it has moved into piece placement c
+    with the duck still on d, and then put the duck on its best square
+    """
+    shape = opponent_values.shape
+    values = opponent_values.reshape(-1, 64)
+    two = np.partition(values, 1, axis=1)[:, :2]
+    lowest = values.argmin(axis=1)
+    worst_for_opponent = np.where(
+        np.arange(64) == lowest[:, None], two[:, 1:2], two[:, 0:1]
+    )
+    return shrink(-worst_for_opponent).reshape(shape)
+
+
+def _fillCaptures(after, pieces, mover, sub_afters):
+    """
+    Set the placements where a mover's piece shares a square with an
+    opponent's piece: a captured king wins, any other capture continues
+    in the smaller table
+    """
+    after64 = after.reshape((64,) * (len(pieces) + 1))
+    for i, (color_i, _) in enumerate(pieces):
+        if color_i != mover:
+            continue
+        for j, (color_j, kind_j) in enumerate(pieces):
+            if color_j == mover:
+                continue
+            sub64 = None
+            if kind_j != "K":
+                sub64 = sub_afters[j].reshape((64,) * len(pieces))
+            for square in range(64):
+                index = [slice(None)] * (len(pieces) + 1)
+                index[i] = index[j] = square
+                if sub64 is None:
+                    after64[tuple(index)] = WIN
+                else:
+                    after64[tuple(index)] = sub64[tuple(
+                        index[:j] + index[j + 1:])]
+
+
+def _bestMoves(pieces, mover, after):
+    """Each placement's value for the mover: the best of its piece moves"""
+    count = len(pieces) + 1
+    ndim = 2 * count
+    duck = len(pieces)
+    best = np.full(after.shape, NO_MOVE, dtype=np.int8)
+    for i, (color, kind) in enumerate(pieces):
+        if color != mover:
+            continue
+        own = [j for j, p in enumerate(pieces) if p[0] == mover and j != i]
+        enemy = [j for j, p in enumerate(pieces) if p[0] != mover]
+        directions, reach = PIECE_MOVES[kind]
+        for dr, dc in directions:
+            path_clear = np.ones(after.shape, dtype=bool)
+            for step in range(1, reach + 1):
+                tr, tc = step * dr, step * dc
+                if abs(tr) > 7 or abs(tc) > 7:
+                    break
+                source = [slice(None)] * ndim
+                target = [slice(None)] * ndim
+                source[2 * i] = slice(max(0, -tr), 8 - max(0, tr))
+                target[2 * i] = slice(max(0, tr), 8 - max(0, -tr))
+                source[2 * i + 1] = slice(max(0, -tc), 8 - max(0, tc))
+                target[2 * i + 1] = slice(max(0, tc), 8 - max(0, -tc))
+                source, target = tuple(source), tuple(target)
+
+                blocked = _onSquare(i, duck, tr, tc, ndim)
+                for j in own:
+                    blocked = blocked | _onSquare(i, j, tr, tc, ndim)
+                occupied = blocked
+                for j in enemy:
+                    occupied = occupied | _onSquare(i, j, tr, tc, ndim)
+
+                legal = (
+                    path_clear[source] & ~np.broadcast_to(
+                        blocked, after.shape)[source])
+                np.maximum(
+                    best[source],
+                    np.where(legal, after[target], NO_MOVE),
+                    out=best[source],
+                )
+                path_clear[source] &= ~np.broadcast_to(
+                    occupied, after.shape)[source]
+                if not path_clear[source].any():
+                    break
+    return best
+
+
+def solve(signature, solved=None):
+    """
+    Retrograde solution of a signature: (white to move, black to move)
+    value arrays of shape (8, 8) per piece plus (8, 8) for the duck, white
+    being the strong side. Smaller tables reached by captures are solved
+    first and kept in solved.
+    """
+    solved = {} if solved is None else solved
+    if signature in solved:
+        return solved[signature]
+    pieces = parseSignature(signature)
+    valid = _validMask(len(pieces) + 1)
+
+    # after-move arrays of the smaller tables, by captured piece
+    sub_afters = {"w": {}, "b": {}}
+    strong, weak = signature.split("v")
+    for j, (color, kind) in enumerate(pieces):
+        if kind == "K":
+            continue
+        if color == "w":
+            sub_signature = strong.replace(kind, "") + "v" + weak
+        else:
+            sub_signature = strong + "v" + weak.replace(kind, "")
+        sub_white, sub_black = solve(sub_signature, solved)
+        mover = "b" if color == "w" else "w"
+        sub_afters[mover][j] = _afterMove(
+            sub_black if mover == "w" else sub_white)
+
+    values = {
+        "w": np.where(valid, 0, INVALID).astype(np.int8),
+        "b": np.where(valid, 0, INVALID).astype(np.int8),
+    }
+    while True:
+        new_values = {}
+        for mover, opponent in (("w", "b"), ("b", "w")):
+            after = _afterMove(values[opponent])
+            _fillCaptures(after, pieces, mover, sub_afters[mover])
+            best = _bestMoves(pieces, mover, after)
+            best[best == NO_MOVE] = 0  # no legal move: a draw
+            new_values[mover] = np.where(valid, best, INVALID).astype(np.int8)
+        if all(np.array_equal(new_values[c], values[c]) for c in "wb"):
+            break
+        values = new_values
+
+    solved[signature] = (values["w"], values["b"])
+    return solved[signature]
+
+
+def writeTable(signature, white_values, black_values, path=None):
+    """Write a solved table; returns its path"""
+    path = tablePath(signature) if path is None else path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = np.zeros(1, dtype=HEADER)
+    header["magic"] = TABLEBASE_MAGIC
+    header["version"] = TABLEBASE_VERSION
+    header["men"] = len(parseSignature(signature))
+    header["signature"] = signature.encode()
+
+    # Write next to the target and swap in, so readers never see half a table
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(white_values.tobytes())
+        f.write(black_values.tobytes())
+    os.replace(temp_path, path)
+    _tables.pop(signature, None)
+    return path
+
+
+def buildTables(signatures=TABLEBASE_SIGNATURES):
+    """Solve and write every table in signatures"""
+    solved = {}
+    paths = []
+    for signature in signatures:
+        white_values, black_values = solve(signature, solved)
+        paths.append(writeTable(signature, white_values, black_values))
+    return paths
+
+
+if __name__ == "__main__":
+    for path in buildTables():
+        print(f"Tablebase saved as: {path}")
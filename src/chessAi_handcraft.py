@@ -5,239 +5,384 @@ Handling the AI moves for Duck Chess.
 import math
 import random
 
-# Piece values and position scores remain the same as before
-piece_score = {
-    "K": 0,
-    "Q": 9,
-    "R": 5,
-    "B": 3,
-    "N": 3,
-    "p": 1,
-    "D": 0,
-}  # Duck has 0 value
-
-knight_scores = [
-    [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-    [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
-    [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
-    [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
-    [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
-    [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
-    [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
-    [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-]
-
-bishop_scores = [
-    [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-    [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-    [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
-    [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
-    [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
-    [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
-    [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
-    [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-]
-
-rook_scores = [
-    [0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
-    [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-    [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25],
-]
-
-queen_scores = [
-    [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-    [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-    [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-    [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-    [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-    [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-    [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
-    [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-]
-
-pawn_scores = [
-    [0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
-    [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
-    [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
-    [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
-    [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
-    [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
-    [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
-    [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2],
-]
-
-piece_position_scores = {
-    "wN": knight_scores,
-    "bN": knight_scores[::-1],
-    "wB": bishop_scores,
-    "bB": bishop_scores[::-1],
-    "wQ": queen_scores,
-    "bQ": queen_scores[::-1],
-    "wR": rook_scores,
-    "bR": rook_scores[::-1],
-    "wp": pawn_scores,
-    "bp": pawn_scores[::-1],
-}
-
-# Add duck position scores (ducks are best in the center)
-duck_scores = [
-    [0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
-    [0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.3, 0.3, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.3, 0.3, 0.3, 0.3, 0.2, 0.1],
-    [0.1, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.1],
-    [0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
-]
-
-piece_position_scores["DD"] = duck_scores
-
-
-CHECKMATE = 1000
-STALEMATE = 0
+import ChessBook
+import ChessControl
+import ChessProof
+import ChessStats
+import ChessTablebase
+import ChessTT
+from ChessEval import CHECKMATE, scoreBoard
+
 DEPTH = 1  # reduce for testing; bump back up as needed
 
+# Frontier pruning margins, in the same pawn units as scoreBoard.
+# Set a margin to None to switch that pruning off.
+FUTILITY_MARGIN = 3  # depth 1: a quiet move rarely swings more than a minor piece
+EXTENDED_FUTILITY_MARGIN = 5  # depth 2: allow for a rook's worth of swing
+RAZOR_MARGIN = 4  # depth <= RAZOR_DEPTH: hopeless nodes drop into quiescence
+RAZOR_DEPTH = 2
+QUIESCENCE_DEPTH = 4  # max captures followed by quiescence
+
 # Global to hold the chosen move at the root
 next_move = None
 
+# Optional ChessTT.TranspositionTable shared by every search in this process
+transposition_table = None
 
-def findBestMove(game_state, valid_moves, return_queue):
+
+def findBestMove(game_state, valid_moves, return_queue, control=None):
+    """
+    Put the chosen move on return_queue. Returns the search's
+    ChessStats.SearchStats, or None unless stats collection is on.
+    With a ChessControl.SearchControl the search deepens one turn at a time,
+    up to DEPTH or, given a time or node limit, until the budget runs out;
+    a stop puts the move of the deepest finished iteration.
+    """
     global next_move
     next_move = None
+    stats = ChessStats.begin(transposition_table)
 
     enemy_king = "bK" if game_state.white_to_move else "wK"
     for move in valid_moves:
         if not move.is_duck_move and move.piece_captured == enemy_king:
             return_queue.put(move)
-            return
-
-    # Only consider piece moves at the root
-    piece_moves = [m for m in valid_moves if not m.is_duck_move]
-    _ = negamax_full(game_state, piece_moves, DEPTH, -CHECKMATE, CHECKMATE, 1)
-    return_queue.put(next_move)
-
+            return ChessStats.end(stats)
 
-def negamax_full(game_state, moves, depth, alpha, beta, color):
+    # The budget starts before the presearch, whose proof nodes it counts
+    ChessControl.begin(control)
+    try:
+        move, source = presearchMove(game_state, valid_moves)
+        if move is not None:
+            return_queue.put(move)
+            return ChessStats.end(stats, source)
+
+        # Only consider piece moves at the root
+        piece_moves = [m for m in valid_moves if not m.is_duck_move]
+        color = 1 if game_state.white_to_move else -1
+        if control is None:
+            _ = negamax_full(game_state, piece_moves, DEPTH, -
+                             CHECKMATE, CHECKMATE, color)
+            return_queue.put(next_move)
+            return ChessStats.end(stats, depth=DEPTH)
+
+        best_move, depth = None, 0
+        for iteration in range(1, control.depthLimit(DEPTH) + 1):
+            next_move = None
+            negamax_full(game_state, piece_moves, iteration, -
+                         CHECKMATE, CHECKMATE, color)
+            if control.stopped:
+                break
+            best_move, depth = next_move, iteration
+    finally:
+        ChessControl.end(control)
+    if best_move is None and piece_moves:
+        # Stopped inside the first iteration: its best root move so far
+        best_move = next_move or orderMoves(game_state, piece_moves)[0]
+    return_queue.put(best_move)
+    return ChessStats.end(stats, depth=depth)
+
+
+def presearchMove(game_state, valid_moves):
+    """
+    (move, source) for a move that needs no search: from the opening book,
+    an endgame table or a proof of a forced king capture; else (None, None).
+    The proof search spends nodes of the budget of ChessControl.current.
+    """
+    move = ChessBook.bookMove(game_state, valid_moves)
+    if move is not None:
+        return move, "book"
+    move = ChessTablebase.tablebaseMove(game_state, valid_moves)
+    if move is not None:
+        return move, "tablebase"
+    move = ChessProof.proofMove(game_state, valid_moves)
+    if move is not None:
+        return move, "proof"
+    return None, None
+
+
+def negamax_full(game_state, moves, depth, alpha, beta, color, ply=0):
     global next_move
+    stats = ChessStats.current
+    if stats is not None:
+        stats.piece_nodes += 1
+    control = ChessControl.current
+    if control is not None and control.check():
+        return 0  # thrown away: every caller stops on control.stopped
 
     enemy_king = "bK" if game_state.white_to_move else "wK"
     for move in moves:
         if move.piece_captured == enemy_king:
-            if depth == DEPTH:
+            if ply == 0:
                 next_move = move
-            return color * CHECKMATE
+            return CHECKMATE
 
     # Base case
     if depth == 0 or not moves:
         return color * scoreBoard(game_state)
 
+    # ─────── TRANSPOSITION TABLE ───────
+    tt = transposition_table
+    tt_move = None
+    if tt is not None:
+        key = game_state.positionKey()
+        alpha_orig = alpha
+        entry = tt.probe(key)
+        if entry is not None:
+            tt_score, tt_depth, tt_flag, tt_move, _ = entry
+            if ply > 0 and tt_depth >= depth:
+                if (
+                    tt_flag == ChessTT.EXACT
+                    or (tt_flag == ChessTT.LOWER_BOUND and tt_score >= beta)
+                    or (tt_flag == ChessTT.UPPER_BOUND and tt_score <= alpha)
+                ):
+                    return tt_score
+
+    # ─────── FRONTIER PRUNING ───────
+    futility_margin = None
+    if ply > 0 and depth <= max(2, RAZOR_DEPTH):
+        if not game_state.kingCaptureAvailable():
+            static_eval = color * scoreBoard(game_state)
+
+            # Razoring: far below alpha, only captures can save the node
+            if (
+                RAZOR_MARGIN is not None
+                and depth <= RAZOR_DEPTH
+                and static_eval + RAZOR_MARGIN <= alpha
+            ):
+                score = quiescence(game_state, alpha, beta, color)
+                if score <= alpha:
+                    return score
+
+            if depth == 1:
+                futility_margin = FUTILITY_MARGIN
+            elif depth == 2:
+                futility_margin = EXTENDED_FUTILITY_MARGIN
+            if futility_margin is not None and static_eval + futility_margin > alpha:
+                futility_margin = None  # a quiet move might still raise alpha
+
+    ordered_moves = orderMoves(game_state, moves)
+    if tt_move is not None:
+        # The stored best move goes first
+        ordered_moves.sort(key=lambda m: squaresOf(m) != tt_move)
+
     max_score = -math.inf
+    best_move = best_duck = None
+    for move in ordered_moves:
+        # Futility: skip quiet moves that cannot lift the score above alpha
+        if (
+            futility_margin is not None
+            and not move.is_capture
+            and not move.is_pawn_promotion
+        ):
+            max_score = max(max_score, static_eval + futility_margin)
+            continue
+
+        score, duck = searchTurn(
+            game_state, move, depth, alpha, beta, color, ply)
+        if control is not None and control.stopped:
+            return max_score  # unfinished: not stored, not a root best move
+
+        if score > max_score:
+            best_move, best_duck = move, duck
+            # ─── record move at root ───
+            if ply == 0:
+                next_move = move
+
+        max_score = max(max_score, score)
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            if stats is not None:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += move is ordered_moves[0]
+            break
+
+    if tt is not None and max_score > -math.inf:
+        if max_score <= alpha_orig:
+            flag = ChessTT.UPPER_BOUND
+        elif max_score >= beta:
+            flag = ChessTT.LOWER_BOUND
+        else:
+            flag = ChessTT.EXACT
+        tt.store(
+            key,
+            max_score,
+            depth,
+            flag,
+            None if best_move is None else squaresOf(best_move),
+            None if best_duck is None else best_duck.end_row *
+            8 +
+            best_duck.end_col,
+        )
+
+    return max_score
+
+
+def searchTurn(
+        game_state,
+        move,
+        depth,
+        alpha,
+        beta,
+        color,
+        ply=0,
+        duck_squares=None,
+        refresh_alpha=None):
+    """
+    Score one full turn (piece move + its best duck square) for the side to move.
+    duck_squares limits the duck replies tried, which lets a turn be split up.
+    refresh_alpha(), when given, is read before each duck reply and raises
+    alpha to a bound found elsewhere in the meantime (by another worker).
+    """
+    # ─────────── SNAPSHOT ───────────
+    orig_white = game_state.white_to_move
+    orig_duck = game_state.duck_move_phase
+
+    # 1) Piece move
+    game_state.makeMove(move)
+    next_moves = game_state.getValidMoves()
+
+    # 2) Duck phase (must be True here)
+    #    pick the best immediate duck move
+    duck_moves = [m for m in next_moves if m.is_duck_move]
+    if duck_squares is not None:
+        duck_moves = [
+            m for m in duck_moves if (
+                m.end_row,
+                m.end_col) in duck_squares]
+    best_duck = None
+    best_duck_score = -math.inf
+    stats = ChessStats.current
+    control = ChessControl.current
+    for dm in duck_moves:
+        if refresh_alpha is not None:
+            alpha = max(alpha, refresh_alpha())
+        if stats is not None:
+            stats.duck_nodes += 1
+        game_state.makeMove(dm)
+        sc = -negamax_full(
+            game_state,
+            [m for m in game_state.getValidMoves() if not m.is_duck_move],
+            depth - 1,
+            -beta,
+            -alpha,
+            -color,
+            ply + 1,
+        )
+        game_state.undoMove()
+        if control is not None and control.stopped:
+            break
+        if sc > best_duck_score:
+            best_duck_score, best_duck = sc, dm
+
+    # 3) Apply & evaluate the best duck
+    if control is not None and control.stopped:
+        score = best_duck_score
+    elif best_duck:
+        game_state.makeMove(best_duck)
+        score = -negamax_full(
+            game_state,
+            [m for m in game_state.getValidMoves() if not m.is_duck_move],
+            depth - 1,
+            -beta,
+            -alpha,
+            -color,
+            ply + 1,
+        )
+        game_state.undoMove()
+    else:
+        # (should never happen: there’s always at least one duck move)
+        score = best_duck_score
+
+    # ─────── UNDO BOTH MOVES ───────
+    game_state.undoMove()  # undo the piece move
+
+    # ────────── RESTORE STATE ─────────
+    game_state.white_to_move = orig_white
+    game_state.duck_move_phase = orig_duck
+
+    return score, best_duck
+
+
+def quiescence(game_state, alpha, beta, color, qdepth=QUIESCENCE_DEPTH):
+    """
+    Capture-only search from the side to move's point of view.
+    The duck is left where it is, so every capture is answered at once.
+    """
+    stats = ChessStats.current
+    if stats is not None:
+        stats.qnodes += 1
+    control = ChessControl.current
+    if control is not None and control.check():
+        return 0
+    moves = [m for m in game_state.getValidMoves() if not m.is_duck_move]
+
+    enemy_king = "bK" if game_state.white_to_move else "wK"
     for move in moves:
+        if move.piece_captured == enemy_king:
+            return CHECKMATE
+
+    stand_pat = color * scoreBoard(game_state)
+    if stand_pat >= beta or qdepth == 0:
+        return stand_pat
+    alpha = max(alpha, stand_pat)
+
+    best_score = stand_pat
+    captures = [(game_state.see(m), m) for m in moves if m.is_capture]
+    captures.sort(key=lambda item: item[0], reverse=True)
+    for see_score, move in captures:
+        if see_score < 0:
+            break  # only losing captures are left
+
         # ─────────── SNAPSHOT ───────────
         orig_white = game_state.white_to_move
         orig_duck = game_state.duck_move_phase
 
-        # 1) Piece move
         game_state.makeMove(move)
-        next_moves = game_state.getValidMoves()
-
-        # 2) Duck phase (must be True here)
-        #    pick the best immediate duck move
-        duck_moves = [m for m in next_moves if m.is_duck_move]
-        best_duck = None
-        best_duck_score = -math.inf
-        for dm in duck_moves:
-            game_state.makeMove(dm)
-            sc = -negamax_full(
-                game_state,
-                [m for m in game_state.getValidMoves() if not m.is_duck_move],
-                depth - 1,
-                -beta,
-                -alpha,
-                -color,
-            )
-            game_state.undoMove()
-            if sc > best_duck_score:
-                best_duck_score, best_duck = sc, dm
-
-        # 3) Apply & evaluate the best duck
-        if best_duck:
-            game_state.makeMove(best_duck)
-            score = -negamax_full(
-                game_state,
-                [m for m in game_state.getValidMoves() if not m.is_duck_move],
-                depth - 1,
-                -beta,
-                -alpha,
-                -color,
-            )
-            game_state.undoMove()
-        else:
-            # (should never happen: there’s always at least one duck move)
-            score = best_duck_score
-
-        # ─────── UNDO BOTH MOVES ───────
-        game_state.undoMove()  # undo the piece move
+        # Skip the duck phase and hand the move to the opponent
+        game_state.white_to_move = not orig_white
+        game_state.duck_move_phase = False
+        score = -quiescence(game_state, -beta, -alpha, -color, qdepth - 1)
 
         # ────────── RESTORE STATE ─────────
         game_state.white_to_move = orig_white
+        game_state.duck_move_phase = True
+        game_state.undoMove()
+        game_state.white_to_move = orig_white
         game_state.duck_move_phase = orig_duck
 
-        # ─── record move at root ───
-        if depth == DEPTH and score > max_score:
-            next_move = move
-
-        max_score = max(max_score, score)
-        alpha = max(alpha, score)
+        if control is not None and control.stopped:
+            break
+        if score > best_score:
+            best_score = score
+        if score > alpha:
+            alpha = score
         if alpha >= beta:
             break
 
-    return max_score
+    return best_score
 
 
-def scoreBoard(game_state):
+def squaresOf(move):
+    """(start, end) square indices of a move, as stored in the TT"""
+    return (
+        move.start_row * 8 + move.start_col,
+        move.end_row * 8 + move.end_col,
+    )
+
+
+def orderMoves(game_state, moves):
     """
-    Score the board. A positive score is good for white, a negative score is good for black.
-    Now considers duck position in evaluation.
+    Winning and even captures first (best SEE first), then quiet moves,
+    then captures that lose material on the exchange.
     """
-    if game_state.game_over:
-        if game_state.winner == "w":
-            return CHECKMATE
-        elif game_state.winner == "b":
-            return -CHECKMATE
-        else:
-            return STALEMATE  # 平局
-
-    score = 0
-    for row in range(len(game_state.board)):
-        for col in range(len(game_state.board[row])):
-            piece = game_state.board[row][col]
-            if piece != "--":
-                piece_position_score = 0
-                if piece[1] == "D":  # Duck
-                    piece_position_score = (
-                        duck_scores[row][col] * 0.5
-                    )  # Duck position is less important
-                elif piece[1] != "K":  # Other pieces (except king)
-                    piece_position_score = piece_position_scores[piece][row][col]
-
-                if piece[0] == "w":
-                    score += piece_score[piece[1]] + piece_position_score
-                elif piece[0] == "b":
-                    score -= piece_score[piece[1]] + piece_position_score
-
-    # Add bonus for controlling center with duck
-    duck_row, duck_col = game_state.duck_location
-    center_control = duck_scores[duck_row][duck_col]
-    score += center_control * 0.3  # Small bonus for good duck position
-
-    return score
+
+    def moveOrderKey(move):
+        if not move.is_capture:
+            return 0
+        see_score = game_state.see(move)
+        return -see_score - 1 if see_score >= 0 else 1 - see_score
+
+    return sorted(moves, key=moveOrderKey)
 
 
 def findRandomMove(valid_moves):
@@ -0,0 +1,48 @@
+"""
+Positions for the tests, set up square by square. Squares are algebraic
+("e1"), pieces as on GameState.board ("wK", "bp").
+"""
+
+import ChessEngine
+
+
+def square(name):
+    """ "e1" -> (row, col) on GameState.board"""
+    return 8 - int(name[1]), "abcdefgh".index(name[0])
+
+
+def position(pieces, duck, white_to_move=True):
+    """A piece-phase GameState with only pieces ({square: piece}) and the duck"""
+    game_state = ChessEngine.GameState()
+    for row in range(8):
+        for col in range(8):
+            game_state.setSquare(row, col, "--")
+    for name, piece in pieces.items():
+        row, col = square(name)
+        game_state.setSquare(row, col, piece)
+        if piece == "wK":
+            game_state.white_king_location = (row, col)
+        elif piece == "bK":
+            game_state.black_king_location = (row, col)
+    game_state.duck_location = square(duck)
+    game_state.setSquare(*game_state.duck_location, "DD")
+    game_state.duck_location_log = [game_state.duck_location]
+    game_state.current_castling_rights = ChessEngine.CastleRights(
+        False, False, False, False)
+    game_state.castle_rights_log = [
+        ChessEngine.CastleRights(False, False, False, False)]
+    game_state.white_to_move = white_to_move
+    game_state.board_key = game_state.computeBoardKey()
+    return game_state
+
+
+def move(game_state, start, end):
+    """The legal move of game_state from start to end (squares)"""
+    start, end = square(start), square(end)
+    for candidate in game_state.getValidMoves():
+        if (candidate.start_row, candidate.start_col) == start and (
+            candidate.end_row,
+            candidate.end_col,
+        ) == end:
+            return candidate
+    raise ValueError(f"no legal move {start} -> {end}")
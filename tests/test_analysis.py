@@ -0,0 +1,124 @@
+import random
+import time
+
+import chess.engine
+import pytest
+
+import ChessAnalysis
+import chessAi_handcraft
+import ChessControl
+import ChessEngine
+from chessAi_handcraft import CHECKMATE
+from positions import move, position
+
+
+@pytest.fixture(autouse=True)
+def no_shared_table():
+    # Each search starts cold, so analyse() and negamax_full see the same tree
+    table = chessAi_handcraft.transposition_table
+    chessAi_handcraft.transposition_table = None
+    yield
+    chessAi_handcraft.transposition_table = table
+
+
+def midgame(seed=5, plies=12):
+    random.seed(seed)
+    game_state = ChessEngine.GameState()
+    for _ in range(plies):
+        game_state.makeMove(random.choice(game_state.getValidMoves()))
+    return game_state
+
+
+def endgame():
+    return position(
+        {"g1": "wK", "a1": "wR", "b4": "wp", "g8": "bK", "f7": "bp", "h5": "bp"},
+        "d5",
+    )
+
+
+def serialBest(game_state, depth):
+    """(move, score) the handcraft root search picks at depth"""
+    chessAi_handcraft.next_move = None
+    color = 1 if game_state.white_to_move else -1
+    piece_moves = [
+        m for m in game_state.getValidMoves() if not m.is_duck_move]
+    score = chessAi_handcraft.negamax_full(
+        game_state, piece_moves, depth, -CHECKMATE, CHECKMATE, color)
+    return chessAi_handcraft.next_move, score
+
+
+@pytest.mark.parametrize("multipv", [1, 3, 5])
+def test_lines_are_best_first(multipv):
+    game_state = midgame()
+    result = ChessAnalysis.analyse(
+        game_state, multipv, chess.engine.Limit(depth=1))
+    assert len(result) == multipv
+    assert result.depth == 1
+    scores = [pv.score for pv in result]
+    assert scores == sorted(scores, reverse=True)
+    turns = [(pv.move.moveID, pv.duck_move.moveID) for pv in result]
+    assert len(set(turns)) == multipv
+    for pv in result:
+        assert pv.line[:2] == [pv.move, pv.duck_move]
+
+
+def test_more_lines_keep_the_best_ones():
+    game_state = midgame()
+    limit = chess.engine.Limit(depth=1)
+    three = ChessAnalysis.analyse(game_state, 3, limit)
+    five = ChessAnalysis.analyse(game_state, 5, limit)
+    assert [pv.score for pv in five][:3] == [pv.score for pv in three]
+
+
+@pytest.mark.parametrize(
+    "game_state, depth", [(midgame(), 1), (midgame(8, 20), 1), (endgame(), 2)]
+)
+def test_best_line_agrees_with_the_search(game_state, depth):
+    best = ChessAnalysis.analyse(
+        game_state, 1, chess.engine.Limit(depth=depth)).best
+    serial_move, serial_score = serialBest(game_state, depth)
+    assert best.move == serial_move
+    assert best.score == pytest.approx(serial_score)
+
+
+def test_king_capture_is_the_best_line():
+    game_state = position({"e1": "wK", "e4": "wR", "e8": "bK"}, "a5")
+    result = ChessAnalysis.analyse(
+        game_state, 2, chess.engine.Limit(depth=1))
+    assert result.best.move == move(game_state, "e4", "e8")
+    assert result.best.duck_move is None
+    assert result.best.score == CHECKMATE
+
+
+def test_duck_phase_has_no_lines():
+    game_state = ChessEngine.GameState()
+    game_state.makeMove(move(game_state, "e2", "e4"))
+    assert len(ChessAnalysis.analyse(game_state, 3)) == 0
+
+
+def test_time_limit_keeps_a_finished_depth():
+    result = ChessAnalysis.analyse(
+        endgame(), 2, chess.engine.Limit(time=0.5))
+    assert result.depth >= 1
+    assert len(result) == 2
+
+
+def test_time_limit_stops_inside_a_root_turn(monkeypatch):
+    # A search that would take 5 seconds but polls the current control, as
+    # negamax_full does: analyse() stops it at the deadline and discards
+    # the unfinished depth
+    def slowSearch(*args, **kwargs):
+        started = time.monotonic()
+        control = ChessControl.current
+        while time.monotonic() - started < 5:
+            if control is not None and control.check():
+                break
+        return 0
+
+    monkeypatch.setattr(chessAi_handcraft, "negamax_full", slowSearch)
+    started = time.monotonic()
+    result = ChessAnalysis.analyse(
+        endgame(), 1, chess.engine.Limit(time=0.2))
+    assert time.monotonic() - started < 1
+    assert result.depth == 0 and len(result) == 0
+    assert ChessControl.current is None
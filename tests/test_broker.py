@@ -0,0 +1,188 @@
+import asyncio
+import json
+import multiprocessing
+import socket
+import threading
+
+import chess
+import chess.engine
+import pytest
+
+import ChessBroker
+
+pytestmark = pytest.mark.skipif(
+    not ChessBroker.BROKER_SUPPORTED, reason="the broker needs UNIX sockets"
+)
+
+LIMIT = chess.engine.Limit(time=0.01)
+MATED = "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3"
+
+
+class FakePool:
+    """Engine pool stand-in: the score is White's legal move count"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def analyse(self, board, limit):
+        await asyncio.sleep(self.delay)
+        moves = sorted(board.legal_moves, key=chess.Move.uci)
+        if not moves:
+            raise chess.engine.EngineError("no legal move")
+        if board.turn == chess.BLACK:
+            board = board.copy()
+            board.push(chess.Move.null())
+        score = chess.engine.Cp(board.legal_moves.count())
+        return {"score": chess.engine.PovScore(score, chess.WHITE), "pv": moves[:1]}
+
+    async def close(self):
+        pass
+
+
+class FakeBroker(ChessBroker.Broker):
+    def __init__(self, engines, delay):
+        super().__init__(engines=engines)
+        self.pool = FakePool(delay)
+
+    def _pool(self, options):
+        return self.pool
+
+
+def serve_fake(path, engines, delay, ready):
+    asyncio.run(FakeBroker(engines, delay).serve(path, ready))
+
+
+@pytest.fixture
+def broker(tmp_path):
+    """Start a fake broker: broker(engines, delay) -> its socket path"""
+    processes = []
+
+    def start(engines=2, delay=0.0):
+        path = str(tmp_path / "broker.sock")
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=serve_fake, args=(path, engines, delay, ready), daemon=True
+        )
+        process.start()
+        assert ready.wait(10)
+        processes.append(process)
+        return path
+
+    yield start
+    for process in processes:
+        ChessBroker.stop(process)
+
+
+def expected(fen):
+    board = chess.Board(fen)
+    white = board.copy()
+    if white.turn == chess.BLACK:
+        white.push(chess.Move.null())
+    return white.legal_moves.count(), min(m.uci() for m in board.legal_moves)
+
+
+def test_results_in_order(broker):
+    client = ChessBroker.BrokerClient(broker())
+    board = chess.Board()
+    fens = [board.fen()]
+    for uci in ("e2e4", "e7e5", "g1f3", "b8c6"):
+        board.push_uci(uci)
+        fens.append(board.fen())
+    infos = client.submitMany(fens, LIMIT).result(10)
+    for fen, info in zip(fens, infos):
+        cp, best_move = expected(fen)
+        assert info["score"].white().score() == cp
+        assert info["pv"][0].uci() == best_move
+    client.close()
+
+
+def test_engine_error_is_none(broker):
+    client = ChessBroker.BrokerClient(broker())
+    infos = client.submitMany([MATED, chess.Board()], LIMIT).result(10)
+    assert infos[0] is None and infos[1] is not None
+    assert client.submitMany([], LIMIT).result(10) == []
+    client.close()
+
+
+def test_small_batch_is_not_held_up(broker):
+    # One engine, taking the connections' queues in turn: two positions
+    # sent after a batch of twenty are done long before the batch is
+    path = broker(engines=1, delay=0.05)
+    large_client = ChessBroker.BrokerClient(path)
+    small_client = ChessBroker.BrokerClient(path)
+    large = large_client.submitMany([chess.Board()] * 20, LIMIT)
+    small = small_client.submitMany([chess.Board()] * 2, LIMIT)
+    assert small.result(10) is not None
+    assert not large.done()
+    assert len(large.result(10)) == 20
+    large_client.close()
+    small_client.close()
+
+
+def test_client_ignores_unknown_ids(tmp_path):
+    # A broker that answers with a stray id first, then the job, then a
+    # reply without an id, which ends the connection
+    path = str(tmp_path / "fake.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    requests = []
+
+    def answer():
+        connection, _ = server.accept()
+        with connection, connection.makefile("rwb") as stream:
+            request = json.loads(stream.readline())
+            requests.append(request)
+            job_id = request["jobs"][0][0]
+            for reply in (
+                {"id": job_id + 100, "error": "not yours"},
+                {"id": job_id, "cp": 12, "mate": None, "best_move": "e2e4"},
+            ):
+                stream.write(json.dumps(reply).encode() + b"\n")
+            stream.flush()
+            requests.append(json.loads(stream.readline()))
+            stream.write(b'{"cp": 1}\n')
+            stream.flush()
+
+    thread = threading.Thread(target=answer, daemon=True)
+    thread.start()
+    client = ChessBroker.BrokerClient(path)
+    info = client.submitMany([chess.Board()], LIMIT).result(10)[0]
+    assert info["score"].white().score() == 12
+    assert info["pv"] == [chess.Move.from_uci("e2e4")]
+    assert requests[0]["limit"] == {"time": 0.01}
+
+    pending = client.submitMany([chess.Board()], LIMIT)
+    with pytest.raises(ConnectionError):
+        pending.result(10)
+    assert client.closed
+    thread.join(10)
+    client.close()
+    server.close()
+
+
+def test_info_dict():
+    assert ChessBroker._infoDict({"id": 0, "error": "crashed"}) is None
+    info = ChessBroker._infoDict({"id": 0, "cp": None, "mate": -3, "best_move": None})
+    assert info["score"].white() == chess.engine.Mate(-3)
+    assert "pv" not in info
+    info = ChessBroker._infoDict({"id": 0, "cp": 40, "mate": None, "best_move": "g1f3"})
+    assert info["score"].black() == chess.engine.Cp(-40)
+    assert info["pv"] == [chess.Move.from_uci("g1f3")]
+
+
+def test_batch_over_the_default_line_limit(broker):
+    # One request line well past asyncio's 64 KiB default
+    client = ChessBroker.BrokerClient(broker())
+    board = chess.Board()
+    fens = []
+    for uci in ("e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6"):
+        board.push_uci(uci)
+        fens.append(board.fen())
+    fens *= 300
+    assert len(json.dumps(fens)) > 64 * 1024
+    infos = client.submitMany(fens, LIMIT).result(30)
+    assert len(infos) == len(fens)
+    for fen, info in zip(fens, infos):
+        assert info["score"].white().score() == expected(fen)[0]
+    client.close()
@@ -0,0 +1,70 @@
+import math
+import random
+
+import pytest
+
+import ChessAI
+import ChessEngine
+from ChessEval import duck_scores
+
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+BLOCK_BONUS = {"Q": 3, "R": 2, "B": 1}
+
+
+def square_score(game_state, row, col):
+    """The duck square score as the per-square scan computed it"""
+    own = "w" if game_state.white_to_move else "b"
+    enemy = "b" if game_state.white_to_move else "w"
+    blocking_score = own_piece_penalty = 0
+    for dr, dc in DIRECTIONS:
+        for i in range(1, 8):
+            r, c = row + dr * i, col + dc * i
+            if not (0 <= r < 8 and 0 <= c < 8):
+                break
+            piece = game_state.board[r][c]
+            if piece == "--":
+                continue
+            if piece[0] == enemy:
+                blocking_score += BLOCK_BONUS.get(piece[1], 0)
+            elif piece[0] == own:
+                own_piece_penalty += 1
+            break
+    return duck_scores[row][col] * 10 + blocking_score - own_piece_penalty
+
+
+def positions(count=6):
+    """Duck phases of random games, 15 or 16 turns in: white's and black's"""
+    random.seed(4)
+    found = []
+    while len(found) < count:
+        game_state = ChessEngine.GameState()
+        for _ in range(31 + 2 * (len(found) % 2)):
+            moves = game_state.getValidMoves()
+            if game_state.game_over or not moves:
+                break
+            game_state.makeMove(random.choice(moves))
+        else:
+            found.append(game_state)
+    return found
+
+
+@pytest.mark.parametrize("game_state", positions())
+def test_vectorised_scores_match_the_scan(game_state):
+    scores = ChessAI.duckSquareScores(game_state)
+    for row in range(8):
+        for col in range(8):
+            assert scores[row * 8 + col] == pytest.approx(
+                square_score(game_state, row, col)
+            )
+
+
+@pytest.mark.parametrize("game_state", positions())
+def test_best_duck_move_is_the_first_best_square(game_state):
+    duck_moves = [m for m in game_state.getValidMoves() if m.is_duck_move]
+    best_score, best_move = -math.inf, None
+    for move in duck_moves:
+        score = square_score(game_state, move.end_row, move.end_col)
+        if score > best_score:
+            best_score, best_move = score, move
+    ChessAI.findBestDuckMove(game_state, duck_moves)
+    assert ChessAI.next_move is best_move
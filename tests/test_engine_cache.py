@@ -0,0 +1,112 @@
+import itertools
+import multiprocessing
+import types
+
+import chess
+import chess.engine
+import pytest
+
+import ChessEngineCache
+
+FEN = "rnbqkbnr/pppppppp/8/8/4*3/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+LIMIT = chess.engine.Limit(depth=5)
+
+
+def duck_on(file):
+    """FEN with the duck on the given file of the fourth rank"""
+    rank = "*".join(str(n) if n else "" for n in (file, 7 - file))
+    return FEN.replace("4*3", rank)
+
+
+def white(score):
+    return chess.engine.PovScore(score, chess.WHITE)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ChessEngineCache.EngineCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A ChessEngineCache.time whose time() ticks by one on every call"""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(
+        ChessEngineCache, "time", types.SimpleNamespace(time=lambda: next(ticks))
+    )
+
+
+def test_round_trip(cache):
+    assert cache.get(FEN, LIMIT) is None
+    cache.put(FEN, LIMIT, "builtin", white(chess.engine.Cp(-35)), "e7e5")
+    score, best_move = cache.get(FEN, LIMIT)
+    assert score.white() == chess.engine.Cp(-35) and best_move == "e7e5"
+
+    # The move counters aren't part of the key; the limit and network are
+    assert cache.get(FEN.replace(" 0 1", " 4 9"), LIMIT) is not None
+    assert cache.get(FEN, chess.engine.Limit(depth=6)) is None
+    assert cache.get(FEN, LIMIT, "duck.nnue:1024") is None
+
+
+@pytest.mark.parametrize("mate", [3, -2])
+def test_mate_scores(cache, mate):
+    # Stored from White's view whichever side the engine spoke for
+    black = chess.engine.PovScore(chess.engine.Mate(-mate), chess.BLACK)
+    cache.put(FEN, LIMIT, "builtin", black)
+    score, best_move = cache.get(FEN, LIMIT)
+    assert score.white() == chess.engine.Mate(mate) and best_move is None
+
+
+def test_evict_drops_the_least_recently_used(cache, clock):
+    cache.max_entries = 4
+    fens = [duck_on(file) for file in range(8)]
+    for fen in fens:
+        cache.put(fen, LIMIT, "builtin", white(chess.engine.Cp(0)))
+    cache.get(fens[0], LIMIT)  # used again, so kept
+    cache.evict()
+    assert len(cache) == 4
+    kept = [fen for fen in fens if cache.get(fen, LIMIT) is not None]
+    assert kept == [fens[0]] + fens[5:]
+
+
+def test_puts_evict_on_their_own(cache, monkeypatch):
+    monkeypatch.setattr(ChessEngineCache, "EVICT_INTERVAL", 5)
+    cache.max_entries = 3
+    for i in range(5):
+        cache.put(
+            duck_on(i),
+            LIMIT,
+            "builtin",
+            white(chess.engine.Cp(i)),
+        )
+    assert len(cache) <= 3
+
+
+def child_uses_its_own_connection(parent_id):
+    cache = ChessEngineCache.getCache()
+    assert id(cache) != parent_id
+    assert cache.get(FEN, LIMIT) is not None
+    cache.put(duck_on(3), LIMIT, "builtin", white(chess.engine.Cp(7)))
+
+
+def test_cache_is_opened_again_after_a_fork(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        ChessEngineCache, "ENGINE_CACHE_PATH", str(tmp_path / "cache.sqlite")
+    )
+    monkeypatch.setattr(ChessEngineCache, "_cache", None)
+    parent = ChessEngineCache.getCache()
+    try:
+        assert ChessEngineCache.getCache() is parent
+        parent.put(FEN, LIMIT, "builtin", white(chess.engine.Cp(20)))
+        child = multiprocessing.get_context("fork").Process(
+            target=child_uses_its_own_connection, args=(id(parent),)
+        )
+        child.start()
+        child.join()
+        assert child.exitcode == 0
+        score, _ = parent.get(duck_on(3), LIMIT)
+        assert score.white() == chess.engine.Cp(7)
+    finally:
+        parent.close()
@@ -0,0 +1,115 @@
+import math
+
+import pytest
+
+import ChessMatch
+
+BOUND = math.log(0.95 / 0.05)  # the SPRT bounds for alpha = beta = 0.05
+
+
+def result_with(pentanomial, elo0=0, elo1=10):
+    result = ChessMatch.MatchResult("a", "b", elo0, elo1)
+    result.pentanomial = list(pentanomial)
+    return result
+
+
+def strong_wins(index, white, black):
+    """play_game stand-in: "strong" beats everyone, other games are drawn"""
+    if white == "strong":
+        return "White", {}
+    if black == "strong":
+        return "Black", {}
+    return "over200" if index % 2 else ("Draw", {})
+
+
+def test_elo_and_score():
+    assert ChessMatch.scoreFromElo(0) == 0.5
+    assert ChessMatch.scoreFromElo(400) == pytest.approx(10 / 11)
+    for elo in (-300, -10, 0, 35, 400):
+        assert ChessMatch.eloFromScore(ChessMatch.scoreFromElo(elo)) == (
+            pytest.approx(elo)
+        )
+
+
+def test_game_score():
+    assert ChessMatch.gameScore("White", True) == 1.0
+    assert ChessMatch.gameScore("White", False) == 0.0
+    assert ChessMatch.gameScore("Black", False) == 1.0
+    assert ChessMatch.gameScore("Draw", True) == 0.5
+    assert ChessMatch.gameScore("over200", False) == 0.5
+
+
+def test_bounds():
+    result = ChessMatch.MatchResult("a", "b")
+    assert result.upper_bound == pytest.approx(BOUND)
+    assert result.lower_bound == pytest.approx(-BOUND)
+    assert result.llr() == 0.0 and result.verdict is None
+
+
+def test_llr_signs():
+    wins = result_with([0, 0, 0, 0, 30])
+    assert wins.llr() >= BOUND and wins.verdict == "H1"
+    losses = result_with([30, 0, 0, 0, 0])
+    assert losses.llr() <= -BOUND and losses.verdict == "H0"
+    # An even match is evidence against a 10 Elo edge
+    even = result_with([10, 20, 40, 20, 10])
+    assert -BOUND < even.llr() < 0 and even.verdict is None
+    # A better score gives a larger LLR
+    ahead = result_with([10, 20, 40, 25, 10])
+    assert ahead.llr() > even.llr()
+
+
+def test_llr_of_draws():
+    # Ten drawn pairs with the prior: mean 0.5, variance 0.025, so the LLR
+    # is -10 * (s1 - 0.5)^2 / 0.05
+    s1 = ChessMatch.scoreFromElo(10)
+    draws = result_with([0, 0, 10, 0, 0])
+    assert draws.llr() == pytest.approx(-200 * (s1 - 0.5) ** 2)
+
+
+def test_prior_keeps_a_few_pairs_from_deciding():
+    assert result_with([0, 0, 0, 0, 1]).verdict is None
+    assert result_with([1, 0, 0, 0, 0]).verdict is None
+
+
+def test_elo_interval():
+    elo, low, high = result_with([5, 20, 30, 30, 15]).elo()
+    assert low < elo < high and elo > 0
+    elo, low, high = result_with([10, 20, 40, 20, 10]).elo()
+    assert elo == pytest.approx(0, abs=1e-9) and low == pytest.approx(-high)
+    # More pairs, a narrower interval
+    _, wide_low, wide_high = result_with([1, 2, 4, 2, 1]).elo()
+    assert wide_high - wide_low > high - low
+
+
+def test_add_pairs():
+    result = ChessMatch.MatchResult("a", "b")
+    result.add(("White", "Black"))  # two wins
+    result.add(("White", "over200"))  # a win and an unfinished game
+    result.add(("Black", "White"))  # two losses
+    assert result.pentanomial == [1, 0, 0, 1, 1]
+    assert (result.wins, result.draws, result.losses) == (3, 1, 2)
+    assert result.over200 == 1 and result.games == 6
+
+
+def test_play_pair_takes_bare_over200():
+    assert ChessMatch.playPair(0, "a", "b", strong_wins) == ("Draw", "over200")
+    assert ChessMatch.playPair(0, "strong", "b", strong_wins) == ("White", "Black")
+
+
+def test_match_stops_at_a_verdict():
+    result = ChessMatch.match(
+        "strong", "weak", max_pairs=200, num_workers=1, play_game=strong_wins
+    )
+    assert result.verdict == "H1"
+    assert result.pairs < 200
+    assert result.pentanomial[4] == result.pairs
+
+
+def test_standings():
+    first = ChessMatch.MatchResult("a", "b")
+    first.add(("White", "Black"))
+    second = ChessMatch.MatchResult("b", "c")
+    second.add(("Draw", "Draw"))
+    table = ChessMatch.standings([first, second])
+    assert table == [("a", 2.0, 2), ("c", 1.0, 2), ("b", 1.0, 4)]
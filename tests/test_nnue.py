@@ -0,0 +1,160 @@
+import os
+import random
+import struct
+
+import numpy as np
+import pytest
+
+import ChessAI
+import ChessEngine
+import ChessEval
+import ChessFairy
+import ChessNNUE
+
+DENSE_LAYERS = (
+    (2 * ChessNNUE.TRANSFORMED_SIZE, ChessNNUE.HIDDEN_1),
+    (ChessNNUE.HIDDEN_1, ChessNNUE.HIDDEN_2),
+    (ChessNNUE.HIDDEN_2, 1),
+)
+ENGINE_PATH = ChessFairy.FAIRY_STOCKFISH_PATH and os.path.join(
+    os.path.dirname(ChessFairy.__file__),
+    os.path.basename(ChessFairy.FAIRY_STOCKFISH_PATH),
+)
+
+
+def network_bytes(planes=ChessNNUE.DUCK_PLANE + 1, stack_hashes=(3,) * 8):
+    """A random network in the plain (uncompressed) file layout"""
+    rng = np.random.default_rng(0)
+    features = 64 * planes * 64
+    size = ChessNNUE.TRANSFORMED_SIZE
+    description = b"test net"
+    parts = [
+        struct.pack("<III", ChessNNUE.NNUE_VERSION, 1, len(description)),
+        description,
+        struct.pack("<I", 2),
+        rng.integers(-50, 50, size).astype("<i2").tobytes(),
+        rng.integers(-20, 20, features * size).astype("<i2").tobytes(),
+        rng.integers(-3000, 3000, features * ChessNNUE.PSQT_BUCKETS)
+        .astype("<i4")
+        .tobytes(),
+    ]
+    for stack_hash in stack_hashes:
+        parts.append(struct.pack("<I", stack_hash))
+        for inputs, outputs in DENSE_LAYERS:
+            padded = ChessNNUE._paddedSize(inputs)
+            parts.append(rng.integers(-500, 500, outputs).astype("<i4").tobytes())
+            parts.append(rng.integers(-60, 60, outputs * padded).astype("i1").tobytes())
+    return b"".join(parts)
+
+
+@pytest.fixture(scope="module")
+def net_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp("nnue") / "test.nnue"
+    path.write_bytes(network_bytes())
+    return path
+
+
+@pytest.fixture(scope="module")
+def network(net_file):
+    return ChessNNUE.Network(str(net_file))
+
+
+def test_load(network):
+    assert network.description == "test net"
+    assert network.planes == ChessNNUE.DUCK_PLANE + 1 and network.has_duck
+    assert network.weights.shape == (64 * network.planes * 64, 512)
+    assert len(network.layers) == ChessNNUE.LAYER_STACKS
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda data: data[:-1],  # cut short
+        lambda data: data + b"\0" * 4,  # trailing bytes
+        lambda data: struct.pack("<I", 1) + data[4:],  # another version
+    ],
+)
+def test_refuses_a_damaged_file(net_file, tmp_path, change):
+    path = tmp_path / "damaged.nnue"
+    path.write_bytes(change(net_file.read_bytes()))
+    with pytest.raises(ValueError):
+        ChessNNUE.Network(str(path))
+
+
+def test_refuses_other_layouts(tmp_path):
+    path = tmp_path / "other.nnue"
+    # A feature set without the king plane laid out here
+    path.write_bytes(network_bytes(planes=ChessNNUE.KING_PLANE))
+    with pytest.raises(ValueError, match="planes"):
+        ChessNNUE.Network(str(path))
+    path.write_bytes(network_bytes(stack_hashes=(3,) * 7 + (4,)))
+    with pytest.raises(ValueError, match="architectures"):
+        ChessNNUE.Network(str(path))
+
+
+def test_accumulator_matches_a_fresh_one(network):
+    # The sums kept through makeMove and undoMove are the ones a fresh
+    # accumulator builds from the board, and evaluateBatch agrees with both
+    random.seed(1)
+    game_state = ChessEngine.GameState()
+    accumulator = ChessNNUE.attach(game_state, network)
+    codes, sides, scores = [], [], []
+    try:
+        for _ in range(80):
+            moves = game_state.getValidMoves()
+            if game_state.game_over or not moves:
+                break
+            game_state.makeMove(random.choice(moves))
+            if random.random() < 0.2:
+                game_state.undoMove()
+            score = accumulator.evaluate()
+            fresh = ChessNNUE.Accumulator(network, game_state)
+            assert np.array_equal(accumulator.sums, fresh.sums)
+            assert accumulator.pieces == fresh.pieces
+            assert score == fresh.evaluate()
+            codes.append(ChessEval.boardCodes(game_state.board))
+            sides.append(game_state.white_to_move)
+            scores.append(score)
+    finally:
+        ChessNNUE.detach(game_state)
+    assert np.allclose(network.evaluateBatch(codes, sides), scores)
+
+
+def engine_eval(session, game_state):
+    """fairy-stockfish's NNUE evaluation of a position, white's view"""
+    session._send(f"position fen {ChessAI.convert_to_fen(game_state, duck=True)}")
+    session._send("eval")
+    for line in session._readUntil("Final"):
+        if line.startswith("NNUE evaluation"):
+            return float(line.split()[2])
+    return None
+
+
+@pytest.mark.skipif(
+    not os.path.exists(ChessNNUE.NNUE_PATH)
+    or not ENGINE_PATH
+    or not os.access(ENGINE_PATH, os.X_OK),
+    reason="needs the duck network and a fairy-stockfish binary",
+)
+def test_matches_the_engine():
+    # The network read here scores positions as the engine does with the
+    # same file: checks the feature layout, not only self-consistency
+    network = ChessNNUE.loadNetwork()
+    session = ChessFairy.DuckSession({"EvalFile": ChessNNUE.NNUE_PATH}, ENGINE_PATH)
+    if not session.available():
+        pytest.skip("the engine has no duck variant")
+    random.seed(2)
+    game_state = ChessEngine.GameState()
+    try:
+        for _ in range(40):
+            if not game_state.duck_move_phase:
+                expected = engine_eval(session, game_state)
+                assert expected is not None, "the engine didn't use the network"
+                score = ChessNNUE.Accumulator(network, game_state).evaluate()
+                assert score == pytest.approx(expected, abs=0.011)
+            moves = game_state.getValidMoves()
+            if game_state.game_over or not moves:
+                break
+            game_state.makeMove(random.choice(moves))
+    finally:
+        session.close()
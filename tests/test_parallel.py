@@ -0,0 +1,99 @@
+import multiprocessing
+import queue
+import random
+
+import pytest
+
+import chessAi_handcraft
+import ChessEngine
+import ChessParallel
+import ChessTT
+from chessAi_handcraft import CHECKMATE
+from positions import position
+
+
+@pytest.fixture
+def lazy_smp_worker():
+    """Run _lazySmpWorker in this process, with its own shared table"""
+    table = ChessTT.TranspositionTable(1, shared=True)
+    results = queue.Queue()
+    saved_table = chessAi_handcraft.transposition_table
+    ChessParallel._initLazySmpWorker(results, multiprocessing.Value("i", 1))
+
+    def run(worker_id, game_state, max_depth):
+        piece_moves = [m for m in game_state.getValidMoves() if not m.is_duck_move]
+        ChessParallel._lazySmpWorker(
+            1, worker_id, table.name, game_state, piece_moves, max_depth
+        )
+        reports = []
+        while not results.empty():
+            reports.append(results.get())
+        return reports
+
+    yield run
+    chessAi_handcraft.transposition_table = saved_table
+    ChessParallel._tables.pop(table.name).close()
+    table.close()
+
+
+@pytest.mark.parametrize("max_depth", [1, 2])
+def test_every_lazy_smp_worker_reports_a_depth(lazy_smp_worker, max_depth):
+    # Odd workers start a ply deeper, but never past max_depth
+    game_state = ChessEngine.GameState()
+    for worker_id in range(4):
+        reports = lazy_smp_worker(worker_id, game_state, max_depth)
+        assert reports, f"worker {worker_id} searched nothing"
+        assert reports[-1][1] == max_depth
+        assert all(report[3] == worker_id for report in reports)
+
+
+def serial_best(game_state, depth):
+    chessAi_handcraft.next_move = None
+    color = 1 if game_state.white_to_move else -1
+    piece_moves = [m for m in game_state.getValidMoves() if not m.is_duck_move]
+    chessAi_handcraft.negamax_full(
+        game_state, piece_moves, depth, -CHECKMATE, CHECKMATE, color
+    )
+    return chessAi_handcraft.next_move
+
+
+def midgame(seed, plies=12):
+    random.seed(seed)
+    game_state = ChessEngine.GameState()
+    for _ in range(plies):
+        game_state.makeMove(random.choice(game_state.getValidMoves()))
+    return game_state
+
+
+ROOT_SEARCH_POSITIONS = [
+    # a rook endgame, and Nf6 forking a queen and a rook
+    (position({"g1": "wK", "a1": "wR", "b4": "wp", "g8": "bK", "f7": "bp"}, "d5"), 1),
+    (position({"g1": "wK", "e4": "wN", "h7": "bQ", "d7": "bR", "a8": "bK"}, "a4"), 2),
+    (midgame(5), 1),
+    (midgame(9), 1),
+]
+
+
+@pytest.fixture(scope="module", params=["moves", "turns"])
+def root_pool(request):
+    pool = ChessParallel.RootSearchPool(workers=2, split=request.param)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def no_shared_table():
+    # The workers search without a table; so does the serial search here
+    table = chessAi_handcraft.transposition_table
+    chessAi_handcraft.transposition_table = None
+    yield
+    chessAi_handcraft.transposition_table = table
+
+
+@pytest.mark.parametrize("game_state, depth", ROOT_SEARCH_POSITIONS)
+def test_root_search_matches_serial_search(
+    root_pool, no_shared_table, game_state, depth
+):
+    expected = serial_best(game_state, depth)
+    move = root_pool.search(game_state, game_state.getValidMoves(), depth)
+    assert move.moveID == expected.moveID
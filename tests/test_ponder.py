@@ -0,0 +1,100 @@
+import queue
+import time
+
+import pytest
+
+import chessAi_handcraft
+import ChessControl
+import ChessPonder
+from positions import position
+
+
+def endgame():
+    """The human (White) to move in a small endgame"""
+    return position(
+        {"g1": "wK", "a1": "wR", "b4": "wp", "g8": "bK", "f7": "bp", "c6": "bN"}, "d5"
+    )
+
+
+def play(game_state, turn):
+    move, duck_move = turn
+    game_state.makeMove(move)
+    game_state.makeMove(duck_move)
+    return game_state
+
+
+def search_until_stopped(game_state, valid_moves, return_queue, mode, control=None):
+    while not control.poll():
+        time.sleep(0.01)
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "the ponder took too long"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def ponderer():
+    ponderer = ChessPonder.Ponderer(tt_size_mb=1)
+    table = chessAi_handcraft.transposition_table
+    yield ponderer
+    ponderer.close()
+    chessAi_handcraft.transposition_table = table
+
+
+def test_stopped_control_reports_no_answer(monkeypatch):
+    results = queue.Queue()
+    control = ChessControl.SearchControl()
+    control.stop()
+    ChessPonder._ponderWorker(endgame(), "handcraft", None, results, control)
+    assert results.empty()
+
+    # Stopped during the first search: it started, but its move is unfinished
+    def stop_the_search(game_state, valid_moves, return_queue, mode, control=None):
+        control.stop()
+        return_queue.put(valid_moves[0])
+
+    monkeypatch.setattr(ChessPonder, "search", stop_the_search)
+    game_state = endgame()
+    first = ChessPonder.predictReplies(game_state)[0]
+    ChessPonder._ponderWorker(
+        game_state, "handcraft", None, results, ChessControl.SearchControl()
+    )
+    key = play(endgame(), first).positionKey()
+    assert results.get_nowait() == (key, ChessPonder.PENDING)
+    assert results.empty()
+
+
+def test_answer_to_a_predicted_turn(ponderer):
+    game_state = endgame()
+    replies = ChessPonder.predictReplies(game_state)
+    ponderer.start(game_state)
+    ponderer.process.join(60)  # every predicted turn searched
+    assert not ponderer.process.is_alive()
+    play(game_state, replies[1])
+    answer = ponderer.answer(game_state)
+    assert answer.moveID in [m.moveID for m in game_state.getValidMoves()]
+    assert ponderer.process is None
+
+
+def test_answer_while_the_search_runs(ponderer, monkeypatch):
+    monkeypatch.setattr(ChessPonder, "search", search_until_stopped)
+    game_state = endgame()
+    first = ChessPonder.predictReplies(game_state)[0]
+    ponderer.start(game_state)
+    wait_for(lambda: ponderer._collect() or ponderer.searching is not None)
+    play(game_state, first)
+    assert ponderer.answer(game_state) == ChessPonder.PENDING
+    assert ponderer.process.is_alive()
+
+    # Another turn than the one being searched: the ponder is dropped
+    game_state.undoMove()
+    game_state.undoMove()
+    replies = ChessPonder.predictReplies(game_state, limit=None)
+    unpredicted = replies[ChessPonder.PONDER_REPLIES]
+    play(game_state, unpredicted)
+    process = ponderer.process
+    assert ponderer.answer(game_state) is None
+    assert ponderer.process is None and not process.is_alive()
@@ -0,0 +1,124 @@
+import ChessControl
+import ChessEngine
+import ChessProof
+from positions import position, square
+
+# Queen and king against a lone king: Qb1 and a good duck square capture
+# the king on the second turn, there is no capture on the first
+QUEEN_MATE = ({"f1": "wK", "b6": "wQ", "d1": "bK"}, "g6")
+
+
+def solve(game_state, turns, node_limit=100000):
+    return ChessProof.ProofSolver(node_limit=node_limit).solve(game_state, turns)
+
+
+def attacked(game_state):
+    """Whether the side to move attacks the enemy king"""
+    if game_state.white_to_move:
+        return game_state.squareUnderAttack(*game_state.black_king_location, "w")
+    return game_state.squareUnderAttack(*game_state.white_king_location, "b")
+
+
+def wins_next_turn(game_state):
+    """Whether some duck move leaves every defender turn with the king attacked"""
+    for duck_move in game_state.getValidMoves():
+        game_state.makeMove(duck_move)
+        holds = defender_loses(game_state)
+        game_state.undoMove()
+        if holds:
+            return True
+    return False
+
+
+def defender_loses(game_state):
+    piece_moves = game_state.getValidMoves()
+    if not piece_moves:
+        return False
+    for piece_move in piece_moves:
+        game_state.makeMove(piece_move)
+        if game_state.game_over:
+            holds = game_state.winner == ("b" if game_state.white_to_move else "w")
+        else:
+            holds = all(
+                after_duck(game_state, duck_move)
+                for duck_move in game_state.getValidMoves()
+            )
+        game_state.undoMove()
+        if not holds:
+            return False
+    return True
+
+
+def after_duck(game_state, duck_move):
+    game_state.makeMove(duck_move)
+    holds = attacked(game_state)
+    game_state.undoMove()
+    return holds
+
+
+def test_king_already_attacked():
+    game_state = position({"e1": "wK", "d1": "wQ", "d8": "bK"}, "a4")
+    result = solve(game_state, 1)
+    assert result.proven and result.turns == 1
+    assert (result.move.end_row, result.move.end_col) == square("d8")
+
+
+def test_start_position_is_disproven():
+    result = solve(ChessEngine.GameState(), 1)
+    assert result.status == ChessProof.DISPROVEN
+
+
+def test_two_turn_proof_is_sound():
+    game_state = position(*QUEEN_MATE)
+    key = game_state.positionKey()
+    assert solve(game_state, 1).status == ChessProof.DISPROVEN
+    result = solve(game_state, 2)
+    assert result.proven and result.turns == 2
+    assert game_state.positionKey() == key
+
+    assert not result.move.is_duck_move
+    game_state.makeMove(result.move)
+    assert wins_next_turn(game_state)
+
+
+def test_out_of_nodes_is_unknown():
+    result = solve(position(*QUEEN_MATE), 2, node_limit=5)
+    assert result.status == ChessProof.UNKNOWN
+    assert result.nodes <= 6
+
+
+def test_worth_proving():
+    start = ChessEngine.GameState()
+    assert not ChessProof.worthProving(start, start.getValidMoves())
+
+    endgame = position(*QUEEN_MATE)
+    assert ChessProof.worthProving(endgame, endgame.getValidMoves())
+
+    # Full material, but the queen can attack the king; the duck in the way
+    # doesn't count, since it moves before the king is taken
+    pieces = {"e1": "wK", "d1": "wQ", "e8": "bK", "d8": "bQ"}
+    for col in "abcfgh":
+        pieces.update({col + "1": "wR", col + "8": "bR"})
+    threat = position(pieces, "d4")
+    assert ChessProof.worthProving(threat, threat.getValidMoves())
+
+
+def test_nodes_count_against_the_search_budget():
+    game_state = position(*QUEEN_MATE)
+    control = ChessControl.begin(ChessControl.SearchControl(node_limit=50))
+    try:
+        result = ChessProof.ProofSolver(node_limit=100000).solve(game_state, 2)
+        assert control.nodes == result.nodes
+        assert control.stopped and result.status == ChessProof.UNKNOWN
+
+        # A spent budget leaves no room for a proof
+        assert ChessProof.proofMove(game_state, game_state.getValidMoves()) is None
+    finally:
+        ChessControl.end(control)
+
+
+def test_proof_move():
+    game_state = position(*QUEEN_MATE)
+    proof_move = ChessProof.proofMove(game_state, game_state.getValidMoves())
+    assert proof_move is not None
+    assert (proof_move.end_row, proof_move.end_col) == square("b1")
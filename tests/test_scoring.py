@@ -0,0 +1,125 @@
+import concurrent.futures
+import random
+import zlib
+
+import chess
+import chess.engine
+import pytest
+
+import ChessAI
+import ChessBroker
+import ChessEngine
+import ChessEngineCache
+import ChessEval
+import ChessScoring
+
+
+def fake_score(fen):
+    """The centipawn score the fake engine gives a FEN, White's view"""
+    return zlib.crc32(fen.encode()) % 2000 - 1000
+
+
+class FakeSubmit:
+    """ChessBroker.submitMany stand-in that remembers every FEN sent"""
+
+    def __init__(self):
+        self.sent = []
+        self.error = None
+
+    def __call__(self, fens, limit, options=None):
+        self.sent.extend(fens)
+        future = concurrent.futures.Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+            return future
+        future.set_result(
+            [
+                {
+                    "score": chess.engine.PovScore(
+                        chess.engine.Cp(fake_score(fen)), chess.WHITE
+                    )
+                }
+                for fen in fens
+            ]
+        )
+        return future
+
+
+@pytest.fixture
+def submit(tmp_path, monkeypatch):
+    submit = FakeSubmit()
+    monkeypatch.setattr(ChessBroker, "submitMany", submit)
+    monkeypatch.setattr(ChessScoring, "step_eval_cache", ChessEval.EvalCache())
+    monkeypatch.setattr(
+        ChessEngineCache, "ENGINE_CACHE_PATH", str(tmp_path / "cache.sqlite")
+    )
+    monkeypatch.setattr(ChessEngineCache, "_cache", None)
+    yield submit
+    ChessEngineCache.getCache().close()
+
+
+def random_game(seed, plies=12):
+    """The recorded moves of a random game"""
+    random.seed(seed)
+    game_state = ChessEngine.GameState()
+    moves = []
+    for _ in range(plies):
+        move = random.choice(game_state.getValidMoves())
+        game_state.makeMove(move)
+        moves.append(ChessScoring.recordMove(move))
+    return moves
+
+
+def expected_scores(moves):
+    return [
+        fake_score(ChessAI.convert_to_fen(game_state))
+        for game_state in ChessScoring.replay(moves)
+    ]
+
+
+def test_scores_line_up_with_plies(submit):
+    games = [random_game(1), random_game(2, plies=7)]
+    scores = ChessScoring.scoreGames(games)
+    assert scores == [expected_scores(moves) for moves in games]
+
+
+def test_skipped_plies_are_none(submit):
+    moves = random_game(3)
+    scores = ChessScoring.scoreGames([moves], every=3)[0]
+    expected = expected_scores(moves)
+    assert len(scores) == len(moves)
+    for ply, score in enumerate(scores):
+        assert score == (expected[ply] if ply % 3 == 2 else None)
+    assert len(submit.sent) == len(moves) // 3
+
+
+def test_repeated_positions_are_sent_once(submit):
+    moves = random_game(4)
+    scores = ChessScoring.scoreGames([moves, moves])
+    assert scores[0] == scores[1] == expected_scores(moves)
+    assert len(submit.sent) == len(set(submit.sent)) == len(moves)
+
+
+def test_illegal_recorded_move(submit):
+    moves = random_game(5, plies=4) + [(0, 0, 7, 7)]
+    with pytest.raises(ValueError, match="not legal"):
+        ChessScoring.scoreGames([moves])
+    assert submit.sent == []
+
+
+def test_cached_positions_are_not_sent_again(submit, monkeypatch):
+    moves = random_game(6)
+    first = ChessScoring.scoreGames([moves])
+    sent = len(submit.sent)
+    # From the step score cache, then from the disk cache alone
+    assert ChessScoring.scoreGames([moves]) == first
+    monkeypatch.setattr(ChessScoring, "step_eval_cache", ChessEval.EvalCache())
+    assert ChessScoring.scoreGames([moves]) == first
+    assert len(submit.sent) == sent
+
+
+def test_failed_batch_leaves_plies_unscored(submit, capsys):
+    submit.error = chess.engine.EngineError("engine died")
+    moves = random_game(7, plies=5)
+    assert ChessScoring.scoreGames([moves]) == [[None] * len(moves)]
+    assert "engine died" in capsys.readouterr().out
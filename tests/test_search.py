@@ -0,0 +1,97 @@
+import queue
+
+import pytest
+
+import chessAi_handcraft
+from chessAi_handcraft import CHECKMATE
+from positions import move, position
+
+# Positions with one good capture, and the move the search has to find
+TACTICS = [
+    # a queen left en prise to a rook
+    (
+        position({"g1": "wK", "d1": "wR", "d6": "bQ", "g8": "bK", "a7": "bp"}, "a4"),
+        ("d1", "d6"),
+    ),
+    # a pawn takes a knight
+    (
+        position(
+            {"g1": "wK", "e4": "wp", "d5": "bN", "f5": "bp", "g8": "bK", "b7": "bR"},
+            "a4",
+        ),
+        ("e4", "d5"),
+    ),
+]
+
+
+@pytest.fixture(autouse=True)
+def no_shared_table():
+    table = chessAi_handcraft.transposition_table
+    chessAi_handcraft.transposition_table = None
+    yield
+    chessAi_handcraft.transposition_table = table
+
+
+def search(game_state, depth):
+    """(root move, score) of negamax_full for the side to move"""
+    chessAi_handcraft.next_move = None
+    color = 1 if game_state.white_to_move else -1
+    piece_moves = [m for m in game_state.getValidMoves() if not m.is_duck_move]
+    score = chessAi_handcraft.negamax_full(
+        game_state, piece_moves, depth, -CHECKMATE, CHECKMATE, color
+    )
+    return chessAi_handcraft.next_move, score
+
+
+@pytest.mark.parametrize("game_state, expected", TACTICS)
+@pytest.mark.parametrize("depth", [1, 2])
+def test_pruning_keeps_the_best_move(monkeypatch, game_state, expected, depth):
+    pruned, _ = search(game_state, depth)
+    monkeypatch.setattr(chessAi_handcraft, "FUTILITY_MARGIN", None)
+    monkeypatch.setattr(chessAi_handcraft, "EXTENDED_FUTILITY_MARGIN", None)
+    monkeypatch.setattr(chessAi_handcraft, "RAZOR_MARGIN", None)
+    full, _ = search(game_state, depth)
+    assert pruned.moveID == full.moveID
+    assert pruned.moveID == move(game_state, *expected).moveID
+
+
+@pytest.mark.parametrize("white_to_move", [True, False])
+def test_king_capture_is_checkmate_for_either_colour(white_to_move):
+    game_state = position(
+        {"e1": "wK", "e8": "bK", "a8": "wR", "h1": "bR"}, "d4", white_to_move
+    )
+    capture = (
+        move(game_state, "a8", "e8") if white_to_move else move(game_state, "h1", "e1")
+    )
+    best, score = search(game_state, 1)
+    assert score == CHECKMATE
+    assert best.moveID == capture.moveID
+
+    return_queue = queue.Queue()
+    chessAi_handcraft.findBestMove(game_state, game_state.getValidMoves(), return_queue)
+    assert return_queue.get_nowait().moveID == capture.moveID
+
+
+def test_order_moves():
+    # Winning captures first (best exchange first), then quiet moves, then
+    # captures that lose material
+    game_state = position(
+        {
+            "g1": "wK",
+            "d1": "wQ",
+            "e4": "wp",
+            "d5": "bN",
+            "d8": "bR",
+            "f5": "bp",
+            "g8": "bK",
+        },
+        "a4",
+    )
+    ordered = chessAi_handcraft.orderMoves(
+        game_state, [m for m in game_state.getValidMoves() if not m.is_duck_move]
+    )
+    ids = [m.moveID for m in ordered]
+    assert ids[0] == move(game_state, "e4", "d5").moveID
+    assert ids[1] == move(game_state, "e4", "f5").moveID
+    assert ids[-1] == move(game_state, "d1", "d5").moveID
+    assert not any(m.is_capture for m in ordered[2:-1])
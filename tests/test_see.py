@@ -0,0 +1,58 @@
+import pytest
+
+from positions import move, position
+
+KINGS = {"h1": "wK", "h6": "bK"}  # out of reach of every exchange below
+
+
+def see(pieces, start, end, duck="a4"):
+    game_state = position({**KINGS, **pieces}, duck)
+    return game_state.see(move(game_state, start, end))
+
+
+@pytest.mark.parametrize(
+    "pieces, start, end, expected",
+    [
+        # an undefended knight
+        ({"d4": "wp", "e5": "bN"}, "d4", "e5", 3),
+        # rook takes a pawn defended by a pawn
+        ({"d1": "wR", "d5": "bp", "e6": "bp"}, "d1", "d5", -4),
+        # rook for rook
+        ({"d2": "wR", "d5": "bR", "d8": "bR"}, "d2", "d5", 0),
+        # the queen behind the rook wins the exchange through it (x-ray)
+        ({"d1": "wQ", "d2": "wR", "d5": "bR", "d8": "bR"}, "d2", "d5", 5),
+        # the defender recaptures with its cheapest piece first
+        ({"d1": "wR", "d5": "bp", "c6": "bp", "d8": "bQ"}, "d1", "d5", -4),
+        # a queen moved onto a square a pawn attacks
+        ({"d1": "wQ", "e6": "bp"}, "d1", "d5", -9),
+        # promotion on a free square, then on one a rook guards
+        ({"b7": "wp"}, "b7", "b8", 8),
+        ({"b7": "wp", "c8": "bR"}, "b7", "b8", -1),
+    ],
+)
+def test_standard_exchanges(pieces, start, end, expected):
+    assert see(pieces, start, end) == expected
+
+
+def test_duck_blocks_a_recapture():
+    pieces = {"d1": "wR", "d5": "bp", "d8": "bR"}
+    assert see(pieces, "d1", "d5") == -4
+    assert see(pieces, "d1", "d5", duck="d7") == 1
+
+
+def test_duck_blocks_an_x_ray():
+    pieces = {"d1": "wQ", "d3": "wR", "d5": "bR", "d8": "bR"}
+    assert see(pieces, "d3", "d5") == 5
+    assert see(pieces, "d3", "d5", duck="d2") == 0
+
+
+def test_king_capture_is_worth_the_king():
+    game_state = position({"h1": "wK", "d1": "wR", "d5": "bK", "c6": "bp"}, "a4")
+    assert game_state.see(move(game_state, "d1", "d5")) == 100
+
+
+def test_duck_and_quiet_moves():
+    game_state = position({**KINGS, "d1": "wR"}, "a4")
+    assert game_state.see(move(game_state, "d1", "d4")) == 0
+    game_state.makeMove(move(game_state, "d1", "d4"))
+    assert game_state.see(move(game_state, "a4", "b4")) == 0
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+import ChessSelfPlay
+
+
+class CountingEvaluator:
+    """The material evaluator, remembering the size of every batch"""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, codes, white_to_move):
+        self.batches.append(len(codes))
+        return ChessSelfPlay.materialEvaluator(codes, white_to_move)
+
+
+def check_finished(game):
+    label, step_scores = game.result()
+    state = game.state
+    assert (
+        state.game_over
+        or game.turns > ChessSelfPlay.MAX_TURNS
+        or not state.getValidMoves()
+    )
+    # One step score for every ply played, the last a mate when a king fell
+    assert len(step_scores) == len(state.move_log)
+    assert all(np.isfinite(score) for score in step_scores)
+    if label == "White":
+        assert step_scores[-1] == ChessSelfPlay.MATE_SCORE
+    elif label == "Black":
+        assert step_scores[-1] == -ChessSelfPlay.MATE_SCORE
+
+
+def test_lock_step_games_finish(monkeypatch):
+    monkeypatch.setattr(ChessSelfPlay, "MAX_TURNS", 30)
+    evaluator = CountingEvaluator()
+    random.seed(0)
+    games = ChessSelfPlay.runGames(2, playouts=16, evaluator=evaluator, sample_plies=6)
+    assert len(games) == 2
+    for game in games:
+        check_finished(game)
+    # Both games' leaves go to the evaluator together
+    assert max(evaluator.batches) == 2 * ChessSelfPlay.LEAVES_PER_GAME
+
+
+def test_games_against_a_random_player():
+    random.seed(0)
+    games = ChessSelfPlay.runGames(2, "ai_mcts", "ai_random", playouts=16)
+    for game in games:
+        check_finished(game)
+    [(label, step_scores)] = ChessSelfPlay.playGames(1, "ai_random", "ai_random")
+    assert label in ("White", "Black", "Draw", "over200") and step_scores
+
+
+def test_refuses_other_players():
+    with pytest.raises(ValueError):
+        ChessSelfPlay.runGames(1, "ai_mcts", "human")
+    with pytest.raises(ValueError):
+        ChessSelfPlay.runGames(1, evaluator="unknown")
@@ -0,0 +1,119 @@
+import random
+
+import numpy as np
+import pytest
+
+import ChessProof
+import ChessTablebase
+from positions import position
+
+SQUARES = [col + row for col in "abcdefgh" for row in "12345678"]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def tables(tmp_path_factory):
+    """KvK and KQvK solved into a temporary directory (about a minute)"""
+    saved = ChessTablebase.TABLEBASE_DIR, dict(ChessTablebase._tables)
+    ChessTablebase.TABLEBASE_DIR = str(tmp_path_factory.mktemp("tablebases"))
+    ChessTablebase._tables.clear()
+    ChessTablebase.buildTables(("KvK", "KQvK"))
+    yield
+    for table in ChessTablebase._tables.values():
+        if table is not None:
+            table.close()
+    ChessTablebase.TABLEBASE_DIR, tables = saved
+    ChessTablebase._tables.clear()
+    ChessTablebase._tables.update(tables)
+
+
+def random_positions(pieces, count, seed):
+    """count positions with pieces (a list) and the duck on random squares"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        squares = rng.sample(SQUARES, len(pieces) + 1)
+        yield position(dict(zip(squares, pieces)), squares[-1], rng.random() < 0.5)
+
+
+def adjacent(a, b):
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1
+
+
+def test_bare_kings():
+    # The side to move takes an adjacent king, and only an adjacent one
+    for game_state in random_positions(["wK", "bK"], 200, seed=1):
+        value = ChessTablebase.probe(game_state)
+        kings = game_state.white_king_location, game_state.black_king_location
+        assert (value == ChessTablebase.WIN) == adjacent(*kings)
+
+    # A king in the corner is short of squares: Kb6 and the duck on b8 leave
+    # it only squares next to the other king. In the middle it's a draw
+    corner = {"a6": "wK", "a8": "bK"}
+    assert ChessTablebase.probe(position(corner, "h1")) == ChessTablebase.WIN - 2
+    assert ChessTablebase.probe(position(corner, "h1", False)) == 0
+    assert ChessTablebase.probe(position({"d4": "wK", "d6": "bK"}, "h1")) == 0
+
+
+def test_agrees_with_proof_search():
+    # A win within two turns of the side to move is exactly what df-pn
+    # proves with turns=2, and the number of turns is the same
+    outcomes = set()
+    for game_state in random_positions(["wK", "wQ", "bK"], 25, seed=7):
+        value = ChessTablebase.probe(game_state)
+        result = ChessProof.ProofSolver(node_limit=100000).solve(game_state, 2)
+        assert result.status != ChessProof.UNKNOWN
+        assert result.proven == (value >= ChessTablebase.WIN - 2)
+        if result.proven:
+            assert result.turns == (1 if value == ChessTablebase.WIN else 2)
+        outcomes.add(result.proven)
+    assert outcomes == {True, False}
+
+
+def test_mirrored_position():
+    pieces = {"f1": "wK", "b6": "wQ", "d1": "bK"}
+    mirrored = {
+        name[0] + str(9 - int(name[1])): ("b" if piece[0] == "w" else "w") + piece[1]
+        for name, piece in pieces.items()
+    }
+    white = position(pieces, "g6", white_to_move=True)
+    black = position(mirrored, "g3", white_to_move=False)
+    assert ChessTablebase.probe(white) == ChessTablebase.probe(black)
+    assert ChessTablebase.probe(white) == ChessTablebase.WIN - 2
+
+
+def test_win_is_played_out():
+    # Both sides play tablebase moves: the strong side the fastest win, the
+    # weak side the slowest loss, so the king falls when the table says
+    rng = random.Random(3)
+    played = 0
+    for game_state in random_positions(["wK", "wQ", "bK"], 40, seed=5):
+        value = ChessTablebase.probe(game_state)
+        if value <= 0 or value == ChessTablebase.WIN:
+            continue
+        random.seed(rng.random())
+        winner = "w" if game_state.white_to_move else "b"
+        turns = 0
+        while not game_state.game_over:
+            move = ChessTablebase.tablebaseMove(game_state, game_state.getValidMoves())
+            turns += not move.is_duck_move
+            game_state.makeMove(move)
+        assert game_state.winner == winner
+        assert turns == ChessTablebase.WIN - value + 1
+        played += 1
+    assert played
+
+
+def test_uncovered_positions():
+    four_men = position({"e1": "wK", "d1": "wQ", "a1": "wR", "e8": "bK"}, "a4")
+    assert ChessTablebase.probe(four_men) is None
+    assert ChessTablebase.tablebaseMove(four_men, four_men.getValidMoves()) is None
+    rook = position({"e1": "wK", "a1": "wR", "e8": "bK"}, "a4")
+    assert ChessTablebase.probe(rook) is None  # KRvK wasn't built
+
+
+def test_foreign_file(tmp_path):
+    path = tmp_path / "KQvK.bin"
+    path.write_bytes(
+        np.zeros(ChessTablebase.HEADER.itemsize + 64, dtype=np.uint8).tobytes()
+    )
+    with pytest.raises(ValueError):
+        ChessTablebase.Tablebase(str(path))
@@ -0,0 +1,141 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import ChessEngine
+import ChessEval
+import ChessTT
+from ChessTT import EXACT, LOWER_BOUND, UPPER_BOUND
+
+
+@pytest.fixture
+def table():
+    table = ChessTT.TranspositionTable(1)
+    yield table
+    table.close()
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        (1.5, 3, EXACT, (12, 28), 35),
+        (-1000000.0, 0, LOWER_BOUND, None, None),
+        (0.25, 255, UPPER_BOUND, (63, 0), 0),
+    ],
+)
+def test_pack_round_trip(entry):
+    assert ChessTT.unpackEntry(ChessTT.packEntry(*entry)) == entry
+
+
+def test_store_and_probe(table):
+    key = ChessEngine.GameState().positionKey()
+    assert table.probe(key) is None
+    table.store(key, 2.5, 4, EXACT, (52, 36), 27)
+    assert table.probe(key) == (2.5, 4, EXACT, (52, 36), 27)
+    assert table.hitRate() == 0.5
+
+
+def test_other_key_in_the_same_slot_misses(table):
+    key = 0x123456789ABCDEF0
+    table.store(key, 1.0, 2, EXACT)
+    assert table.probe(key + len(table)) is None  # same slot, other key
+    assert table.probe(key) is not None
+
+
+def test_torn_slot_is_rejected(table):
+    key = 0x0FEDCBA987654321
+    table.store(key, 1.0, 2, EXACT)
+    slot = table.table[key & table.mask]
+    # Half of another writer's entry: the words no longer XOR to the key
+    slot[1] = ChessTT.packEntry(3.0, 5, LOWER_BOUND)
+    assert table.probe(key) is None
+
+
+def test_deeper_result_is_kept(table):
+    key = 42
+    table.store(key, 1.0, 5, EXACT)
+    table.store(key, 9.0, 2, EXACT)
+    assert table.probe(key)[:2] == (1.0, 5)
+    table.store(key, 7.0, 6, LOWER_BOUND)
+    assert table.probe(key)[:3] == (7.0, 6, LOWER_BOUND)
+
+
+def storeInChild(name, key):
+    table = ChessTT.TranspositionTable.attach(name)
+    table.store(key, 3.0, 7, EXACT)
+    table.close()
+
+
+@pytest.mark.parametrize("method", ["fork", "spawn"])
+def test_shared_table_outlives_attached_workers(method):
+    table = ChessTT.TranspositionTable(1, shared=True)
+    try:
+        context = multiprocessing.get_context(method)
+        for key in (11, 12):
+            worker = context.Process(target=storeInChild, args=(table.name, key))
+            worker.start()
+            worker.join()
+            assert worker.exitcode == 0
+        # Both workers have exited; the block is still there for the owner
+        again = ChessTT.TranspositionTable.attach(table.name)
+        assert again.probe(11)[:2] == (3.0, 7)
+        assert again.probe(12)[:2] == (3.0, 7)
+        again.close()
+    finally:
+        table.close()
+
+
+@pytest.fixture
+def saved(tmp_path):
+    """Path of a saved 1 MB table holding two entries"""
+    table = ChessTT.TranspositionTable(1)
+    table.store(1001, 4.5, 6, EXACT, (52, 36), 27)
+    table.store(2002, -1.0, 3, LOWER_BOUND)
+    path = str(tmp_path / "table.bin")
+    table.save(path)
+    table.close()
+    return path
+
+
+def test_save_and_load(saved):
+    table = ChessTT.TranspositionTable.load(saved)
+    assert len(table) == len(ChessTT.TranspositionTable(1))
+    assert table.probe(1001) == (4.5, 6, EXACT, (52, 36), 27)
+    assert table.probe(2002)[:3] == (-1.0, 3, LOWER_BOUND)
+    # Copy-on-write: storing doesn't change the file
+    table.store(3003, 1.0, 9, EXACT)
+    table.close()
+    assert ChessTT.TranspositionTable.load(saved).probe(3003) is None
+
+
+def test_load_into_shared_memory(saved):
+    table = ChessTT.TranspositionTable.load(saved, shared=True)
+    try:
+        attached = ChessTT.TranspositionTable.attach(table.name)
+        assert attached.probe(1001)[:2] == (4.5, 6)
+        attached.close()
+    finally:
+        table.close()
+
+
+def test_other_eval_version_is_refused(saved, monkeypatch):
+    monkeypatch.setattr(ChessTT, "EVAL_VERSION", ChessEval.EVAL_VERSION + 1)
+    with pytest.raises(ValueError, match="eval version"):
+        ChessTT.TranspositionTable.load(saved)
+    # loadTable falls back to an empty table
+    table = ChessTT.loadTable(saved, size_mb=1)
+    assert table.probe(1001) is None
+
+
+@pytest.mark.parametrize("data", [b"", b"DUCKHASH", b"NOTATABL" + bytes(64)])
+def test_foreign_file_is_refused(tmp_path, data):
+    path = tmp_path / "table.bin"
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        ChessTT.TranspositionTable.load(str(path))
+
+
+def test_missing_file_gives_an_empty_table(tmp_path):
+    table = ChessTT.loadTable(str(tmp_path / "none.bin"), size_mb=1)
+    assert not np.any(table.table)